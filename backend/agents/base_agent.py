@@ -41,6 +41,53 @@ class BaseAgent(ABC):
         """Shutdown the agent"""
         self.status = "inactive"
     
+    async def report_progress(self, task: Dict[str, Any], stage: str, message: str = "",
+                              data: Optional[Dict[str, Any]] = None):
+        """Send a partial result to a streaming caller; a no-op unless the task carries a progress callback"""
+        callback = task.get("progress")
+        if callback is None:
+            return
+        try:
+            await callback({
+                "agent": self.agent_type,
+                "stage": stage,
+                "message": message,
+                "data": data
+            })
+        except Exception as e:
+            print(f"Error reporting progress from {self.agent_type}: {e}")
+    
+    async def generate(self, task: Dict[str, Any], instructions: str,
+                       context: Optional[Dict[str, Any]] = None, **options) -> Optional[str]:
+        """
+        Answer the task's message with the shared LLM gateway, streaming chunks to a
+        streaming caller; None when no model is configured or the call fails
+        """
+        from core.llm_gateway import get_llm_gateway
+        
+        gateway = get_llm_gateway()
+        if not gateway.enabled:
+            return None
+        
+        # Recent turns let the model resolve follow-ups; timestamps would only defeat the cache
+        history = [
+            {"message": turn.get("message"), "response": turn.get("response")}
+            for turn in task.get("context", {}).get("history", [])
+        ]
+        context = {**(context or {}), **({"history": history} if history else {})}
+        try:
+            if task.get("progress") is None:
+                result = await gateway.complete(self.agent_type, task.get("message", ""), context, instructions, **options)
+                return result["text"]
+            parts = []
+            async for chunk in gateway.stream(self.agent_type, task.get("message", ""), context, instructions, **options):
+                parts.append(chunk)
+                await self.report_progress(task, "generating", chunk)
+            return "".join(parts)
+        except Exception as e:
+            print(f"Error generating {self.agent_type} response: {e}")
+            return None
+    
     def _create_task_id(self) -> str:
         """Generate a unique task ID"""
         return f"{self.agent_type}_{uuid.uuid4().hex[:12]}"
@@ -8,6 +8,15 @@ import json
 
 from agents.base_agent import BaseAgent
 from core.supabase_client import get_supabase_client
+from intelligence.risk_scoring import risk_level
+from intelligence.entity_search import extract_entities, email_filter, escape_filter_value, get_entity_search_index
+
+
+# System prompt for general questions answered by the LLM gateway
+INDIVIDUAL_INSTRUCTIONS = (
+    "You are the user and entity behaviour analytics (UEBA) analyst of a cybersecurity platform. Answer "
+    "questions about users, their accounts, access behaviour, anomalies and risk scores concisely."
+)
 
 
 class IndividualAgent(BaseAgent):
@@ -36,19 +45,30 @@ class IndividualAgent(BaseAgent):
     async def _search_individual(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Search for individual by name, email, or ID"""
         message = task.get("message", "")
-        # Extract search terms (simplified - can be enhanced with NLP)
+        entities = extract_entities(message)
         
         try:
-            # Search in database
+            # Search in database using indexed lookups (email and name trigram)
             query = self.supabase.table('individuals').select('*')
             
-            # Simple keyword extraction
-            if "@" in message:
-                email = [word for word in message.split() if "@" in word][0]
-                query = query.eq('email', email)
+            if entities["emails"]:
+                query = query.or_(email_filter(entities["emails"]))
+            elif entities["names"]:
+                query = query.or_(",".join(
+                    f'full_name.ilike.%{escape_filter_value(name)}%' for name in entities["names"]
+                ))
             else:
-                # Search by name
-                query = query.ilike('full_name', f'%{message}%')
+                # Resolve remaining keywords through the local prefix index
+                index = get_entity_search_index()
+                ids = []
+                for keyword in entities["keywords"]:
+                    ids.extend(match["id"] for match in await index.search(keyword, entity_type='individual'))
+                if not ids:
+                    return {
+                        "response": "No individuals found matching your search criteria.",
+                        "data": []
+                    }
+                query = query.in_('id', list(dict.fromkeys(ids)))
             
             result = query.limit(10).execute()
             
@@ -101,21 +121,53 @@ class IndividualAgent(BaseAgent):
     
     async def _get_risk_score(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Get risk score for an individual"""
+        message = task.get("message", "")
+        
         try:
-            # Fetch individual risk score from database
-            # This would typically calculate based on:
-            # - Past incidents
-            # - Behavior anomalies
-            # - Access privileges
-            # - Sanctions list matches
+            # Scores are maintained by the risk scoring job from incidents,
+            # anomaly flags, flagged transactions and sanctions matches
+            query = self.supabase.table('individuals')\
+                .select('id, full_name, email, risk_score, risk_factors, risk_scored_at')
             
-            return {
-                "response": "The current risk score is 25 (Low). The user has normal access patterns and no associated incidents.",
-                "data": {
-                    "risk_score": 25,
-                    "risk_level": "low",
-                    "factors": ["Normal access patterns", "No incidents", "Standard privileges"]
+            emails = email_filter([word.strip('.,;:()<>"\'') for word in message.split() if "@" in word])
+            if emails:
+                query = query.or_(emails)
+            else:
+                query = query.order('risk_score', desc=True)
+            
+            result = query.limit(5).execute()
+            
+            if not result.data:
+                return {
+                    "response": "No scored individuals found matching your request.",
+                    "data": []
+                }
+            
+            scored = [{
+                **row,
+                "risk_score": float(row.get("risk_score") or 0),
+                "risk_level": risk_level(float(row.get("risk_score") or 0))
+            } for row in result.data]
+            
+            if emails and len(scored) == 1:
+                individual = scored[0]
+                factors = individual.get("risk_factors") or {}
+                return {
+                    "response": f"The current risk score for {individual.get('full_name') or individual.get('email')} is {individual['risk_score']:.0f} ({individual['risk_level'].title()}).",
+                    "data": {
+                        **individual,
+                        "factors": [f"{name.replace('_', ' ').capitalize()}: {value}" for name, value in factors.items()]
+                    },
+                    "suggested_actions": ["Analyze behavior", "Review incidents", "Check recent transactions"]
                 }
+            
+            summary = ", ".join(
+                f"{row.get('full_name') or row.get('email')} ({row['risk_score']:.0f})" for row in scored
+            )
+            return {
+                "response": f"Highest risk individuals: {summary}.",
+                "data": scored,
+                "suggested_actions": ["View details", "Analyze behavior", "Review incidents"]
             }
         except Exception as e:
             return {
@@ -125,7 +177,8 @@ class IndividualAgent(BaseAgent):
     
     async def _get_individual_info(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Get general information about an individual"""
+        answer = await self.generate(task, INDIVIDUAL_INSTRUCTIONS)
         return {
-            "response": "I can help you with individual user analysis. You can search for users, analyze their behavior, check risk scores, or investigate anomalies. What would you like to know?",
+            "response": answer or "I can help you with individual user analysis. You can search for users, analyze their behavior, check risk scores, or investigate anomalies. What would you like to know?",
             "suggested_actions": ["Search for a user", "Analyze behavior patterns", "Check risk assessment"]
         }
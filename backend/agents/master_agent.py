@@ -2,36 +2,58 @@
 Master Agent - Routes requests to specialized agents
 Acts as the single point of contact for users via chat interface
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import asyncio
 import json
+import time
 from datetime import datetime
 
 from agents.base_agent import BaseAgent
 from core.supabase_client import get_supabase_client
+from core.circuit_breaker import CircuitBreakers, CircuitOpenError
+from core.session_store import SessionStore, get_session_store
+
+
+# A specialist call running longer than this counts as failed
+AGENT_CALL_TIMEOUT_SECONDS = 60.0
+
+# Below this classifier probability a message with a previous turn is taken as a follow-up
+MIN_ROUTING_CONFIDENCE = 0.5
+# Agents at least this probable are kept as rerouting alternatives
+MIN_ALTERNATIVE_PROBABILITY = 0.1
+
+UNROUTABLE_RESPONSE = "I apologize, but I couldn't determine which specialist to route your request to. Could you please rephrase your question?"
 
 
 class MasterAgent(BaseAgent):
     """Master agent that orchestrates other agents"""
     
-    def __init__(self, agents: Dict[str, Any]):
+    def __init__(self, agents: Dict[str, Any], sessions: Optional[SessionStore] = None):
         super().__init__("master", "Master Orchestrator")
         self.agents = agents
+        self.breakers = CircuitBreakers()
+        self.sessions = sessions or get_session_store()
+        # Loaded in the background at startup; keyword routing until then
+        self.intent_classifier = None
         self.supabase = get_supabase_client()
         self.status = "active"
     
     async def process_message(self, message: str, user_id: str, session_id: str) -> Dict[str, Any]:
         """Process a chat message and route to appropriate agent"""
         try:
-            # Determine which agent should handle this message
-            routing_decision = await self._route_message(message)
-            target_agent_type = routing_decision.get("agent_type")
+            # Determine which agent should handle this message, in light of the conversation so far
+            history = await self.sessions.recent(session_id)
+            routing_decision = await self._route_message(message, history)
             
-            # Get the appropriate agent
-            agent = self.agents.get(target_agent_type)
+            # Get the appropriate agent, skipping any whose circuit is open
+            try:
+                target_agent_type, agent = self._select_agent(routing_decision)
+            except CircuitOpenError as e:
+                return self._unavailable_response(e)
             
             if not agent:
                 return {
-                    "response": "I apologize, but I couldn't determine which specialist to route your request to. Could you please rephrase your question?",
+                    "response": UNROUTABLE_RESPONSE,
                     "agent_used": "master",
                     "confidence": 0.0
                 }
@@ -42,21 +64,22 @@ class MasterAgent(BaseAgent):
                 "message": message,
                 "user_id": user_id,
                 "session_id": session_id,
-                "context": routing_decision.get("context", {})
+                "context": {**routing_decision.get("context", {}), "history": history}
             }
             
             # Process with the specialized agent
-            result = await agent.process(task)
+            result = await self._call_agent(target_agent_type, agent, task)
             
             # Log the conversation
-            await self._log_conversation(user_id, session_id, message, result.get("response", ""), target_agent_type)
+            await self._record_turn(user_id, session_id, message, result.get("response", ""), target_agent_type)
             
             return {
                 "response": result.get("response", "I've processed your request."),
                 "agent_used": target_agent_type,
                 "data": result.get("data"),
                 "confidence": routing_decision.get("confidence", 0.8),
-                "suggested_actions": result.get("suggested_actions", [])
+                "suggested_actions": result.get("suggested_actions", []),
+                **self._reroute_note(routing_decision, target_agent_type)
             }
             
         except Exception as e:
@@ -67,14 +90,174 @@ class MasterAgent(BaseAgent):
                 "confidence": 0.0
             }
     
-    async def _route_message(self, message: str) -> Dict[str, Any]:
+    async def stream_message(self, message: str, user_id: str, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a chat message as a stream of updates: the routing decision first,
+        then partial results the agent reports while it works, then the final response
+        """
+        history = await self.sessions.recent(session_id)
+        routing_decision = await self._route_message(message, history)
+        try:
+            target_agent_type, agent = self._select_agent(routing_decision)
+        except CircuitOpenError as e:
+            yield {"type": "routing", "agent_type": "master", "confidence": 0.0}
+            yield {"type": "final", **self._unavailable_response(e)}
+            return
+        
+        yield {
+            "type": "routing",
+            "agent_type": target_agent_type if agent else "master",
+            "confidence": routing_decision.get("confidence", 0.8) if agent else 0.0,
+            **self._reroute_note(routing_decision, target_agent_type)
+        }
+        
+        if not agent:
+            yield {
+                "type": "final",
+                "response": UNROUTABLE_RESPONSE,
+                "agent_used": "master",
+                "confidence": 0.0
+            }
+            return
+        
+        progress: asyncio.Queue = asyncio.Queue()
+        task = {
+            "task_id": self._create_task_id(),
+            "message": message,
+            "user_id": user_id,
+            "session_id": session_id,
+            "context": {**routing_decision.get("context", {}), "history": history},
+            "progress": progress.put
+        }
+        work = asyncio.create_task(self._call_agent(target_agent_type, agent, task))
+        
+        try:
+            # Relay progress until the agent finishes
+            while True:
+                update = asyncio.ensure_future(progress.get())
+                done, _ = await asyncio.wait({work, update}, return_when=asyncio.FIRST_COMPLETED)
+                if update in done:
+                    yield {"type": "progress", **update.result()}
+                    continue
+                update.cancel()
+                break
+            while not progress.empty():
+                yield {"type": "progress", **progress.get_nowait()}
+            
+            result = work.result()
+            final = {
+                "response": result.get("response", "I've processed your request."),
+                "agent_used": target_agent_type,
+                "data": result.get("data"),
+                "confidence": routing_decision.get("confidence", 0.8),
+                "suggested_actions": result.get("suggested_actions", [])
+            }
+        except Exception as e:
+            final = {
+                "response": f"I encountered an error processing your request: {str(e)}",
+                "agent_used": "master",
+                "error": str(e),
+                "confidence": 0.0
+            }
+        finally:
+            # The client went away mid-stream; stop the agent's work
+            if not work.done():
+                work.cancel()
+        
+        yield {"type": "final", **final}
+        
+        # Logged after the final update has been sent, so it adds nothing to response latency
+        await self._record_turn(user_id, session_id, message, final["response"], final["agent_used"])
+    
+    def _select_agent(self, routing_decision: Dict[str, Any]) -> Tuple[Optional[str], Any]:
+        """
+        The routed agent, or the next best match if its circuit is open.
+        Raises CircuitOpenError when every matching agent's circuit is open.
+        """
+        candidates = [routing_decision.get("agent_type"), *routing_decision.get("alternatives", [])]
+        known = [agent_type for agent_type in candidates if agent_type in self.agents]
+        if not known:
+            return None, None
+        
+        for agent_type in known:
+            breaker = self.breakers.get(agent_type)
+            if not breaker.allow():
+                continue
+            try:
+                return agent_type, self.agents.get(agent_type)
+            except Exception as e:
+                # Could not even be constructed; counts against its circuit
+                print(f"Error loading {agent_type} agent: {e}")
+                breaker.record(False, 0.0)
+        
+        breaker = self.breakers.get(known[0])
+        raise CircuitOpenError(known[0], breaker.retry_in())
+    
+    async def _call_agent(self, agent_type: str, agent: Any, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a specialist under a deadline, feeding the outcome and latency to its circuit"""
+        breaker = self.breakers.get(agent_type)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(agent.process(task), timeout=AGENT_CALL_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            # The caller went away; says nothing about the agent's health
+            breaker.release_trial()
+            raise
+        except asyncio.TimeoutError:
+            breaker.record(False, time.perf_counter() - started)
+            raise RuntimeError(f"{agent_type} agent did not respond within {AGENT_CALL_TIMEOUT_SECONDS:.0f}s")
+        except Exception:
+            breaker.record(False, time.perf_counter() - started)
+            raise
+        
+        # Agents report handled failures as an error field rather than raising
+        breaker.record(not result.get("error"), time.perf_counter() - started)
+        return result
+    
+    def _unavailable_response(self, error: CircuitOpenError) -> Dict[str, Any]:
+        return {
+            "response": f"The {error.name} specialist is temporarily unavailable. Please try again in about {max(1, round(error.retry_in))} seconds.",
+            "agent_used": "master",
+            "error": str(error),
+            "confidence": 0.0
+        }
+    
+    def _reroute_note(self, routing_decision: Dict[str, Any], agent_type: Optional[str]) -> Dict[str, Any]:
+        routed = routing_decision.get("agent_type")
+        if agent_type is None or agent_type == routed:
+            return {}
+        return {"rerouted_from": routed}
+    
+    async def _route_message(self, message: str, history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
-        Route message to appropriate agent based on content
-        In a production system, this would use NLP/ML models
+        Route message to appropriate agent with the intent classifier, or by keywords
+        until it has loaded; a message the router is unsure about is treated as a
+        follow-up to the previous turn's agent
         """
+        # A follow-up ("and what about yesterday?") stays with the agent already handling the conversation
+        previous = next((turn.get("agent_used") for turn in reversed(history or []) if turn.get("agent_used") != "master"), None)
+        follow_up = {
+            "agent_type": previous,
+            "confidence": 0.6,
+            "context": {"follow_up": True}
+        }
+        
+        if self.intent_classifier is not None:
+            prediction = self.intent_classifier.classify(message)
+            if prediction["confidence"] < MIN_ROUTING_CONFIDENCE and previous:
+                return follow_up
+            ranked = sorted(prediction["probabilities"].items(), key=lambda x: x[1], reverse=True)
+            return {
+                "agent_type": prediction["label"],
+                "confidence": prediction["confidence"],
+                "context": {"intent_probabilities": prediction["probabilities"]},
+                # Other plausible agents, best first, for rerouting around an open circuit
+                "alternatives": [label for label, p in ranked[1:] if p >= MIN_ALTERNATIVE_PROBABILITY]
+            }
+        
         message_lower = message.lower()
         
-        # Simple keyword-based routing (can be enhanced with ML)
+        # Simple keyword-based routing
         routing_keywords = {
             "individual": ["user", "person", "employee", "individual", "account", "login", "access", "behavior", "anomaly"],
             "organization": ["company", "organization", "network", "system", "infrastructure", "vulnerability", "scan"],
@@ -98,9 +281,17 @@ class MasterAgent(BaseAgent):
             return {
                 "agent_type": target_agent[0],
                 "confidence": confidence,
-                "context": {"keywords_matched": target_agent[1]}
+                "context": {"keywords_matched": target_agent[1]},
+                # Other matches, best first, for rerouting around an open circuit
+                "alternatives": [
+                    agent_type for agent_type, _ in sorted(scores.items(), key=lambda x: x[1], reverse=True)
+                    if agent_type != target_agent[0]
+                ]
             }
         
+        if previous:
+            return follow_up
+        
         # Default to threat intelligence if unclear
         return {
             "agent_type": "threat_intel",
@@ -108,6 +299,21 @@ class MasterAgent(BaseAgent):
             "context": {}
         }
     
+    async def _record_turn(self, user_id: str, session_id: str, message: str, response: str, agent_used: str):
+        """Add a turn to the session cache, then persist it"""
+        try:
+            await self.sessions.append(session_id, {
+                'user_id': user_id,
+                'session_id': session_id,
+                'message': message,
+                'response': response,
+                'agent_used': agent_used,
+                'metadata': {}
+            })
+        except Exception as e:
+            print(f"Error caching conversation turn: {e}")
+        await self._log_conversation(user_id, session_id, message, response, agent_used)
+    
     async def _log_conversation(self, user_id: str, session_id: str, message: str, response: str, agent_used: str):
         """Log conversation to database"""
         try:
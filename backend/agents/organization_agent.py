@@ -7,6 +7,15 @@ from datetime import datetime
 
 from agents.base_agent import BaseAgent
 from core.supabase_client import get_supabase_client
+from intelligence.risk_scoring import risk_level
+from intelligence.entity_search import extract_entities, escape_filter_value, get_entity_search_index
+
+
+# System prompt for general questions answered by the LLM gateway
+ORGANIZATION_INSTRUCTIONS = (
+    "You are the organization security analyst of a cybersecurity platform. Answer questions about "
+    "organizations, infrastructure, network traffic, vulnerabilities and security posture concisely."
+)
 
 
 class OrganizationAgent(BaseAgent):
@@ -36,14 +45,28 @@ class OrganizationAgent(BaseAgent):
         """Search for organization"""
         try:
             message = task.get("message", "")
+            entities = extract_entities(message)
             
             query = self.supabase.table('organizations').select('*')
             
-            if "." in message:  # Domain search
-                domain = [word for word in message.split() if "." in word][0]
-                query = query.eq('domain', domain)
+            if entities["domains"]:  # Domain search
+                query = query.in_('domain', entities["domains"])
+            elif entities["names"]:
+                query = query.or_(",".join(
+                    f'name.ilike.%{escape_filter_value(name)}%' for name in entities["names"]
+                ))
             else:
-                query = query.ilike('name', f'%{message}%')
+                # Resolve remaining keywords through the local prefix index
+                index = get_entity_search_index()
+                ids = []
+                for keyword in entities["keywords"]:
+                    ids.extend(match["id"] for match in await index.search(keyword, entity_type='organization'))
+                if not ids:
+                    return {
+                        "response": "No organizations found matching your search.",
+                        "data": []
+                    }
+                query = query.in_('id', list(dict.fromkeys(ids)))
             
             result = query.limit(10).execute()
             
@@ -91,19 +114,60 @@ class OrganizationAgent(BaseAgent):
     
     async def _get_security_posture(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Get overall security posture"""
-        return {
-            "response": "Security Posture: Good (Score: 78/100). Key strengths: Active monitoring, up-to-date threat intelligence. Areas for improvement: Patch management, access controls.",
-            "data": {
-                "overall_score": 78,
-                "risk_level": "medium",
-                "strengths": ["Active monitoring", "Threat intelligence"],
-                "improvements": ["Patch management", "Access controls"]
+        message = task.get("message", "")
+        
+        try:
+            query = self.supabase.table('organizations')\
+                .select('id, name, domain, risk_score, risk_factors, risk_scored_at')
+            
+            domains = [word.strip('.,;:()<>"\'').lower() for word in message.split() if "." in word.strip('.')]
+            if domains:
+                query = query.in_('domain', domains)
+            else:
+                query = query.order('risk_score', desc=True)
+            
+            result = query.limit(10).execute()
+            
+            if not result.data:
+                return {
+                    "response": "No scored organizations found matching your request.",
+                    "data": []
+                }
+            
+            risk_scores = [float(row.get("risk_score") or 0) for row in result.data]
+            average_risk = sum(risk_scores) / len(risk_scores)
+            overall_score = round(100 - average_risk)
+            
+            # Summarize which risk factors are contributing across the matched organizations
+            factor_totals: Dict[str, float] = {}
+            for row in result.data:
+                for name, value in (row.get("risk_factors") or {}).items():
+                    factor_totals[name] = factor_totals.get(name, 0) + float(value or 0)
+            improvements = [name.replace('_', ' ').capitalize() for name, total in factor_totals.items() if total > 0]
+            strengths = [name.replace('_', ' ').capitalize() for name, total in factor_totals.items() if total == 0]
+            
+            subject = result.data[0].get("name") if domains and len(result.data) == 1 else f"{len(result.data)} organization(s)"
+            return {
+                "response": f"Security Posture for {subject}: Score {overall_score}/100 ({risk_level(average_risk).title()} risk).",
+                "data": {
+                    "overall_score": overall_score,
+                    "risk_level": risk_level(average_risk),
+                    "strengths": strengths,
+                    "improvements": improvements,
+                    "organizations": result.data
+                },
+                "suggested_actions": ["Review incidents", "Check vulnerabilities", "View high-risk members"]
+            }
+        except Exception as e:
+            return {
+                "response": f"Error retrieving security posture: {str(e)}",
+                "error": str(e)
             }
-        }
     
     async def _get_organization_info(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Get general organization information"""
+        answer = await self.generate(task, ORGANIZATION_INSTRUCTIONS)
         return {
-            "response": "I can help you monitor organizations, analyze network traffic, check vulnerabilities, and assess security posture. What would you like to investigate?",
+            "response": answer or "I can help you monitor organizations, analyze network traffic, check vulnerabilities, and assess security posture. What would you like to investigate?",
             "suggested_actions": ["Check security posture", "View vulnerabilities", "Analyze network traffic"]
         }
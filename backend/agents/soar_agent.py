@@ -2,11 +2,22 @@
 SOAR Agent - Security Orchestration, Automation, and Response
 Handles automation workflows and incident response
 """
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Set
 from datetime import datetime
+import asyncio
 
 from agents.base_agent import BaseAgent
 from core.supabase_client import get_supabase_client
+from intelligence.ioc_engine import extract_candidates
+from soar.playbook_engine import PlaybookEngine, parse_actions
+from soar.triggers import get_playbook_trigger_cache
+
+
+# System prompt for general questions answered by the LLM gateway
+SOAR_INSTRUCTIONS = (
+    "You are the security orchestration, automation and response (SOAR) specialist of a cybersecurity "
+    "platform. Answer questions about playbooks, automated workflows and response actions concisely."
+)
 
 
 class SOARAgent(BaseAgent):
@@ -15,6 +26,10 @@ class SOARAgent(BaseAgent):
     def __init__(self):
         super().__init__("soar", "SOAR Agent")
         self.supabase = get_supabase_client()
+        self.engine = PlaybookEngine()
+        self.triggers = get_playbook_trigger_cache()
+        # Playbook runs started from the event stream
+        self._running: Set[asyncio.Task] = set()
         self.status = "active"
     
     async def process(self, task: Dict[str, Any]) -> Dict[str, Any]:
@@ -33,14 +48,21 @@ class SOARAgent(BaseAgent):
     async def _manage_playbooks(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Manage SOAR playbooks"""
         try:
-            query = self.supabase.table('soar_playbooks').select('*')
-            query = query.eq('status', 'active')
+            await self.triggers.ensure_fresh()
+            playbooks = self.triggers.playbooks
             
-            result = query.execute()
+            event = task.get("event")
+            if isinstance(event, dict):
+                matched = self.triggers.index.match(event)
+                return {
+                    "response": f"{len(matched)} of {len(playbooks)} active playbook(s) would trigger for this event.",
+                    "data": matched,
+                    "suggested_actions": ["Execute matching playbooks", "View playbook details"]
+                }
             
             return {
-                "response": f"Found {len(result.data)} active playbook(s) available for automation.",
-                "data": result.data,
+                "response": f"Found {len(playbooks)} active playbook(s) available for automation.",
+                "data": playbooks,
                 "suggested_actions": ["View playbook details", "Execute playbook", "Create new playbook"]
             }
         except Exception as e:
@@ -49,6 +71,37 @@ class SOARAgent(BaseAgent):
                 "error": str(e)
             }
     
+    async def trigger_playbooks(self, event: Dict[str, Any], incident_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Execute every active playbook whose trigger conditions match an alert"""
+        playbooks = await self.triggers.match(event)
+        executions = []
+        for playbook in playbooks:
+            try:
+                executions.append(await self.engine.execute(playbook, event=event, incident_id=incident_id))
+            except ValueError as e:
+                executions.append({'playbook_id': playbook.get('id'), 'status': 'failed', 'error': str(e)})
+        return executions
+    
+    async def on_stream_event(self, event: Dict[str, Any]):
+        """
+        Event stream handler: run matching playbooks for a new threat, incident or flagged
+        transaction. Matching is cached and cheap; executions run in the background so the
+        stream poller is not held up by response actions.
+        """
+        alert = {**(event.get('data') or {}), 'topic': event['topic'], 'severity': event.get('severity')}
+        if not await self.triggers.match(alert):
+            return
+        incident_id = event.get('id') if event['topic'] == 'incidents' else None
+        task = asyncio.create_task(self.trigger_playbooks(alert, incident_id))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+    
+    async def shutdown(self):
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        await super().shutdown()
+    
     async def _create_workflow(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Create automation workflow"""
         return {
@@ -60,19 +113,64 @@ class SOARAgent(BaseAgent):
         }
     
     async def _execute_response(self, task: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute automated response action"""
-        return {
-            "response": "Response action executed. IP address blocked, host quarantined, and security team notified.",
-            "data": {
-                "actions_taken": ["Block IP", "Quarantine host", "Send notification"],
-                "status": "completed"
-            },
-            "suggested_actions": ["View execution log", "Check incident status", "Review response effectiveness"]
-        }
+        """Execute a response playbook named in the message, or block the IPs it mentions"""
+        message = task.get("message", "")
+        try:
+            await self.triggers.ensure_fresh()
+            active = self.triggers.playbooks
+            playbook = next(
+                (p for p in active if p.get('name') and p['name'].lower() in message.lower()),
+                None
+            )
+            ips = [value for ioc_type, value in extract_candidates(message) if ioc_type == 'ip']
+            if playbook is None and ips:
+                playbook = {
+                    'name': 'Ad-hoc IP block',
+                    'actions': [{'id': 'block_ip', 'type': 'block_ip', 'params': {'ips': '$event.ips'}}]
+                }
+            if playbook is None:
+                return {
+                    "response": "Name an active playbook or include the IP addresses to block.",
+                    "data": {"available_playbooks": [p.get('name') for p in active]},
+                    "suggested_actions": ["View playbooks", "Block IP <address>"]
+                }
+
+            await self.report_progress(
+                task, "playbook_selected",
+                f"Running playbook \"{playbook['name']}\"",
+                {"actions": list(parse_actions(playbook.get('actions')))}
+            )
+            execution = await self.engine.execute(
+                playbook,
+                event={'message': message, 'ips': ips},
+                incident_id=task.get("incident_id")
+            )
+            actions = execution['execution_log']['actions']
+            succeeded = [a for a, state in actions.items() if state['status'] == 'succeeded']
+            failed = {a: state.get('error', state['status']) for a, state in actions.items() if state['status'] != 'succeeded'}
+            response = f"Playbook \"{playbook['name']}\" {execution['status']}: {len(succeeded)} of {len(actions)} action(s) succeeded."
+            if failed:
+                response += " Not completed: " + "; ".join(f"{a} ({reason})" for a, reason in failed.items())
+
+            return {
+                "response": response,
+                "data": {
+                    "execution_id": execution['execution_id'],
+                    "status": execution['status'],
+                    "actions": actions
+                },
+                "suggested_actions": ["View execution log", "Check incident status", "Review response effectiveness"]
+            }
+        except Exception as e:
+            return {
+                "response": f"Error executing response: {str(e)}",
+                "error": str(e)
+            }
     
     async def _get_soar_info(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Get SOAR information"""
+        answer = await self.generate(task, SOAR_INSTRUCTIONS)
         return {
-            "response": "I handle Security Orchestration, Automation, and Response. I can manage playbooks, create automated workflows, and execute response actions. What would you like to automate?",
+            "response": answer or "I handle Security Orchestration, Automation, and Response. I can manage playbooks, create automated workflows, and execute response actions. What would you like to automate?",
             "suggested_actions": ["View playbooks", "Create workflow", "Execute response"]
         }
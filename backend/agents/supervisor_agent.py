@@ -2,20 +2,30 @@
 Supervisor Agent - Monitors Health and Integrity of Other Agents
 Performs health checks, security auditing, and performance monitoring
 """
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import asyncio
 from datetime import datetime, timedelta
 
 from agents.base_agent import BaseAgent
 from core.supabase_client import get_supabase_client
+from core.agent_registry import AgentRegistry, summarize
+from core.health_probe import probe_agents
+
+
+# System prompt for general questions answered by the LLM gateway
+SUPERVISOR_INSTRUCTIONS = (
+    "You are the supervisor of a multi-agent cybersecurity platform, responsible for agent health, "
+    "performance and integrity. Answer questions about the platform's agents concisely."
+)
 
 
 class SupervisorAgent(BaseAgent):
     """Agent that supervises other agents"""
     
-    def __init__(self, agents: Dict[str, Any]):
+    def __init__(self, agents: Dict[str, Any], registry: Optional[AgentRegistry] = None):
         super().__init__("supervisor", "Supervisor Agent")
         self.agents = agents
+        self.registry = registry
         self.supabase = get_supabase_client()
         self.status = "active"
         self.monitoring = False
@@ -31,7 +41,7 @@ class SupervisorAgent(BaseAgent):
         elif "integrity" in message:
             return await self._check_integrity()
         else:
-            return await self._get_supervisor_info()
+            return await self._get_supervisor_info(task)
     
     async def _check_agent_health(self) -> Dict[str, Any]:
         """Check health of all agents"""
@@ -40,19 +50,14 @@ class SupervisorAgent(BaseAgent):
             "agents": {}
         }
         
-        for agent_type, agent in self.agents.items():
-            try:
-                status = await agent.get_status() if hasattr(agent, 'get_status') else {"status": "unknown"}
-                health_report["agents"][agent_type] = {
-                    "status": status.get("status", "unknown"),
-                    "healthy": status.get("status") == "active"
-                }
-            except Exception as e:
-                health_report["agents"][agent_type] = {
-                    "status": "error",
-                    "error": str(e),
-                    "healthy": False
-                }
+        # Probed concurrently with a deadline so one hung agent cannot stall the report
+        for agent_type, status in (await probe_agents(dict(self.agents.items()))).items():
+            health_report["agents"][agent_type] = {
+                "status": status.get("status", "unknown"),
+                "healthy": status.get("status") == "active",
+                "probe_latency_ms": status["probe_latency_ms"],
+                **({"error": status["error"]} if "error" in status else {})
+            }
         
         healthy_count = sum(1 for a in health_report["agents"].values() if a.get("healthy"))
         total_count = len(health_report["agents"])
@@ -87,23 +92,27 @@ class SupervisorAgent(BaseAgent):
         }
     
     async def start_monitoring(self):
-        """Start continuous monitoring of agents"""
+        """Start continuous monitoring of agents (run by the elected leader only)"""
         self.monitoring = True
-        while self.monitoring:
-            try:
-                await self._perform_health_check()
-                await asyncio.sleep(60)  # Check every minute
-            except Exception as e:
-                print(f"Error in supervisor monitoring: {e}")
-                await asyncio.sleep(60)
+        try:
+            while self.monitoring:
+                try:
+                    await self._perform_health_check()
+                    await asyncio.sleep(60)  # Check every minute
+                except Exception as e:
+                    print(f"Error in supervisor monitoring: {e}")
+                    await asyncio.sleep(60)
+        finally:
+            self.monitoring = False
     
     async def _perform_health_check(self):
         """Perform periodic health check and update database"""
+        if self.registry is not None:
+            await self._record_cluster_health()
+            return
         try:
-            for agent_type, agent in self.agents.items():
+            for agent_type, status in (await probe_agents(dict(self.agents.items()))).items():
                 try:
-                    status = await agent.get_status() if hasattr(agent, 'get_status') else {"status": "unknown"}
-                    
                     # Update agent status in database
                     self.supabase.table('agents').update({
                         'status': status.get("status", "unknown"),
@@ -115,9 +124,30 @@ class SupervisorAgent(BaseAgent):
         except Exception as e:
             print(f"Error in health check: {e}")
     
-    async def _get_supervisor_info(self) -> Dict[str, Any]:
+    async def _record_cluster_health(self):
+        """Write one status per agent type, aggregated over every live worker"""
+        try:
+            workers = await self.registry.read_all()
+            for agent_type, health in summarize(workers).items():
+                if health['active']:
+                    status = 'active'
+                elif set(health['statuses']) == {'not_loaded'}:
+                    # Not yet needed by any worker; idle rather than failed
+                    status = 'inactive'
+                else:
+                    status = 'error'
+                self.supabase.table('agents').update({
+                    'status': status,
+                    'health_status': {**health, 'healthy_workers': health['active'], 'total_workers': health['workers']},
+                    'last_heartbeat': datetime.utcnow().isoformat()
+                }).eq('agent_type', agent_type).execute()
+        except Exception as e:
+            print(f"Error in health check: {e}")
+    
+    async def _get_supervisor_info(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Get supervisor information"""
+        answer = await self.generate(task, SUPERVISOR_INSTRUCTIONS)
         return {
-            "response": "I monitor the health, performance, and integrity of all agents in the platform. I can check agent status, performance metrics, and security integrity. What would you like me to check?",
+            "response": answer or "I monitor the health, performance, and integrity of all agents in the platform. I can check agent status, performance metrics, and security integrity. What would you like me to check?",
             "suggested_actions": ["Check agent health", "View performance metrics", "Verify integrity"]
         }
@@ -7,6 +7,15 @@ from datetime import datetime
 
 from agents.base_agent import BaseAgent
 from core.supabase_client import get_supabase_client
+from intelligence.ioc_engine import extract_candidates, get_threat_indicator_index
+from intelligence.enrichment import EnrichmentService
+
+
+# System prompt for general questions answered by the LLM gateway
+THREAT_INTEL_INSTRUCTIONS = (
+    "You are the threat intelligence analyst of a cybersecurity platform. Answer questions about threats, "
+    "indicators of compromise, threat actors and sanctions screening concisely."
+)
 
 
 class ThreatIntelAgent(BaseAgent):
@@ -15,6 +24,7 @@ class ThreatIntelAgent(BaseAgent):
     def __init__(self):
         super().__init__("threat_intel", "Threat Intelligence Agent")
         self.supabase = get_supabase_client()
+        self.enrichment = EnrichmentService()
         self.status = "active"
     
     async def process(self, task: Dict[str, Any]) -> Dict[str, Any]:
@@ -23,6 +33,8 @@ class ThreatIntelAgent(BaseAgent):
         
         if "sanctions" in message or "blacklist" in message:
             return await self._check_sanctions(task)
+        elif "enrich" in message or "reputation" in message:
+            return await self._enrich_indicators(task)
         elif "ioc" in message or "indicator" in message or "threat" in message:
             return await self._check_threat(task)
         elif "search" in message:
@@ -67,15 +79,79 @@ class ThreatIntelAgent(BaseAgent):
     
     async def _check_threat(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Check threat indicators"""
-        return {
-            "response": "Threat Intelligence Check: Analyzing indicators. No active threats detected matching your criteria.",
-            "data": {
-                "threats_found": 0,
-                "iocs_checked": 0,
-                "status": "clear"
-            },
-            "suggested_actions": ["View threat feed", "Check IOCs", "Review recent threats"]
-        }
+        try:
+            index = await get_threat_indicator_index()
+            await index.refresh()
+            
+            await self.report_progress(task, "indicators_loaded", f"Checking against {len(index.engine)} known indicators")
+            
+            matches = index.engine.scan(task.get("message", ""))
+            threats = [match["threat"] for match in matches if match.get("threat")]
+            critical = [t for t in threats if t.get("severity") in ("critical", "high")]
+            
+            if matches:
+                indicators = ", ".join(f"{m['matched']} ({m['ioc_type']})" for m in matches[:5])
+                response = f"⚠️ Threat Intelligence Check: {len(matches)} known indicator(s) matched: {indicators}. {len(critical)} high or critical."
+            else:
+                response = f"Threat Intelligence Check: Checked against {len(index.engine)} known indicators. No active threats detected matching your criteria."
+            
+            return {
+                "response": response,
+                "data": {
+                    "threats_found": len(matches),
+                    "iocs_checked": len(index.engine),
+                    "matches": matches,
+                    "status": "match" if matches else "clear"
+                },
+                "suggested_actions": ["Create incident", "Block indicator", "View threat details"] if matches
+                else ["View threat feed", "Check IOCs", "Review recent threats"]
+            }
+        except Exception as e:
+            return {
+                "response": f"Error checking threat indicators: {str(e)}",
+                "error": str(e)
+            }
+    
+    async def _enrich_indicators(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Look up indicators in the message with external reputation providers"""
+        try:
+            candidates = extract_candidates(task.get("message", ""))
+            if not candidates:
+                return {
+                    "response": "I couldn't find an IP, domain, URL or hash to enrich in your message.",
+                    "data": {}
+                }
+            
+            await self.report_progress(
+                task, "indicators_extracted",
+                f"Enriching {len(candidates)} indicator(s)",
+                {"indicators": [f"{ioc_type}:{value}" for ioc_type, value in candidates]}
+            )
+            # Don't hold the chat turn on provider rate limits; deferred lookups finish in the background
+            results = await self.enrichment.enrich_many(candidates, wait=False)
+            malicious = [
+                f"{value} ({ioc_type})" for (ioc_type, value), providers in results.items()
+                if any(r.get("malicious") or r.get("pulse_count") for r in providers.values())
+            ]
+            pending = [ioc for ioc, providers in results.items() if any(r.get("pending") for r in providers.values())]
+            
+            response = f"Enriched {len(results)} indicator(s)."
+            if malicious:
+                response += f" ⚠️ Flagged by reputation providers: {', '.join(malicious)}."
+            if pending:
+                response += (f" {len(pending)} lookup(s) are queued behind provider rate limits and will be "
+                             "ready if you ask again shortly.")
+            
+            return {
+                "response": response,
+                "data": {f"{ioc_type}:{value}": providers for (ioc_type, value), providers in results.items()},
+                "suggested_actions": ["Create incident", "Block indicator", "Add to threat database"]
+            }
+        except Exception as e:
+            return {
+                "response": f"Error enriching indicators: {str(e)}",
+                "error": str(e)
+            }
     
     async def _search_threats(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Search threat database"""
@@ -103,9 +179,15 @@ class ThreatIntelAgent(BaseAgent):
                 "error": str(e)
             }
     
+    async def shutdown(self):
+        """Shutdown the agent"""
+        await self.enrichment.close()
+        await super().shutdown()
+    
     async def _get_threat_info(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Get general threat intelligence information"""
+        answer = await self.generate(task, THREAT_INTEL_INSTRUCTIONS)
         return {
-            "response": "I can help you with threat intelligence, check sanctions lists, analyze IOCs, and search threat databases. What would you like to investigate?",
+            "response": answer or "I can help you with threat intelligence, check sanctions lists, analyze IOCs, and search threat databases. What would you like to investigate?",
             "suggested_actions": ["Check sanctions list", "Search threats", "Analyze IOCs"]
         }
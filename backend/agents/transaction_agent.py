@@ -9,6 +9,13 @@ from agents.base_agent import BaseAgent
 from core.supabase_client import get_supabase_client
 
 
+# System prompt for general questions answered by the LLM gateway
+TRANSACTION_INSTRUCTIONS = (
+    "You are the transaction fraud analyst of a cybersecurity platform. Answer questions about payments, "
+    "transfers, fraud patterns and suspicious financial activity concisely."
+)
+
+
 class TransactionAgent(BaseAgent):
     """Agent for monitoring transactions and fraud detection"""
     
@@ -90,7 +97,8 @@ class TransactionAgent(BaseAgent):
     
     async def _get_transaction_info(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Get general transaction information"""
+        answer = await self.generate(task, TRANSACTION_INSTRUCTIONS)
         return {
-            "response": "I can help you monitor transactions, detect fraud, analyze patterns, and investigate suspicious activities. What would you like to check?",
+            "response": answer or "I can help you monitor transactions, detect fraud, analyze patterns, and investigate suspicious activities. What would you like to check?",
             "suggested_actions": ["Search transactions", "Detect fraud", "Analyze patterns"]
         }
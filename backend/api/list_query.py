@@ -0,0 +1,155 @@
+"""
+List Query Layer
+Shared cursor pagination, field projection, whitelisted filtering/sorting and
+cached JSON responses (ETag/304, gzip) for collection endpoints
+"""
+from typing import Dict, Any, List, Optional, Tuple
+import base64
+import gzip
+import hashlib
+import json
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+from core.supabase_client import get_supabase_client, keyset_after
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+MAX_LIMIT = 500
+# Bodies smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
+# Query parameters handled by the list layer itself rather than as filters
+RESERVED_PARAMS = ('limit', 'cursor', 'fields', 'sort')
+
+
+def dumps(payload: Any) -> bytes:
+    """Serialize to compact JSON bytes, using orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=str)
+    return json.dumps(payload, default=str, separators=(',', ':')).encode()
+
+
+class ListResource:
+    """
+    Describes a listable table.
+    filters maps a query parameter to (column, operator); "in" accepts comma-separated values.
+    """
+
+    def __init__(self, table: str, key: str, fields: Tuple[str, ...],
+                 filters: Dict[str, Tuple[str, str]], sorts: Tuple[str, ...], default_sort: str):
+        self.table = table
+        self.key = key
+        self.fields = fields
+        self.filters = filters
+        self.sorts = sorts
+        self.default_sort = default_sort
+
+
+def _encode_cursor(value: Any, row_id: str) -> str:
+    raw = json.dumps({'v': value, 'id': row_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        decoded = json.loads(raw)
+        if not isinstance(decoded, dict) or 'id' not in decoded or 'v' not in decoded:
+            raise ValueError
+        return decoded
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse_sort(resource: ListResource, sort: Optional[str]) -> Tuple[str, bool]:
+    sort = sort or resource.default_sort
+    column = sort.lstrip('-')
+    if column not in resource.sorts:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by '{column}'. Allowed: {', '.join(resource.sorts)}")
+    return column, sort.startswith('-')
+
+
+def _parse_fields(resource: ListResource, fields: Optional[str], sort_column: str) -> Tuple[str, List[str]]:
+    """Columns to select, plus the requested fields to return"""
+    if not fields:
+        return '*', []
+    requested = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in resource.fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+    # id and the sort column are needed to build the next cursor
+    selected = list(dict.fromkeys(requested + ['id', sort_column]))
+    return ', '.join(selected), requested
+
+
+def list_rows(resource: ListResource, request: Request, limit: int) -> Dict[str, Any]:
+    """
+    Run a list query from request parameters.
+    Returns {resource.key: rows, "next_cursor": str|None}; next_cursor is None on the last page.
+    """
+    params = request.query_params
+    unknown = [p for p in params if p not in RESERVED_PARAMS and p not in resource.filters]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown parameter(s): {', '.join(unknown)}. Filters: {', '.join(resource.filters)}"
+        )
+    limit = max(1, min(limit, MAX_LIMIT))
+    sort_column, descending = _parse_sort(resource, params.get('sort'))
+    columns, requested = _parse_fields(resource, params.get('fields'), sort_column)
+
+    supabase = get_supabase_client()
+    query = supabase.table(resource.table).select(columns)
+
+    for name, (column, operator) in resource.filters.items():
+        value = params.get(name)
+        if not value:
+            continue
+        if operator == 'in':
+            values = [v.strip() for v in value.split(',') if v.strip()]
+            if not values:
+                continue
+            query = query.in_(column, values) if len(values) > 1 else query.eq(column, values[0])
+        else:
+            query = getattr(query, operator)(column, value)
+
+    cursor = params.get('cursor')
+    if cursor:
+        # Keyset: rows strictly after (sort value, id) in sort order; sort columns may hold NULLs
+        position = _decode_cursor(cursor)
+        query = keyset_after(query, sort_column, position['v'], position['id'], descending, nullable=True)
+
+    rows = query.order(sort_column, desc=descending)\
+        .order('id', desc=descending)\
+        .limit(limit + 1)\
+        .execute().data or []
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].get(sort_column), rows[-1]['id'])
+    if requested:
+        rows = [{f: row.get(f) for f in requested} for row in rows]
+
+    return {resource.key: rows, 'next_cursor': next_cursor}
+
+
+def cached_json_response(request: Request, payload: Any) -> Response:
+    """JSON response with an ETag; unchanged bodies get a bodyless 304, large ones are gzipped"""
+    body = dumps(payload)
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+        return Response(status_code=304, headers=headers)
+
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.headers.get('accept-encoding', ''):
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(content=body, media_type='application/json', headers=headers)
@@ -1,7 +1,7 @@
 """
 Agents API Routes
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import Optional
 
 from core.agent_orchestrator import AgentOrchestrator
@@ -9,16 +9,18 @@ from core.agent_orchestrator import AgentOrchestrator
 router = APIRouter()
 
 
-def get_orchestrator() -> AgentOrchestrator:
-    """Get orchestrator instance - simplified for now"""
-    raise HTTPException(status_code=501, detail="Orchestrator dependency injection not yet implemented")
+def get_orchestrator(request: Request) -> AgentOrchestrator:
+    """Get orchestrator from app state"""
+    orchestrator = getattr(request.app.state, 'orchestrator', None)
+    if orchestrator is None:
+        raise HTTPException(status_code=503, detail="Orchestrator not initialized")
+    return orchestrator
 
 
 @router.get("/status")
-async def get_agents_status():
-    """Get status of all agents"""
-    # This will be properly implemented with dependency injection
-    return {
-        "message": "Agent status endpoint - requires orchestrator integration",
-        "agents": {}
-    }
+async def get_agents_status(orchestrator: AgentOrchestrator = Depends(get_orchestrator)):
+    """Cached agent probe snapshot (with circuit states) for this worker and every live worker"""
+    try:
+        return await orchestrator.get_cluster_status()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
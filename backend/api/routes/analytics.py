@@ -1,9 +1,9 @@
 """
 Analytics API Routes
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta, time, timezone
 
 from core.supabase_client import get_supabase_client
 
@@ -45,6 +45,50 @@ async def get_dashboard_analytics(days: int = 7):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/mitre-heatmap")
+async def get_mitre_heatmap(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    days: int = Query(30, ge=1, le=3650)
+):
+    """
+    MITRE ATT&CK tactic/technique heatmap for [start, end] (defaults to the last `days` days).
+    Served from the per-day rollups kept by the threats trigger, so cost does not grow with the window.
+    """
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=days - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    try:
+        supabase = get_supabase_client()
+        result = supabase.rpc('mitre_heatmap', {
+            'p_start': datetime.combine(start, time.min, timezone.utc).isoformat(),
+            'p_end': datetime.combine(end, time.min, timezone.utc).isoformat()
+        }).execute()
+
+        cells = [
+            {
+                "tactic": row['tactic'] or None,
+                "technique": row['technique'] or None,
+                "count": int(row['count'] or 0)
+            }
+            for row in result.data or []
+            if row.get('count')
+        ]
+        cells.sort(key=lambda cell: (cell['tactic'] or '', -cell['count'], cell['technique'] or ''))
+
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "tactics": sorted({cell['tactic'] for cell in cells if cell['tactic']}),
+            "max_count": max((cell['count'] for cell in cells), default=0),
+            "cells": cells
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 def _count_by_field(data: list, field: str) -> dict:
     """Helper to count items by field"""
     counts = {}
@@ -1,13 +1,15 @@
 """
 Chat API Routes - Master agent interface
 """
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+import json
 import uuid
 
 from core.agent_orchestrator import AgentOrchestrator
-from core.supabase_client import get_supabase_client
+from core.session_store import get_session_store, MAX_HISTORY_PAGE
 
 router = APIRouter()
 
@@ -34,6 +36,13 @@ def get_orchestrator(request: Request) -> AgentOrchestrator:
     return orchestrator
 
 
+def _new_session() -> str:
+    """A fresh session ID, registered with the session store so it is never looked up"""
+    session_id = str(uuid.uuid4())
+    get_session_store().start(session_id)
+    return session_id
+
+
 @router.post("/", response_model=ChatResponse)
 async def chat(chat_message: ChatMessage, request: Request):
     """Send a message to the master agent"""
@@ -41,7 +50,7 @@ async def chat(chat_message: ChatMessage, request: Request):
         orchestrator = get_orchestrator(request)
         
         # Generate session ID if not provided
-        session_id = chat_message.session_id or str(uuid.uuid4())
+        session_id = chat_message.session_id or _new_session()
         
         # Process message through orchestrator
         result = await orchestrator.process_chat_message(
@@ -63,17 +72,43 @@ async def chat(chat_message: ChatMessage, request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/stream")
+async def chat_stream(chat_message: ChatMessage, request: Request,
+                      format: str = Query("ndjson", pattern="^(ndjson|sse)$")):
+    """
+    Streaming variant of chat: one JSON object per line (or per SSE event) for the
+    routing decision, each partial agent result, and the final response
+    """
+    orchestrator = get_orchestrator(request)
+    session_id = chat_message.session_id or _new_session()
+    
+    async def updates():
+        try:
+            async for update in orchestrator.stream_chat_message(
+                chat_message.message,
+                chat_message.user_id,
+                session_id
+            ):
+                update["session_id"] = session_id
+                body = json.dumps(update, default=str)
+                yield f"event: {update['type']}\ndata: {body}\n\n" if format == "sse" else body + "\n"
+        except Exception as e:
+            body = json.dumps({"type": "error", "detail": str(e), "session_id": session_id})
+            yield f"event: error\ndata: {body}\n\n" if format == "sse" else body + "\n"
+    
+    return StreamingResponse(
+        updates(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/history/{session_id}")
-async def get_chat_history(session_id: str):
-    """Get chat history for a session"""
+async def get_chat_history(session_id: str,
+                           offset: int = Query(0, ge=0),
+                           limit: int = Query(50, ge=1, le=MAX_HISTORY_PAGE)):
+    """Get a page of chat history for a session, oldest first, served from the session cache"""
     try:
-        supabase = get_supabase_client()
-        result = supabase.table('chat_conversations')\
-            .select('*')\
-            .eq('session_id', session_id)\
-            .order('created_at', desc=False)\
-            .execute()
-        
-        return {"conversations": result.data}
+        return await get_session_store().history(session_id, offset, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
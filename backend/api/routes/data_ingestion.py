@@ -13,9 +13,14 @@ router = APIRouter()
 @router.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
-    source_type: Optional[str] = None
+    source_type: Optional[str] = None,
+    extract_tables: bool = False,
+    reprocess: bool = False
 ):
-    """Upload and process a file"""
+    """
+    Upload and process a file; extract_tables uses pdfplumber for PDF tables.
+    A file identical to one already ingested returns that ingestion unless reprocess is set.
+    """
     try:
         # Determine source type from file extension if not provided
         if not source_type:
@@ -33,12 +38,20 @@ async def upload_file(
         
         # Process file
         processor = DataIngestionProcessor()
-        result = await processor.process_file(file, source_type)
+        result = await processor.process_file(file, source_type, extract_tables, reprocess)
+        
+        if result.get("deduplicated"):
+            message = "File already ingested" if result.get("status") == "completed" else "File is already being ingested"
+        else:
+            message = "File processed successfully"
         
         return {
-            "message": "File processed successfully",
+            "message": message,
             "ingestion_id": result.get("ingestion_id"),
-            "records_processed": result.get("records_processed", 0)
+            "status": result.get("status"),
+            "records_processed": result.get("records_processed", 0),
+            "deduplicated": result.get("deduplicated", False),
+            "resumed": result.get("resumed", False)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,29 +1,50 @@
 """
 Incidents API Routes
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import Optional
 from pydantic import BaseModel
 
+from api.list_query import ListResource, MAX_LIMIT, cached_json_response, list_rows
 from core.supabase_client import get_supabase_client
 
 router = APIRouter()
 
 
+INCIDENTS = ListResource(
+    table='incidents',
+    key='incidents',
+    fields=(
+        'id', 'incident_id', 'title', 'description', 'severity', 'status', 'assigned_to',
+        'individual_id', 'organization_id', 'threat_id', 'timeline', 'forensic_data', 'response_actions',
+        'created_at', 'updated_at', 'resolved_at'
+    ),
+    filters={
+        'status': ('status', 'in'),
+        'severity': ('severity', 'in'),
+        'assigned_to': ('assigned_to', 'eq'),
+        'individual_id': ('individual_id', 'eq'),
+        'organization_id': ('organization_id', 'eq'),
+        'threat_id': ('threat_id', 'eq'),
+        'created_after': ('created_at', 'gte'),
+        'created_before': ('created_at', 'lt'),
+        'updated_after': ('updated_at', 'gte'),
+    },
+    sorts=('created_at', 'updated_at'),
+    default_sort='-created_at'
+)
+
+
 @router.get("/")
-async def get_incidents(limit: int = 20, status: Optional[str] = None):
-    """Get incidents"""
+async def get_incidents(request: Request, limit: int = Query(20, ge=1, le=MAX_LIMIT)):
+    """
+    Get incidents. Supports cursor, fields=, sort= (prefix - for descending) and the
+    filters in INCIDENTS.filters; comma-separated values match any of them.
+    """
     try:
-        supabase = get_supabase_client()
-        query = supabase.table('incidents').select('*')
-        
-        if status:
-            query = query.eq('status', status)
-        
-        query = query.order('created_at', desc=True).limit(limit)
-        result = query.execute()
-        
-        return {"incidents": result.data}
+        return cached_json_response(request, list_rows(INCIDENTS, request, limit))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
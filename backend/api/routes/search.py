@@ -0,0 +1,30 @@
+"""
+Search API Routes
+"""
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+import time
+
+from intelligence.entity_search import get_entity_search_index
+
+router = APIRouter()
+
+
+@router.get("/typeahead")
+async def typeahead(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    entity_type: Optional[str] = Query(None, pattern="^(individual|organization)$")
+):
+    """Prefix search over individuals and organizations"""
+    try:
+        started = time.perf_counter()
+        results = await get_entity_search_index().search(q, limit, entity_type)
+        
+        return {
+            "query": q,
+            "results": results,
+            "took_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,107 @@
+"""
+Event Stream API Routes - push new threats, incidents and flagged transactions
+"""
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+import json
+
+from core.event_stream import EventFilter, get_event_stream
+
+router = APIRouter()
+
+# Event fields clients may filter on by equality, besides topics and severity
+FILTER_FIELDS = ('ioc_type', 'threat_type', 'source', 'status', 'individual_id', 'organization_id')
+# Comment line sent on idle SSE connections so proxies keep them open
+KEEPALIVE_SECONDS = 15
+
+
+def _build_filter(topics: Optional[str], severity: Optional[str], params) -> EventFilter:
+    return EventFilter(
+        topics=topics.split(',') if topics else None,
+        min_severity=severity,
+        fields={field: params[field] for field in FILTER_FIELDS if params.get(field)}
+    )
+
+
+@router.get("/events")
+async def stream_events(request: Request, topics: Optional[str] = None, severity: Optional[str] = None):
+    """
+    Server-sent events. `topics` is a comma-separated subset of threats,incidents,transactions;
+    `severity` is a minimum severity; other FILTER_FIELDS match by equality.
+    """
+    try:
+        event_filter = _build_filter(topics, severity, request.query_params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    stream = get_event_stream()
+    subscription = stream.subscribe(event_filter)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event['type'] == 'closed':
+                    return
+                yield f"event: {event.get('topic', event['type'])}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            stream.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@router.websocket("/ws")
+async def stream_websocket(websocket: WebSocket, topics: Optional[str] = None, severity: Optional[str] = None):
+    """
+    WebSocket stream with the same query filters as /events.
+    Clients may send {"topics": [...], "severity": ..., "filters": {...}} to change their subscription.
+    """
+    await websocket.accept()
+    try:
+        event_filter = _build_filter(topics, severity, websocket.query_params)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    stream = get_event_stream()
+    subscription = stream.subscribe(event_filter)
+
+    async def receive_filters():
+        try:
+            while True:
+                message = await websocket.receive_json()
+                try:
+                    subscription.filter = EventFilter(
+                        topics=message.get('topics'),
+                        min_severity=message.get('severity'),
+                        fields={k: v for k, v in (message.get('filters') or {}).items() if k in FILTER_FIELDS}
+                    )
+                    await websocket.send_json({'type': 'subscribed', 'topics': sorted(subscription.filter.topics)})
+                except (ValueError, AttributeError) as e:
+                    await websocket.send_json({'type': 'error', 'detail': str(e)})
+        finally:
+            # A disconnect ends the receive loop; closing wakes the sender so it stops too
+            subscription.close()
+
+    receiver = asyncio.create_task(receive_filters())
+    try:
+        await websocket.send_json({'type': 'subscribed', 'topics': sorted(event_filter.topics)})
+        while True:
+            event = await subscription.get()
+            if event['type'] == 'closed' or subscription.closed:
+                break
+            await websocket.send_text(json.dumps(event, default=str))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receiver.cancel()
+        stream.unsubscribe(subscription)
@@ -1,10 +1,11 @@
 """
 Threats API Routes
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import Optional
 from pydantic import BaseModel
 
+from api.list_query import ListResource, MAX_LIMIT, cached_json_response, list_rows
 from core.supabase_client import get_supabase_client
 
 router = APIRouter()
@@ -16,20 +17,40 @@ class ThreatQuery(BaseModel):
     limit: int = 20
 
 
+THREATS = ListResource(
+    table='threats',
+    key='threats',
+    fields=(
+        'id', 'threat_id', 'title', 'description', 'severity', 'threat_type', 'source', 'ioc_type', 'ioc_value',
+        'mitre_attack_tactics', 'mitre_attack_techniques', 'related_threat_actors', 'metadata',
+        'sighting_count', 'sources', 'first_seen', 'last_seen', 'created_at'
+    ),
+    filters={
+        'severity': ('severity', 'in'),
+        'threat_type': ('threat_type', 'in'),
+        'source': ('source', 'in'),
+        'ioc_type': ('ioc_type', 'in'),
+        'ioc_value': ('ioc_value', 'eq'),
+        'min_sightings': ('sighting_count', 'gte'),
+        'created_after': ('created_at', 'gte'),
+        'created_before': ('created_at', 'lt'),
+        'seen_after': ('last_seen', 'gte'),
+    },
+    sorts=('created_at', 'last_seen', 'first_seen', 'sighting_count'),
+    default_sort='-created_at'
+)
+
+
 @router.get("/")
-async def get_threats(limit: int = 20, severity: Optional[str] = None):
-    """Get threats"""
+async def get_threats(request: Request, limit: int = Query(20, ge=1, le=MAX_LIMIT)):
+    """
+    Get threats. Supports cursor, fields=, sort= (prefix - for descending) and the
+    filters in THREATS.filters; comma-separated values match any of them.
+    """
     try:
-        supabase = get_supabase_client()
-        query = supabase.table('threats').select('*')
-        
-        if severity:
-            query = query.eq('severity', severity)
-        
-        query = query.order('created_at', desc=True).limit(limit)
-        result = query.execute()
-        
-        return {"threats": result.data}
+        return cached_json_response(request, list_rows(THREATS, request, limit))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,185 @@
+"""
+Admission Control
+Classifies requests by route into priority classes, each with a concurrency limit,
+a bounded queue and a queue-wait budget. Lower classes are shed first with
+429 + Retry-After so interactive chat keeps its latency during a surge.
+"""
+from typing import Dict, Any, Deque, List, Optional, Tuple
+from collections import deque
+import asyncio
+import json
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+
+class PriorityClass:
+    """Limits for one class of requests; lower rank is higher priority"""
+
+    def __init__(self, name: str, rank: int, concurrency: int, queue_size: int,
+                 max_wait_seconds: float, retry_after_seconds: int):
+        self.name = name
+        self.rank = rank
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait_seconds = max_wait_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+
+def default_classes() -> List[PriorityClass]:
+    return [
+        PriorityClass('interactive', 0, concurrency=32, queue_size=256, max_wait_seconds=5.0, retry_after_seconds=1),
+        PriorityClass('standard', 1, concurrency=16, queue_size=128, max_wait_seconds=2.0, retry_after_seconds=2),
+        PriorityClass('polling', 2, concurrency=8, queue_size=64, max_wait_seconds=1.0, retry_after_seconds=5),
+        PriorityClass('bulk', 3, concurrency=2, queue_size=8, max_wait_seconds=0.5, retry_after_seconds=30),
+    ]
+
+
+# (path prefix, methods or None for any) -> class; first match wins, None means not admission-controlled
+ROUTE_CLASSES: List[Tuple[str, Optional[Tuple[str, ...]], Optional[str]]] = [
+    ('/api/stream', None, None),
+    ('/health', None, None),
+    ('/metrics', None, None),
+    ('/api/chat', None, 'interactive'),
+    ('/api/ingestion', ('POST', 'PUT'), 'bulk'),
+    ('/api/threats', ('GET',), 'polling'),
+    ('/api/incidents', ('GET',), 'polling'),
+    ('/api/analytics', ('GET',), 'polling'),
+    ('/api', None, 'standard'),
+]
+
+QUEUE_DEPTH = Gauge('admission_queue_depth', 'Requests waiting for admission', ['priority'])
+IN_FLIGHT = Gauge('admission_in_flight', 'Requests admitted and running', ['priority'])
+SHED = Counter('admission_shed_total', 'Requests rejected with 429', ['priority', 'reason'])
+QUEUE_WAIT = Histogram(
+    'admission_queue_wait_seconds', 'Time spent waiting for admission', ['priority'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+)
+
+
+def classify(path: str, method: str) -> Optional[str]:
+    """Priority class for a request, or None if it bypasses admission control"""
+    if method == 'OPTIONS':
+        return None
+    for prefix, methods, priority in ROUTE_CLASSES:
+        if path.startswith(prefix) and (methods is None or method in methods):
+            return priority
+    return None
+
+
+class AdmissionController:
+    """Per-class concurrency limits with bounded FIFO queues and priority shedding"""
+
+    def __init__(self, classes: Optional[List[PriorityClass]] = None):
+        self.classes: Dict[str, PriorityClass] = {c.name: c for c in (classes or default_classes())}
+
+    async def acquire(self, name: str) -> Optional[str]:
+        """Wait for a slot; returns None once admitted or the reason the request was shed"""
+        cls = self.classes[name]
+        if cls.active < cls.concurrency and not cls.waiters:
+            self._admit(cls)
+            QUEUE_WAIT.labels(cls.name).observe(0)
+            return None
+        if len(cls.waiters) >= cls.queue_size:
+            return self._shed(cls, 'queue_full')
+        # Lower classes do not queue while a higher class is already waiting
+        if any(other.waiters for other in self.classes.values() if other.rank < cls.rank):
+            return self._shed(cls, 'priority')
+
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        cls.waiters.append(future)
+        QUEUE_DEPTH.labels(cls.name).set(len(cls.waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=cls.max_wait_seconds)
+            QUEUE_WAIT.labels(cls.name).observe(time.perf_counter() - started)
+            return None
+        except asyncio.TimeoutError:
+            if future.done():
+                # Admitted just as the budget ran out; keep the slot
+                return None
+            return self._shed(cls, 'latency_budget')
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(name)
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            if future in cls.waiters:
+                cls.waiters.remove(future)
+            QUEUE_DEPTH.labels(cls.name).set(len(cls.waiters))
+
+    def release(self, name: str):
+        """Free a slot, handing it straight to the next waiter of the same class"""
+        cls = self.classes[name]
+        while cls.waiters:
+            future = cls.waiters.popleft()
+            if not future.done():
+                future.set_result(True)
+                QUEUE_DEPTH.labels(cls.name).set(len(cls.waiters))
+                return
+        cls.active -= 1
+        IN_FLIGHT.labels(cls.name).set(cls.active)
+
+    def retry_after(self, name: str) -> int:
+        return self.classes[name].retry_after_seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {'active': c.active, 'waiting': len(c.waiters), 'concurrency': c.concurrency}
+            for name, c in self.classes.items()
+        }
+
+    def _admit(self, cls: PriorityClass):
+        cls.active += 1
+        IN_FLIGHT.labels(cls.name).set(cls.active)
+
+    def _shed(self, cls: PriorityClass, reason: str) -> str:
+        SHED.labels(cls.name, reason).inc()
+        return reason
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware; the slot is held until the response (including streams) completes"""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or AdmissionController()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        priority = classify(scope.get('path', ''), scope.get('method', 'GET'))
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await self.controller.acquire(priority)
+        if reason is not None:
+            await self._reject(send, priority, reason)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(priority)
+
+    async def _reject(self, send, priority: str, reason: str):
+        body = json.dumps({
+            'error': 'Server busy',
+            'detail': f"Request shed ({reason}); retry later",
+            'priority': priority
+        }).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 429,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(self.controller.retry_after(priority)).encode()),
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
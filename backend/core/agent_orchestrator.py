@@ -2,19 +2,18 @@
 Master Agent Orchestrator
 Coordinates all specialized agents in the platform
 """
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, AsyncIterator
 import asyncio
 from datetime import datetime
 import uuid
 
 from agents.master_agent import MasterAgent
-from agents.individual_agent import IndividualAgent
-from agents.organization_agent import OrganizationAgent
-from agents.transaction_agent import TransactionAgent
-from agents.supervisor_agent import SupervisorAgent
-from agents.threat_intel_agent import ThreatIntelAgent
-from agents.soar_agent import SOARAgent
 from core.supabase_client import get_supabase_client
+from core.agent_pool import AgentPool
+from core.agent_registry import AgentRegistry, summarize
+from core.event_stream import get_event_stream
+from core.health_probe import probe_agents
+from core.leader import LeaderElection
 
 
 class AgentOrchestrator:
@@ -23,80 +22,96 @@ class AgentOrchestrator:
     def __init__(self):
         self.supabase = get_supabase_client()
         self.master_agent: Optional[MasterAgent] = None
-        self.agents: Dict[str, Any] = {}
+        self.agents = AgentPool()
+        self.registry = AgentRegistry()
         self.status = "initializing"
         self.initialized = False
+        # Latest probe results, refreshed with every registry heartbeat
+        self.health_snapshot: Optional[Dict[str, Any]] = None
+        self._background: List[asyncio.Task] = []
     
     async def initialize(self):
-        """Initialize all agents"""
+        """Initialize the orchestrator; agents are built on first routing and registered in the background"""
         try:
-            print("Initializing specialized agents...")
+            print("Initializing agent pool...")
             
-            # Initialize specialized agents
-            self.agents['individual'] = IndividualAgent()
-            self.agents['organization'] = OrganizationAgent()
-            self.agents['transaction'] = TransactionAgent()
-            self.agents['supervisor'] = SupervisorAgent(self.agents)
-            self.agents['threat_intel'] = ThreatIntelAgent()
-            self.agents['soar'] = SOARAgent()
+            # The supervisor watches whichever agents have been built so far
+            self.agents.arguments['supervisor'] = lambda: (self.agents, self.registry)
             
             # Initialize master agent
             self.master_agent = MasterAgent(self.agents)
             
-            # Register agents in database
-            await self._register_agents()
-            
-            # Start supervisor monitoring
-            if 'supervisor' in self.agents:
-                asyncio.create_task(self.agents['supervisor'].start_monitoring())
-            
             self.status = "operational"
             self.initialized = True
-            print("All agents initialized successfully")
+            
+            # Register agents in database and load the routing model without holding up startup
+            self._background.append(asyncio.create_task(self._register_agents()))
+            self._background.append(asyncio.create_task(self._load_intent_classifier()))
+            
+            # Publish this worker's agents to the shared registry
+            self._background.append(asyncio.create_task(self.registry.run(self.get_agent_status)))
+            
+            # New threats, incidents and flagged transactions fire matching SOAR playbooks
+            get_event_stream().add_handler(self._trigger_playbooks)
+            
+            # Supervision runs in one worker at a time, under a Redis lease
+            if 'supervisor' in self.agents:
+                self._background.append(asyncio.create_task(
+                    LeaderElection('supervisor').run(lambda: self.agents['supervisor'].start_monitoring())
+                ))
+            print("Agent orchestrator ready")
             
         except Exception as e:
             print(f"Error initializing agents: {e}")
             self.status = "error"
             raise
     
+    async def _trigger_playbooks(self, event: Dict[str, Any]):
+        """Hand a stream event to the SOAR agent (built on the first event)"""
+        await self.agents['soar'].on_stream_event(event)
+    
+    async def _load_intent_classifier(self):
+        """Hand the master agent the trained routing model (NumPy is imported here, off the startup path)"""
+        try:
+            from core.intent_classifier import get_intent_classifier
+            self.master_agent.intent_classifier = await asyncio.to_thread(get_intent_classifier)
+        except Exception as e:
+            print(f"Intent classifier unavailable, routing by keyword: {e}")
+    
     async def _register_agents(self):
         """Register all agents in the database"""
         try:
-            agent_types = {
-                'master': 'Master Orchestrator',
-                'individual': 'Individual/UEBA Agent',
-                'organization': 'Organization Agent',
-                'transaction': 'Transaction Agent',
-                'supervisor': 'Supervisor Agent',
-                'threat_intel': 'Threat Intelligence Agent',
-                'soar': 'SOAR Agent'
-            }
-            
-            for agent_type, name in agent_types.items():
-                # Check if agent exists
-                result = self.supabase.table('agents').select('id').eq('agent_type', agent_type).execute()
-                
-                if not result.data:
-                    # Create agent record
-                    self.supabase.table('agents').insert({
-                        'agent_type': agent_type,
-                        'name': name,
-                        'status': 'active',
-                        'health_status': {'status': 'healthy'},
-                        'last_heartbeat': datetime.utcnow().isoformat(),
-                        'configuration': {},
-                        'performance_metrics': {}
-                    }).execute()
-                else:
-                    # Update heartbeat
-                    self.supabase.table('agents').update({
-                        'status': 'active',
-                        'last_heartbeat': datetime.utcnow().isoformat()
-                    }).eq('agent_type', agent_type).execute()
-                    
+            agent_types = {'master': 'Master Orchestrator', **self.agents.display_names()}
+            await asyncio.to_thread(self._upsert_agent_records, agent_types)
         except Exception as e:
             print(f"Error registering agents: {e}")
     
+    def _upsert_agent_records(self, agent_types: Dict[str, str]):
+        """One query for existing rows, then one insert and one update for the rest"""
+        now = datetime.utcnow().isoformat()
+        result = self.supabase.table('agents').select('agent_type').in_('agent_type', list(agent_types)).execute()
+        existing = {row['agent_type'] for row in result.data or []}
+        
+        missing = [
+            {
+                'agent_type': agent_type,
+                'name': name,
+                'status': 'active',
+                'health_status': {'status': 'healthy'},
+                'last_heartbeat': now,
+                'configuration': {},
+                'performance_metrics': {}
+            }
+            for agent_type, name in agent_types.items() if agent_type not in existing
+        ]
+        if missing:
+            self.supabase.table('agents').insert(missing).execute()
+        if existing:
+            self.supabase.table('agents').update({
+                'status': 'active',
+                'last_heartbeat': now
+            }).in_('agent_type', list(existing)).execute()
+    
     async def process_chat_message(self, message: str, user_id: str, session_id: str) -> Dict[str, Any]:
         """Process a chat message through the master agent"""
         if not self.master_agent:
@@ -104,27 +119,59 @@ class AgentOrchestrator:
         
         return await self.master_agent.process_message(message, user_id, session_id)
     
+    async def stream_chat_message(self, message: str, user_id: str, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream routing, progress and final updates for a chat message"""
+        if not self.master_agent:
+            raise RuntimeError("Master agent not initialized")
+        
+        async for update in self.master_agent.stream_message(message, user_id, session_id):
+            yield update
+    
     async def get_agent_status(self) -> Dict[str, Any]:
-        """Get status of all agents"""
+        """Probe all built agents concurrently and cache the result as the health snapshot"""
         status = {
             'orchestrator': self.status,
+            'checked_at': datetime.utcnow().isoformat(),
             'agents': {}
         }
         
-        for agent_type, agent in self.agents.items():
-            try:
-                agent_status = await agent.get_status() if hasattr(agent, 'get_status') else {'status': 'unknown'}
-                status['agents'][agent_type] = agent_status
-            except Exception as e:
-                status['agents'][agent_type] = {'status': 'error', 'error': str(e)}
+        probes = await probe_agents(dict(self.agents.items()))
+        circuits = self.master_agent.breakers.snapshot() if self.master_agent else {}
+        for agent_type in self.agents.known_types():
+            # Agents are built on first routing; not reported as down while idle
+            agent_status = probes.get(agent_type, {'status': 'not_loaded'})
+            if agent_type in circuits:
+                agent_status['circuit'] = circuits[agent_type]
+            status['agents'][agent_type] = agent_status
         
+        self.health_snapshot = status
         return status
     
+    async def get_cluster_status(self) -> Dict[str, Any]:
+        """
+        This worker's cached probe snapshot plus every live worker's, read from the
+        shared registry; no agent is probed on the request path once a snapshot exists
+        """
+        if self.health_snapshot is None:
+            await self.get_agent_status()
+        workers = await self.registry.read_all()
+        return {
+            'worker_id': self.registry.worker_id,
+            'local': self.health_snapshot,
+            'workers': workers,
+            'agents': summarize(workers)
+        }
+    
     async def shutdown(self):
         """Gracefully shutdown all agents"""
         print("Shutting down agents...")
         self.status = "shutting_down"
         
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        self._background = []
+        
         for agent_type, agent in self.agents.items():
             try:
                 if hasattr(agent, 'shutdown'):
@@ -132,6 +179,12 @@ class AgentOrchestrator:
             except Exception as e:
                 print(f"Error shutting down {agent_type} agent: {e}")
         
+        try:
+            from core.llm_gateway import close_llm_gateway
+            await close_llm_gateway()
+        except Exception as e:
+            print(f"Error closing LLM gateway: {e}")
+        
         # Update agent statuses in database
         try:
             self.supabase.table('agents').update({
@@ -0,0 +1,83 @@
+"""
+Agent Pool
+Agents are imported and constructed on first use rather than at startup
+"""
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+import importlib
+
+
+# agent type -> (module, class name, display name)
+AGENT_SPECS: Dict[str, Tuple[str, str, str]] = {
+    'individual': ('agents.individual_agent', 'IndividualAgent', 'Individual/UEBA Agent'),
+    'organization': ('agents.organization_agent', 'OrganizationAgent', 'Organization Agent'),
+    'transaction': ('agents.transaction_agent', 'TransactionAgent', 'Transaction Agent'),
+    'supervisor': ('agents.supervisor_agent', 'SupervisorAgent', 'Supervisor Agent'),
+    'threat_intel': ('agents.threat_intel_agent', 'ThreatIntelAgent', 'Threat Intelligence Agent'),
+    'soar': ('agents.soar_agent', 'SOARAgent', 'SOAR Agent'),
+}
+
+
+class AgentPool:
+    """
+    Mapping of agent type to agent that builds each agent the first time it is asked for.
+    Iteration (items/values) covers only agents built so far, so status reports and
+    shutdown never force an idle agent to load.
+    """
+
+    def __init__(self, specs: Optional[Dict[str, Tuple[str, str, str]]] = None,
+                 arguments: Optional[Dict[str, Callable[[], Tuple[Any, ...]]]] = None):
+        self.specs = dict(specs if specs is not None else AGENT_SPECS)
+        # agent type -> callable returning constructor arguments
+        self.arguments = arguments or {}
+        self._agents: Dict[str, Any] = {}
+
+    def get(self, agent_type: str, default: Any = None) -> Any:
+        """The agent for a type, constructing it on first use"""
+        agent = self._agents.get(agent_type)
+        if agent is not None:
+            return agent
+        spec = self.specs.get(agent_type)
+        if spec is None:
+            return default
+        module_name, class_name, _ = spec
+        agent_class = getattr(importlib.import_module(module_name), class_name)
+        args = self.arguments[agent_type]() if agent_type in self.arguments else ()
+        agent = agent_class(*args)
+        self._agents[agent_type] = agent
+        return agent
+
+    def __getitem__(self, agent_type: str) -> Any:
+        agent = self.get(agent_type)
+        if agent is None:
+            raise KeyError(agent_type)
+        return agent
+
+    def __setitem__(self, agent_type: str, agent: Any):
+        self._agents[agent_type] = agent
+
+    def __contains__(self, agent_type: object) -> bool:
+        return agent_type in self.specs or agent_type in self._agents
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._agents)
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def items(self):
+        return list(self._agents.items())
+
+    def values(self):
+        return list(self._agents.values())
+
+    def keys(self):
+        return list(self._agents.keys())
+
+    def known_types(self) -> List[str]:
+        return list(dict.fromkeys([*self.specs, *self._agents]))
+
+    def is_loaded(self, agent_type: str) -> bool:
+        return agent_type in self._agents
+
+    def display_names(self) -> Dict[str, str]:
+        return {agent_type: spec[2] for agent_type, spec in self.specs.items()}
@@ -0,0 +1,85 @@
+"""
+Agent Registry
+Each worker publishes its agents' status to one Redis hash so any worker can
+report the whole deployment in a single read
+"""
+from typing import Dict, Any, Awaitable, Callable
+from datetime import datetime, timezone
+import asyncio
+import json
+
+from core.leader import worker_id
+from core.redis_client import get_redis
+
+
+REGISTRY_KEY = 'cts:agents:registry'
+HEARTBEAT_SECONDS = 10
+# Entries not refreshed for this long belong to dead workers and are pruned on read
+STALE_AFTER_SECONDS = 35
+
+
+class AgentRegistry:
+    """Per-worker agent status snapshots keyed by worker id"""
+
+    def __init__(self):
+        self.worker_id = worker_id()
+        self._local: Dict[str, Any] = {}
+
+    async def publish(self, snapshot: Dict[str, Any]):
+        entry = {**snapshot, 'worker_id': self.worker_id, 'updated_at': datetime.now(timezone.utc).isoformat()}
+        self._local = entry
+        redis = await get_redis()
+        if redis is not None:
+            await redis.hset(REGISTRY_KEY, self.worker_id, json.dumps(entry, default=str))
+
+    async def remove(self):
+        redis = await get_redis()
+        if redis is not None:
+            await redis.hdel(REGISTRY_KEY, self.worker_id)
+
+    async def read_all(self) -> Dict[str, Dict[str, Any]]:
+        """Live worker snapshots; falls back to this worker's own when Redis is unavailable"""
+        redis = await get_redis()
+        if redis is None:
+            return {self.worker_id: self._local} if self._local else {}
+
+        now = datetime.now(timezone.utc)
+        workers, stale = {}, []
+        for worker, raw in (await redis.hgetall(REGISTRY_KEY)).items():
+            entry = json.loads(raw)
+            updated_at = datetime.fromisoformat(entry['updated_at'])
+            if (now - updated_at).total_seconds() > STALE_AFTER_SECONDS:
+                stale.append(worker)
+            else:
+                workers[worker] = entry
+        if stale:
+            await redis.hdel(REGISTRY_KEY, *stale)
+        return workers
+
+    async def run(self, snapshot: Callable[[], Awaitable[Dict[str, Any]]]):
+        """Publish this worker's snapshot every HEARTBEAT_SECONDS until cancelled"""
+        try:
+            while True:
+                try:
+                    await self.publish(await snapshot())
+                except Exception as e:
+                    print(f"Error publishing agent registry entry: {e}")
+                await asyncio.sleep(HEARTBEAT_SECONDS)
+        finally:
+            try:
+                await self.remove()
+            except Exception as e:
+                print(f"Error removing agent registry entry: {e}")
+
+
+def summarize(workers: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per agent type: worker count and how many report it active"""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for entry in workers.values():
+        for agent_type, status in (entry.get('agents') or {}).items():
+            item = summary.setdefault(agent_type, {'workers': 0, 'active': 0, 'statuses': {}})
+            item['workers'] += 1
+            state = status.get('status', 'unknown')
+            item['active'] += state == 'active'
+            item['statuses'][state] = item['statuses'].get(state, 0) + 1
+    return summary
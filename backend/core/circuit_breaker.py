@@ -0,0 +1,150 @@
+"""
+Circuit Breakers
+Per-agent breakers fed by the outcome and latency of real calls. An agent whose
+recent calls mostly fail or run slow is opened, so callers fail fast or reroute
+instead of queuing behind it; after a cool-down one trial call decides whether it closes.
+"""
+from typing import Dict, Any, Deque, Optional, Tuple
+from collections import deque
+import time
+
+from prometheus_client import Counter, Gauge
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Recent calls considered when deciding to open
+WINDOW_SIZE = 20
+# Need this many calls in the window before the rates mean anything
+MIN_CALLS = 5
+FAILURE_RATE_THRESHOLD = 0.5
+# Calls slower than this count as slow even when they succeed
+SLOW_CALL_SECONDS = 15.0
+SLOW_RATE_THRESHOLD = 0.5
+# How long an open breaker rejects calls before letting a trial call through
+RESET_TIMEOUT_SECONDS = 30.0
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = Gauge('agent_circuit_state', 'Circuit state per agent (0 closed, 1 half open, 2 open)', ['agent'])
+BREAKER_REJECTED = Counter('agent_circuit_rejected_total', 'Calls rejected by an open circuit', ['agent'])
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the agent's circuit is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} circuit is open; retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Rolling-window breaker for one agent"""
+
+    def __init__(self, name: str, window_size: int = WINDOW_SIZE, min_calls: int = MIN_CALLS,
+                 failure_rate: float = FAILURE_RATE_THRESHOLD, slow_call_seconds: float = SLOW_CALL_SECONDS,
+                 slow_rate: float = SLOW_RATE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT_SECONDS):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.trial_started: Optional[float] = None
+        # (succeeded, latency seconds) of recent calls
+        self.calls: Deque[Tuple[bool, float]] = deque(maxlen=window_size)
+        BREAKER_STATE.labels(name).set(0)
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; in half-open only one trial call at a time"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                BREAKER_REJECTED.labels(self.name).inc()
+                return False
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # A trial whose outcome never arrived is abandoned after one reset timeout
+            if self.trial_in_flight and time.monotonic() - self.trial_started < self.reset_timeout:
+                BREAKER_REJECTED.labels(self.name).inc()
+                return False
+            self.trial_in_flight = True
+            self.trial_started = time.monotonic()
+        return True
+
+    def retry_in(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record(self, succeeded: bool, latency: float):
+        """Feed the outcome of a call that allow() let through"""
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = False
+            if succeeded and latency < self.slow_call_seconds:
+                self.calls.clear()
+                self._set_state(CLOSED)
+            else:
+                self._open()
+            return
+
+        self.calls.append((succeeded, latency))
+        if self.state == CLOSED and len(self.calls) >= self.min_calls:
+            failure_rate, slow_rate = self._rates()
+            if failure_rate >= self.failure_rate or slow_rate >= self.slow_rate:
+                self._open()
+
+    def release_trial(self):
+        """Give back a half-open permit for a call that ended without an outcome (e.g. cancelled)"""
+        self.trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        failure_rate, slow_rate = self._rates()
+        latencies = [latency for _, latency in self.calls]
+        return {
+            'state': self.state,
+            'calls': len(self.calls),
+            'failure_rate': round(failure_rate, 3),
+            'slow_rate': round(slow_rate, 3),
+            'avg_latency_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            'retry_in_seconds': round(self.retry_in(), 1)
+        }
+
+    def _rates(self) -> Tuple[float, float]:
+        if not self.calls:
+            return 0.0, 0.0
+        failures = sum(1 for succeeded, _ in self.calls if not succeeded)
+        slow = sum(1 for _, latency in self.calls if latency >= self.slow_call_seconds)
+        return failures / len(self.calls), slow / len(self.calls)
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            print(f"Circuit for {self.name} agent: {self.state} -> {state}")
+        self.state = state
+        BREAKER_STATE.labels(self.name).set(_STATE_VALUES[state])
+
+
+class CircuitBreakers:
+    """One breaker per agent type, created on first use"""
+
+    def __init__(self, **options):
+        self.options = options
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers[name] = CircuitBreaker(name, **self.options)
+        return breaker
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.snapshot() for name, breaker in self.breakers.items()}
@@ -21,12 +21,33 @@ class Settings(BaseSettings):
     # OpenAI
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     
+    # LLM gateway (any OpenAI-compatible server; defaults to OpenAI when only the key is set)
+    llm_base_url: str = os.getenv("LLM_BASE_URL", "")
+    llm_model: str = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+    llm_timeout_seconds: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    llm_agent_max_concurrency: int = int(os.getenv("LLM_AGENT_MAX_CONCURRENCY", "4"))
+    llm_tokens_per_minute: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", "90000"))
+    llm_agent_tokens_per_minute: int = int(os.getenv("LLM_AGENT_TOKENS_PER_MINUTE", "30000"))
+    llm_cache_ttl_seconds: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+    
     # Redis
-    redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    redis_url: str = os.getenv("REDIS_URL", "")
     
     # Threat Intelligence
     virustotal_api_key: str = os.getenv("VIRUSTOTAL_API_KEY", "")
     alienvault_otx_api_key: str = os.getenv("ALIENVAULT_OTX_API_KEY", "")
+    virustotal_base_url: str = os.getenv("VIRUSTOTAL_BASE_URL", "https://www.virustotal.com/api/v3")
+    alienvault_otx_base_url: str = os.getenv("ALIENVAULT_OTX_BASE_URL", "https://otx.alienvault.com/api/v1")
+    virustotal_requests_per_minute: int = int(os.getenv("VIRUSTOTAL_REQUESTS_PER_MINUTE", "4"))
+    alienvault_otx_requests_per_minute: int = int(os.getenv("ALIENVAULT_OTX_REQUESTS_PER_MINUTE", "60"))
+    enrichment_cache_ttl_hours: int = int(os.getenv("ENRICHMENT_CACHE_TTL_HOURS", "24"))
+    
+    # SOAR enforcement endpoints
+    soar_firewall_url: str = os.getenv("SOAR_FIREWALL_URL", "")
+    soar_firewall_api_key: str = os.getenv("SOAR_FIREWALL_API_KEY", "")
+    soar_edr_url: str = os.getenv("SOAR_EDR_URL", "")
+    soar_edr_api_key: str = os.getenv("SOAR_EDR_API_KEY", "")
     
     # Sanctions Lists
     un_sanctions_url: str = os.getenv("UN_SANCTIONS_LIST_URL", "https://scsanctions.un.org/resources/xml/en/consolidated.xml")
@@ -36,6 +57,14 @@ class Settings(BaseSettings):
     jwt_secret: str = os.getenv("JWT_SECRET", "")
     encryption_key: str = os.getenv("ENCRYPTION_KEY", "")
     
+    # Chat session cache
+    session_cache_max_sessions: int = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "10000"))
+    session_cache_max_turns: int = int(os.getenv("SESSION_CACHE_MAX_TURNS", "50"))
+    session_cache_ttl_seconds: int = int(os.getenv("SESSION_CACHE_TTL_SECONDS", "3600"))
+    
+    # Admission control
+    admission_control_enabled: bool = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+    
     # Debug
     debug: bool = os.getenv("DEBUG", "false").lower() == "true"
     
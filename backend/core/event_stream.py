@@ -0,0 +1,283 @@
+"""
+Event Stream
+Pushes new threats, incidents and flagged transactions to subscribed clients.
+Events fan out through Redis pub/sub so every worker's clients see every event;
+each client has a bounded queue so a slow consumer never stalls the others.
+Server-side handlers (e.g. SOAR playbook triggers) run in whichever worker currently
+leads the poller and see each new row at least once: a leader that stops after publishing
+but before saving its watermarks leaves those rows to be published again by the next one.
+"""
+from typing import Dict, Any, Awaitable, Callable, Iterable, List, Optional, Set
+from collections import OrderedDict
+from datetime import datetime, timezone
+import asyncio
+import json
+import uuid
+
+from core.supabase_client import get_supabase_client, keyset_after
+from core.leader import LeaderElection
+from core.redis_client import get_redis
+from intelligence.risk_scoring import risk_level
+
+
+TOPICS = ('threats', 'incidents', 'transactions')
+CHANNEL_PREFIX = 'cts:events:'
+# Events buffered per client before the oldest are dropped
+CLIENT_QUEUE_SIZE = 256
+# How often new rows are looked for
+POLL_INTERVAL_SECONDS = 2.0
+# Rows read per topic per poll
+POLL_BATCH_SIZE = 500
+
+_WATERMARK_KEY = 'cts:events:watermarks'
+# Sorts before every real row id, for a watermark that has not seen a row yet
+_NIL_ID = '00000000-0000-0000-0000-000000000000'
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_SEVERITY_RANK = {'info': 0, 'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
+
+# topic -> (table, columns, watermark column)
+# Transactions are usually flagged after insert, so they are followed by flagged_at, which a
+# trigger sets only when a row becomes flagged; later writes to a flagged row are not republished
+_TOPIC_SOURCES = {
+    'threats': ('threats', 'id, threat_id, title, severity, threat_type, source, ioc_type, ioc_value, created_at',
+                'created_at'),
+    'incidents': ('incidents', 'id, incident_id, title, severity, status, threat_id, individual_id, organization_id, created_at',
+                  'created_at'),
+    'transactions': (
+        'transactions',
+        'id, transaction_id, individual_id, organization_id, amount, currency, status, risk_score, source_ip, '
+        'created_at, flagged_at',
+        'flagged_at'
+    ),
+}
+
+
+def make_event(topic: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    """Wrap a table row as a stream event"""
+    severity = row.get('severity')
+    if severity is None and row.get('risk_score') is not None:
+        severity = risk_level(float(row['risk_score']))
+    return {
+        'type': 'event',
+        'topic': topic,
+        'id': row.get('id'),
+        'severity': severity,
+        'data': row,
+        'at': datetime.now(timezone.utc).isoformat()
+    }
+
+
+class EventFilter:
+    """Per-client topic subscription with optional minimum severity and field equality filters"""
+
+    def __init__(self, topics: Optional[Iterable[str]] = None, min_severity: Optional[str] = None,
+                 fields: Optional[Dict[str, str]] = None):
+        requested = {t.strip() for t in topics or [] if t and t.strip()}
+        unknown = requested - set(TOPICS)
+        if unknown:
+            raise ValueError(f"Unknown topic(s): {', '.join(sorted(unknown))}")
+        if min_severity and min_severity not in _SEVERITY_RANK:
+            raise ValueError(f"Unknown severity '{min_severity}'")
+        self.topics: Set[str] = requested or set(TOPICS)
+        self.min_rank = _SEVERITY_RANK.get(min_severity, -1) if min_severity else -1
+        self.fields = {k: str(v).lower() for k, v in (fields or {}).items()}
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if event.get('topic') not in self.topics:
+            return False
+        if self.min_rank >= 0 and _SEVERITY_RANK.get(event.get('severity'), -1) < self.min_rank:
+            return False
+        data = event.get('data') or {}
+        return all(str(data.get(k, '')).lower() == v for k, v in self.fields.items())
+
+
+class Subscription:
+    """
+    Bounded per-client queue. An event for a row already queued replaces the queued
+    copy (coalesce); when full the oldest event is dropped and the client receives a
+    single overflow notice with drop counts per topic, so it knows to refetch.
+    """
+
+    def __init__(self, event_filter: EventFilter, max_size: int = CLIENT_QUEUE_SIZE):
+        self.id = uuid.uuid4().hex
+        self.filter = event_filter
+        self.max_size = max_size
+        self._queue: 'OrderedDict[Any, Dict[str, Any]]' = OrderedDict()
+        self._dropped: Dict[str, int] = {}
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def put(self, event: Dict[str, Any]):
+        """Queue without blocking the publisher"""
+        if self.closed:
+            return
+        key = (event.get('topic'), event.get('id')) if event.get('id') else uuid.uuid4().hex
+        if key in self._queue:
+            self._queue[key] = event
+        else:
+            if len(self._queue) >= self.max_size:
+                _, dropped = self._queue.popitem(last=False)
+                topic = dropped.get('topic', 'unknown')
+                self._dropped[topic] = self._dropped.get(topic, 0) + 1
+            self._queue[key] = event
+        self._ready.set()
+
+    async def get(self) -> Dict[str, Any]:
+        """Next event for the client; overflow notices are delivered before queued events"""
+        while not self._queue and not self._dropped:
+            if self.closed:
+                return {'type': 'closed'}
+            self._ready.clear()
+            await self._ready.wait()
+        if self._dropped:
+            dropped, self._dropped = self._dropped, {}
+            return {'type': 'overflow', 'dropped': dropped, 'at': datetime.now(timezone.utc).isoformat()}
+        _, event = self._queue.popitem(last=False)
+        return event
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+
+class EventStream:
+    """Process-wide hub: Redis fan-out in, bounded client queues out"""
+
+    def __init__(self):
+        self.redis = None
+        self.subscriptions: Dict[str, Subscription] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._watermarks: Dict[str, Dict[str, Any]] = {}
+        self.handlers: List[EventHandler] = []
+
+    async def start(self):
+        """Start the Redis listener (without Redis, events are delivered in-process) and the change poller"""
+        self.redis = await get_redis()
+        if self.redis is not None:
+            self._tasks.append(asyncio.create_task(self._listen()))
+        # Only the leader polls, so each row is published once however many workers run
+        self._tasks.append(asyncio.create_task(LeaderElection('event-poller').run(self._poll_changes)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for subscription in list(self.subscriptions.values()):
+            subscription.close()
+        self.subscriptions = {}
+        self.redis = None
+
+    def add_handler(self, handler: EventHandler):
+        """
+        Call handler with every new-row event. It runs on the polling leader only, and a row
+        can be delivered again after a leader change, so handlers must tolerate repeats.
+        """
+        self.handlers.append(handler)
+
+    def subscribe(self, event_filter: EventFilter) -> Subscription:
+        subscription = Subscription(event_filter)
+        self.subscriptions[subscription.id] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.close()
+        self.subscriptions.pop(subscription.id, None)
+
+    async def publish(self, event: Dict[str, Any]):
+        """Publish to every worker (through Redis) or, without Redis, to local clients"""
+        if self.redis is not None:
+            try:
+                await self.redis.publish(CHANNEL_PREFIX + event['topic'], json.dumps(event, default=str))
+                return
+            except Exception as e:
+                print(f"Error publishing event, delivering locally: {e}")
+        self._dispatch(event)
+
+    def _dispatch(self, event: Dict[str, Any]):
+        for subscription in list(self.subscriptions.values()):
+            if subscription.filter.matches(event):
+                subscription.put(event)
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                async for message in pubsub.listen():
+                    if message.get('type') == 'pmessage':
+                        self._dispatch(json.loads(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Event stream listener error: {e}")
+                await asyncio.sleep(1)
+
+    async def _poll_changes(self):
+        """
+        Read rows created (or, for transactions, flagged) since the last poll and publish them.
+        Watermarks live in Redis so a new leader continues where the last one stopped.
+        """
+        supabase = get_supabase_client()
+        while True:
+            try:
+                await self._load_watermarks()
+                for topic in TOPICS:
+                    rows = await asyncio.to_thread(self._new_rows, supabase, topic)
+                    for row in rows:
+                        event = make_event(topic, row)
+                        await self.publish(event)
+                        await self._run_handlers(event)
+                await self._save_watermarks()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Event stream poller error: {e}")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    async def _run_handlers(self, event: Dict[str, Any]):
+        for handler in self.handlers:
+            try:
+                await handler(event)
+            except Exception as e:
+                print(f"Error in event handler for {event['topic']} {event.get('id')}: {e}")
+
+    async def _load_watermarks(self):
+        if self.redis is not None:
+            stored = await self.redis.get(_WATERMARK_KEY)
+            if stored:
+                self._watermarks = json.loads(stored)
+        now = datetime.now(timezone.utc).isoformat()
+        for topic in TOPICS:
+            # Start from now rather than replaying history
+            mark = self._watermarks.get(topic) or {}
+            self._watermarks[topic] = {'at': mark.get('at') or mark.get('created_at') or now,
+                                       'id': mark.get('id') or _NIL_ID}
+
+    async def _save_watermarks(self):
+        if self.redis is not None:
+            await self.redis.set(_WATERMARK_KEY, json.dumps(self._watermarks))
+
+    def _new_rows(self, supabase, topic: str) -> List[Dict[str, Any]]:
+        """Rows after the topic's (timestamp, id) watermark, oldest first"""
+        table, columns, column = _TOPIC_SOURCES[topic]
+        mark = self._watermarks[topic]
+        query = keyset_after(supabase.table(table).select(columns), column, mark['at'], mark['id'])
+        rows = query.order(column).order('id').limit(POLL_BATCH_SIZE).execute().data or []
+        if rows:
+            self._watermarks[topic] = {'at': rows[-1][column], 'id': rows[-1]['id']}
+        return rows
+
+
+_event_stream: Optional[EventStream] = None
+
+
+def get_event_stream() -> EventStream:
+    """Get or create the process-wide event stream"""
+    global _event_stream
+
+    if _event_stream is None:
+        _event_stream = EventStream()
+
+    return _event_stream
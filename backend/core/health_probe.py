@@ -0,0 +1,32 @@
+"""
+Health Probes
+Concurrent agent status probes with a deadline, so one hung agent cannot stall a report
+"""
+from typing import Dict, Any
+import asyncio
+import time
+
+
+PROBE_TIMEOUT_SECONDS = 2.0
+
+
+async def probe_agent(agent: Any, timeout: float = PROBE_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """An agent's status plus probe latency; timeouts and errors are reported, not raised"""
+    started = time.perf_counter()
+    try:
+        if hasattr(agent, 'get_status'):
+            status = await asyncio.wait_for(agent.get_status(), timeout=timeout)
+        else:
+            status = {'status': 'unknown'}
+    except asyncio.TimeoutError:
+        status = {'status': 'timeout', 'error': f"No status within {timeout:.1f}s"}
+    except Exception as e:
+        status = {'status': 'error', 'error': str(e)}
+    return {**status, 'probe_latency_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+async def probe_agents(agents: Dict[str, Any], timeout: float = PROBE_TIMEOUT_SECONDS) -> Dict[str, Dict[str, Any]]:
+    """Probe every agent at once; the whole report takes at most about one timeout"""
+    items = list(agents.items())
+    results = await asyncio.gather(*(probe_agent(agent, timeout) for _, agent in items))
+    return {agent_type: result for (agent_type, _), result in zip(items, results)}
@@ -0,0 +1,350 @@
+"""
+Intent Classifier
+Routes chat messages to agents with a linear model over hashed word, word-pair and
+character trigram features. Trained offline from data/routing_examples.jsonl into
+data/intent_model.npz; probabilities are calibrated by a temperature fitted on
+held-out examples.
+
+    python -m core.intent_classifier train
+    python -m core.intent_classifier eval
+"""
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from collections import Counter
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+import zlib
+
+import numpy as np
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+EXAMPLES_PATH = os.path.join(DATA_DIR, 'routing_examples.jsonl')
+MODEL_PATH = os.path.join(DATA_DIR, 'intent_model.npz')
+
+# Hashed feature space; a power of two so the hash is masked rather than reduced
+N_FEATURES = 2 ** 14
+L2_PENALTY = 1e-4
+LEARNING_RATE = 5.0
+EPOCHS = 1500
+# Share of examples held out to fit the calibration temperature
+CALIBRATION_SHARE = 0.2
+TEMPERATURES = np.geomspace(0.05, 20.0, 200)
+
+_WORD = re.compile(r"[a-z0-9_$]+(?:[.@'/:-][a-z0-9_]+)*")
+# Message shapes that carry more signal than the literal token
+_SHAPES = [
+    ('ip', re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}\b")),
+    ('hash', re.compile(r"\b[a-f0-9]{32}\b|\b[a-f0-9]{40}\b|\b[a-f0-9]{64}\b")),
+    ('email', re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b")),
+    ('url', re.compile(r"https?://|\bwww\.")),
+    ('domain', re.compile(r"\b[a-z0-9-]+\.(?:com|net|org|io|ru|cn|info|biz|xyz)\b")),
+    ('txn', re.compile(r"\btxn_\w+")),
+    ('amount', re.compile(r"[$€£]\s?\d|\b\d[\d,]*\s?(?:dollars|usd|eur)\b")),
+]
+
+# Domain vocabulary per agent; each hit adds to one per-label feature, which lets a
+# few labelled examples generalise to messages that share no other words
+ROUTING_LEXICON = {
+    'individual': ['user', 'person', 'people', 'employee', 'staff', 'individual', 'account', 'login', 'logged',
+                   'sign', 'credential', 'mfa', 'insider', 'behavio', 'ueba', 'who '],
+    'organization': ['compan', 'organi', 'network', 'infrastructure', 'vulnerab', 'cve', 'scan', 'patch', 'posture',
+                     'exposure', 'attack surface', 'server', 'host', 'port', 'vendor', 'supplier', 'subnet',
+                     'firewall rule', 'traffic'],
+    'transaction': ['transaction', 'payment', 'pay', 'fraud', 'money', 'transfer', 'financial', 'purchase', 'card',
+                    'deposit', 'withdraw', 'refund', 'merchant', 'wire', 'aml', 'invoice', 'txn'],
+    'threat_intel': ['threat', 'malware', 'ransomware', 'indicator', 'ioc', 'sanction', 'ofac', 'reputation',
+                     'malicious', 'enrich', 'actor', 'apt', 'campaign', 'feed', 'phishing', 'hash', 'blacklist',
+                     'botnet', 'c2'],
+    'soar': ['automat', 'playbook', 'workflow', 'respon', 'contain', 'block', 'quarantin', 'isolat', 'remediat',
+             'runbook', 'orchestrat', 'incident', 'escalat', 'notify', 'lockout', 'disable'],
+    'supervisor': ['agent', 'health', 'status', 'performance', 'integrity', 'uptime', 'latency', 'heartbeat',
+                   'platform', 'system', 'cluster', 'worker', 'slow', 'cpu', 'memory', 'circuit'],
+}
+# A lexicon hit counts as this many occurrences of an ordinary feature
+LEXICON_WEIGHT = 3
+
+
+def _hash(feature: str) -> int:
+    # crc32 rather than hash(): stable across processes, so a saved model stays valid
+    return zlib.crc32(feature.encode()) & (N_FEATURES - 1)
+
+
+def featurize(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed feature indices and L2-normalised log-count values for one message"""
+    text = text.lower()
+    words = _WORD.findall(text)
+    features = ['w:' + word for word in words]
+    features += ['b:' + a + ' ' + b for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features += ['c:' + padded[i:i + 3] for i in range(len(padded) - 2)]
+    features += ['s:' + shape for shape, pattern in _SHAPES if pattern.search(text)]
+
+    counts = Counter(_hash(feature) for feature in features)
+    for label, stems in ROUTING_LEXICON.items():
+        hits = sum(1 for stem in stems if stem in text)
+        if hits:
+            counts[_hash('k:' + label)] += hits * LEXICON_WEIGHT
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return indices, values / np.linalg.norm(values)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class IntentClassifier:
+    """Multinomial logistic regression over hashed features"""
+
+    def __init__(self, labels: Sequence[str], weights: np.ndarray, bias: np.ndarray, temperature: float = 1.0):
+        self.labels = list(labels)
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.temperature = float(temperature)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> 'IntentClassifier':
+        with np.load(path, allow_pickle=False) as model:
+            if int(model['n_features']) != N_FEATURES:
+                raise ValueError(f"Model has {int(model['n_features'])} features, expected {N_FEATURES}; retrain it")
+            return cls(model['labels'].tolist(), model['weights'], model['bias'], float(model['temperature']))
+
+    def save(self, path: str = MODEL_PATH):
+        np.savez_compressed(
+            path, labels=np.array(self.labels), weights=self.weights, bias=self.bias,
+            temperature=np.float32(self.temperature), n_features=np.int64(N_FEATURES)
+        )
+
+    def logits(self, texts: Sequence[str]) -> np.ndarray:
+        """Uncalibrated scores for a batch, one row per message"""
+        rows, all_indices, all_values = [], [], []
+        for row, text in enumerate(texts):
+            indices, values = featurize(text)
+            rows.append(np.full(len(indices), row))
+            all_indices.append(indices)
+            all_values.append(values)
+        if not texts:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+
+        row_ids = np.concatenate(rows)
+        contributions = self.weights[np.concatenate(all_indices)] * np.concatenate(all_values)[:, None]
+        scores = np.stack([
+            np.bincount(row_ids, weights=contributions[:, k], minlength=len(texts))
+            for k in range(len(self.labels))
+        ], axis=1)
+        return scores + self.bias
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        return _softmax(self.logits(texts) / self.temperature)
+
+    def classify(self, text: str) -> Dict[str, Any]:
+        """Best label for one message, its calibrated probability and the full distribution"""
+        indices, values = featurize(text)
+        logits = values @ self.weights[indices] + self.bias
+        return self._result(_softmax(logits / self.temperature))
+
+    def classify_batch(self, texts: Sequence[str]) -> List[Dict[str, Any]]:
+        return [self._result(probabilities) for probabilities in self.predict_proba(texts)]
+
+    def _result(self, probabilities: np.ndarray) -> Dict[str, Any]:
+        best = int(probabilities.argmax())
+        return {
+            'label': self.labels[best],
+            'confidence': float(probabilities[best]),
+            'probabilities': {label: float(p) for label, p in zip(self.labels, probabilities)}
+        }
+
+
+def load_examples(path: str = EXAMPLES_PATH) -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                example = json.loads(line)
+                texts.append(example['text'])
+                labels.append(example['label'])
+    return texts, labels
+
+
+def _design_matrix(texts: Sequence[str]) -> np.ndarray:
+    X = np.zeros((len(texts), N_FEATURES), dtype=np.float32)
+    for row, text in enumerate(texts):
+        indices, values = featurize(text)
+        X[row, indices] = values
+    return X
+
+
+def _fit(X: np.ndarray, y: np.ndarray, n_labels: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Full-batch gradient descent on the L2-penalised cross-entropy"""
+    # Only hashed columns that occur can get non-zero weights; train on those alone
+    used = np.flatnonzero(X.any(axis=0))
+    X_used = X[:, used]
+    weights_used = np.zeros((len(used), n_labels), dtype=np.float32)
+    bias = np.zeros(n_labels, dtype=np.float32)
+    targets = np.eye(n_labels, dtype=np.float32)[y]
+    for _ in range(EPOCHS):
+        error = (_softmax(X_used @ weights_used + bias) - targets) / len(X)
+        weights_used -= LEARNING_RATE * (X_used.T @ error + L2_PENALTY * weights_used)
+        bias -= LEARNING_RATE * error.sum(axis=0)
+
+    weights = np.zeros((X.shape[1], n_labels), dtype=np.float32)
+    weights[used] = weights_used
+    return weights, bias
+
+
+def _fit_temperature(logits: np.ndarray, y: np.ndarray) -> float:
+    """Temperature minimising held-out negative log-likelihood"""
+    best, best_nll = 1.0, math.inf
+    for temperature in TEMPERATURES:
+        probabilities = _softmax(logits / temperature)
+        nll = -np.log(probabilities[np.arange(len(y)), y] + 1e-12).mean()
+        if nll < best_nll:
+            best, best_nll = float(temperature), nll
+    return best
+
+
+def _stratified_split(y: np.ndarray, share: float, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    held_out = []
+    for label in np.unique(y):
+        members = rng.permutation(np.flatnonzero(y == label))
+        held_out.extend(members[:max(1, int(len(members) * share))])
+    held = np.zeros(len(y), dtype=bool)
+    held[held_out] = True
+    return np.flatnonzero(~held), np.flatnonzero(held)
+
+
+def train(texts: Sequence[str], labels: Sequence[str], seed: int = 0) -> IntentClassifier:
+    """Fit the temperature on a held-out split, then the weights on every example"""
+    label_names = sorted(set(labels))
+    y = np.array([label_names.index(label) for label in labels])
+    X = _design_matrix(texts)
+
+    fit_rows, calibration_rows = _stratified_split(y, CALIBRATION_SHARE, seed)
+    weights, bias = _fit(X[fit_rows], y[fit_rows], len(label_names))
+    temperature = _fit_temperature(X[calibration_rows] @ weights + bias, y[calibration_rows])
+
+    weights, bias = _fit(X, y, len(label_names))
+    return IntentClassifier(label_names, weights, bias, temperature)
+
+
+def expected_calibration_error(confidences: np.ndarray, correct: np.ndarray, bins: int = 10) -> float:
+    """Mean gap between confidence and accuracy across confidence bins, weighted by bin size"""
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    error = 0.0
+    for low, high in zip(edges[:-1], edges[1:]):
+        in_bin = (confidences > low) & (confidences <= high)
+        if in_bin.any():
+            error += in_bin.mean() * abs(confidences[in_bin].mean() - correct[in_bin].mean())
+    return float(error)
+
+
+def evaluate(texts: Sequence[str], labels: Sequence[str], folds: int = 5, seed: int = 0) -> Dict[str, Any]:
+    """Stratified k-fold accuracy and calibration, plus latency of a model trained on everything"""
+    texts, labels = list(texts), list(labels)
+    label_names = sorted(set(labels))
+    y = np.array([label_names.index(label) for label in labels])
+    rng = np.random.default_rng(seed)
+    fold_of = np.zeros(len(y), dtype=int)
+    for label in range(len(label_names)):
+        members = rng.permutation(np.flatnonzero(y == label))
+        fold_of[members] = np.arange(len(members)) % folds
+
+    confidences, correct, predicted = np.zeros(len(y)), np.zeros(len(y)), np.zeros(len(y), dtype=int)
+    for fold in range(folds):
+        train_rows, test_rows = np.flatnonzero(fold_of != fold), np.flatnonzero(fold_of == fold)
+        model = train([texts[i] for i in train_rows], [labels[i] for i in train_rows], seed=seed + fold)
+        probabilities = model.predict_proba([texts[i] for i in test_rows])
+        # Fold models see every label, so their label order matches label_names
+        predicted[test_rows] = probabilities.argmax(axis=1)
+        confidences[test_rows] = probabilities.max(axis=1)
+    correct = (predicted == y).astype(float)
+
+    per_label = {name: float(correct[y == k].mean()) for k, name in enumerate(label_names)}
+
+    model = train(texts, labels, seed=seed)
+    model.classify(texts[0])
+    single = []
+    for _ in range(5):
+        for text in texts:
+            started = time.perf_counter()
+            model.classify(text)
+            single.append(time.perf_counter() - started)
+    single.sort()
+    started = time.perf_counter()
+    model.classify_batch(texts * 5)
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        'examples': len(texts),
+        'folds': folds,
+        'accuracy': float(correct.mean()),
+        'per_label_accuracy': per_label,
+        'mean_confidence': float(confidences.mean()),
+        'expected_calibration_error': expected_calibration_error(confidences, correct),
+        'temperature': model.temperature,
+        'latency_p50_us': single[len(single) // 2] * 1e6,
+        'latency_p99_us': single[int(len(single) * 0.99)] * 1e6,
+        'batch_messages_per_second': len(texts) * 5 / batch_seconds,
+    }
+
+
+_intent_classifier: Optional[IntentClassifier] = None
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """Get the process-wide classifier, loading the trained model on first use"""
+    global _intent_classifier
+
+    if _intent_classifier is None:
+        _intent_classifier = IntentClassifier.load()
+    return _intent_classifier
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Train or evaluate the chat routing classifier')
+    parser.add_argument('command', choices=['train', 'eval'])
+    parser.add_argument('--examples', default=EXAMPLES_PATH)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--min-accuracy', type=float, default=0.85,
+                        help='eval exits non-zero below this cross-validated accuracy')
+    parser.add_argument('--max-latency-us', type=float, default=1000.0,
+                        help='eval exits non-zero if p99 single-message latency exceeds this')
+    args = parser.parse_args(argv)
+
+    texts, labels = load_examples(args.examples)
+    if args.command == 'train':
+        model = train(texts, labels)
+        model.save(args.model)
+        print(f"Trained on {len(texts)} examples ({len(model.labels)} labels), "
+              f"temperature {model.temperature:.2f}; saved to {args.model}")
+        return 0
+
+    report = evaluate(texts, labels, folds=args.folds)
+    print(f"{report['folds']}-fold accuracy over {report['examples']} examples: {report['accuracy']:.3f}")
+    for label, accuracy in report['per_label_accuracy'].items():
+        print(f"  {label:<14} {accuracy:.3f}")
+    print(f"mean confidence {report['mean_confidence']:.3f}, "
+          f"expected calibration error {report['expected_calibration_error']:.3f}")
+    print(f"single message: p50 {report['latency_p50_us']:.0f}us, p99 {report['latency_p99_us']:.0f}us")
+    print(f"batch: {report['batch_messages_per_second']:.0f} messages/s")
+
+    failed = report['accuracy'] < args.min_accuracy or report['latency_p99_us'] > args.max_latency_us
+    if failed:
+        print("FAIL accuracy or latency outside the budget")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
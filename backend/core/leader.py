@@ -0,0 +1,102 @@
+"""
+Leader Election
+Redis lease so singleton background duties run in exactly one worker, with failover
+within a lease TTL when that worker dies
+"""
+from typing import Awaitable, Callable, Optional
+import asyncio
+import os
+import socket
+import uuid
+
+from core.config import settings
+from core.redis_client import get_redis
+
+
+LEASE_TTL_SECONDS = 6.0
+# Leaders renew and followers campaign at this interval
+RENEW_INTERVAL_SECONDS = 2.0
+
+# Only the holder may renew or release its lease
+_RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+_RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+def worker_id() -> str:
+    """Identity of this worker process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderElection:
+    """
+    Campaign for a named lease. Without Redis configured the single process is always
+    leader; with Redis configured but unreachable no worker leads until it is back.
+    """
+
+    def __init__(self, name: str, ttl: float = LEASE_TTL_SECONDS, renew_interval: float = RENEW_INTERVAL_SECONDS):
+        self.name = name
+        self.key = f"cts:leader:{name}"
+        self.holder_id = f"{worker_id()}:{uuid.uuid4().hex[:8]}"
+        self.ttl_ms = int(ttl * 1000)
+        self.renew_interval = renew_interval
+        self.is_leader = False
+        self._warned = False
+
+    async def try_acquire(self) -> bool:
+        """Take the lease if free, or renew it if held; returns whether this worker leads"""
+        redis = await get_redis()
+        if redis is None:
+            # Other workers may share this Redis, so a worker that cannot reach it must not lead
+            self.is_leader = not settings.redis_url
+            if not self.is_leader and not self._warned:
+                print(f"Warning: REDIS_URL is set but Redis is unreachable; {self.name} will not run "
+                      f"until it is back (unset REDIS_URL to run a single worker without Redis)")
+                self._warned = True
+            return self.is_leader
+        self._warned = False
+        if self.is_leader:
+            self.is_leader = bool(await redis.eval(_RENEW, 1, self.key, self.holder_id, self.ttl_ms))
+        if not self.is_leader:
+            self.is_leader = bool(await redis.set(self.key, self.holder_id, nx=True, px=self.ttl_ms))
+        return self.is_leader
+
+    async def release(self):
+        redis = await get_redis()
+        if redis is not None and self.is_leader:
+            await redis.eval(_RELEASE, 1, self.key, self.holder_id)
+        self.is_leader = False
+
+    async def current_leader(self) -> Optional[str]:
+        redis = await get_redis()
+        if redis is None:
+            return None if settings.redis_url else self.holder_id
+        return await redis.get(self.key)
+
+    async def run(self, duty: Callable[[], Awaitable[None]]):
+        """Campaign until cancelled, running duty only while this worker holds the lease"""
+        task: Optional[asyncio.Task] = None
+        try:
+            while True:
+                try:
+                    leader = await self.try_acquire()
+                except Exception as e:
+                    # Cannot prove we still hold the lease; step down
+                    print(f"Leader election error for {self.name}: {e}")
+                    self.is_leader = leader = False
+
+                if leader and (task is None or task.done()):
+                    print(f"{self.holder_id} leads {self.name}")
+                    task = asyncio.create_task(duty())
+                elif not leader and task is not None and not task.done():
+                    print(f"{self.holder_id} lost the {self.name} lease")
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                await asyncio.sleep(self.renew_interval)
+        finally:
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            try:
+                await self.release()
+            except Exception as e:
+                print(f"Error releasing {self.name} lease: {e}")
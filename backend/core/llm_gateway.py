@@ -0,0 +1,376 @@
+"""
+LLM Gateway
+Single path from agents to a chat-completions model. Results are cached by a hash of
+the normalized prompt and context, identical in-flight prompts share one model call,
+and concurrency and token rate are limited globally and per agent. Any
+OpenAI-compatible server works, including the local stub in this module:
+
+    python -m core.llm_gateway stub --port 8099      # LLM_BASE_URL=http://127.0.0.1:8099/v1
+"""
+from typing import Dict, Any, AsyncIterator, List, Optional
+from collections import OrderedDict
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+import httpx
+from prometheus_client import Counter, Histogram
+
+from core.config import settings
+from core.redis_client import get_redis
+from intelligence.enrichment import TokenBucket
+
+
+OPENAI_BASE_URL = 'https://api.openai.com/v1'
+MEMORY_CACHE_SIZE = 2048
+_REDIS_PREFIX = 'cts:llm:'
+
+LLM_REQUESTS = Counter('llm_requests_total', 'LLM gateway requests by how they were served', ['agent', 'outcome'])
+LLM_TOKENS = Counter('llm_tokens_total', 'Tokens consumed by model calls', ['agent'])
+LLM_LATENCY = Histogram(
+    'llm_call_seconds', 'Model call latency', ['agent'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so trivially different prompts share a cache entry"""
+    return _WHITESPACE.sub(' ', prompt).strip()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for rate limiting before usage is known"""
+    return max(1, len(text) // 4)
+
+
+class LLMBackend:
+    """OpenAI-compatible chat completions over HTTP"""
+
+    def __init__(self, base_url: str, api_key: str = '', model: str = 'gpt-3.5-turbo', timeout: float = 60.0):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            headers = {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+            self._client = httpx.AsyncClient(base_url=self.base_url, headers=headers, timeout=self.timeout)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def complete(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> Dict[str, Any]:
+        response = await self._http().post('/chat/completions', json={
+            'model': self.model, 'messages': messages, 'max_tokens': max_tokens, 'temperature': temperature
+        })
+        response.raise_for_status()
+        payload = response.json()
+        return {
+            'text': payload['choices'][0]['message']['content'] or '',
+            'usage': payload.get('usage') or {}
+        }
+
+    async def stream(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        body = {'model': self.model, 'messages': messages, 'max_tokens': max_tokens,
+                'temperature': temperature, 'stream': True}
+        async with self._http().stream('POST', '/chat/completions', json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                delta = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                if delta:
+                    yield delta
+
+
+class LLMGateway:
+    """Cached, coalesced and rate-limited access to one model backend"""
+
+    def __init__(self, backend: Optional[LLMBackend] = None,
+                 max_concurrency: int = settings.llm_max_concurrency,
+                 agent_max_concurrency: int = settings.llm_agent_max_concurrency,
+                 tokens_per_minute: int = settings.llm_tokens_per_minute,
+                 agent_tokens_per_minute: int = settings.llm_agent_tokens_per_minute,
+                 cache_ttl_seconds: int = settings.llm_cache_ttl_seconds):
+        self.backend = backend
+        self.agent_max_concurrency = agent_max_concurrency
+        self.agent_tokens_per_minute = agent_tokens_per_minute
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tokens = TokenBucket.per_minute(tokens_per_minute)
+        self._agent_slots: Dict[str, asyncio.Semaphore] = {}
+        self._agent_tokens: Dict[str, TokenBucket] = {}
+        self._memory: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.stats = {'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'model_calls': 0, 'errors': 0, 'tokens': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+    async def complete(self, agent: str, prompt: str, context: Optional[Dict[str, Any]] = None,
+                       system: str = '', max_tokens: int = 512, temperature: float = 0.0,
+                       cache: bool = True) -> Dict[str, Any]:
+        """
+        Completion for a prompt and its context. Only deterministic (temperature 0)
+        requests are cached and coalesced; cache=False opts out.
+        """
+        if self.backend is None:
+            raise RuntimeError("No LLM backend configured")
+        self.stats['requests'] += 1
+        messages = self._messages(prompt, context, system)
+        key = self._key(messages, max_tokens, temperature)
+        cacheable = cache and temperature == 0
+
+        if cacheable:
+            cached = await self._cache_get(key)
+            if cached is not None:
+                self.stats['cache_hits'] += 1
+                LLM_REQUESTS.labels(agent, 'cache_hit').inc()
+                return {'text': cached, 'cached': True, 'coalesced': False}
+
+            task = self._in_flight.get(key)
+            if task is not None:
+                # Identical prompt already on its way to the model; share its answer
+                self.stats['coalesced'] += 1
+                LLM_REQUESTS.labels(agent, 'coalesced').inc()
+                result = await asyncio.shield(task)
+                return {**result, 'cached': False, 'coalesced': True}
+
+        # Shielded so the answer is still cached (and shared) if the first caller goes away
+        task = asyncio.create_task(self._call(agent, messages, max_tokens, temperature, key if cacheable else None))
+        if cacheable:
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        result = await asyncio.shield(task)
+        return {**result, 'cached': False, 'coalesced': False}
+
+    async def stream(self, agent: str, prompt: str, context: Optional[Dict[str, Any]] = None,
+                     system: str = '', max_tokens: int = 512, temperature: float = 0.0,
+                     cache: bool = True) -> AsyncIterator[str]:
+        """Completion as text chunks; a cache hit arrives as one chunk, a fresh answer is cached once complete"""
+        if self.backend is None:
+            raise RuntimeError("No LLM backend configured")
+        self.stats['requests'] += 1
+        messages = self._messages(prompt, context, system)
+        key = self._key(messages, max_tokens, temperature)
+        cacheable = cache and temperature == 0
+
+        if cacheable:
+            cached = await self._cache_get(key)
+            if cached is not None:
+                self.stats['cache_hits'] += 1
+                LLM_REQUESTS.labels(agent, 'cache_hit').inc()
+                yield cached
+                return
+
+        estimate = self._estimate(messages, max_tokens)
+        await self._acquire_tokens(agent, estimate)
+        parts: List[str] = []
+        started = time.perf_counter()
+        async with self._agent_slot(agent), self._slots:
+            try:
+                async for chunk in self.backend.stream(messages, max_tokens, temperature):
+                    parts.append(chunk)
+                    yield chunk
+            except Exception:
+                self.stats['errors'] += 1
+                LLM_REQUESTS.labels(agent, 'error').inc()
+                raise
+        text = ''.join(parts)
+        self._record_call(agent, started, estimate, estimate - max_tokens + estimate_tokens(text))
+        if cacheable:
+            await self._cache_put(key, text)
+
+    async def _call(self, agent: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float,
+                    cache_key: Optional[str] = None) -> Dict[str, Any]:
+        estimate = self._estimate(messages, max_tokens)
+        # Rate first, so a request waiting on tokens does not hold a concurrency slot
+        await self._acquire_tokens(agent, estimate)
+        started = time.perf_counter()
+        async with self._agent_slot(agent), self._slots:
+            try:
+                result = await self.backend.complete(messages, max_tokens, temperature)
+            except Exception:
+                self.stats['errors'] += 1
+                LLM_REQUESTS.labels(agent, 'error').inc()
+                raise
+        used = result['usage'].get('total_tokens') or estimate - max_tokens + estimate_tokens(result['text'])
+        self._record_call(agent, started, estimate, used)
+        if cache_key is not None:
+            await self._cache_put(cache_key, result['text'])
+        return {'text': result['text'], 'usage': result['usage']}
+
+    def _record_call(self, agent: str, started: float, estimate: int, used: int):
+        self.stats['model_calls'] += 1
+        self.stats['tokens'] += used
+        LLM_REQUESTS.labels(agent, 'model').inc()
+        LLM_TOKENS.labels(agent).inc(used)
+        LLM_LATENCY.labels(agent).observe(time.perf_counter() - started)
+        # Settle the estimate against real usage: refund what was not used, charge any overrun
+        for bucket in (self._tokens, self._agent_bucket(agent)):
+            bucket.tokens = min(bucket.capacity, bucket.tokens + estimate - used)
+
+    async def _acquire_tokens(self, agent: str, estimate: int):
+        for bucket in (self._agent_bucket(agent), self._tokens):
+            await bucket.acquire(min(estimate, bucket.capacity))
+
+    def _agent_slot(self, agent: str) -> asyncio.Semaphore:
+        if agent not in self._agent_slots:
+            self._agent_slots[agent] = asyncio.Semaphore(self.agent_max_concurrency)
+        return self._agent_slots[agent]
+
+    def _agent_bucket(self, agent: str) -> TokenBucket:
+        if agent not in self._agent_tokens:
+            self._agent_tokens[agent] = TokenBucket.per_minute(self.agent_tokens_per_minute)
+        return self._agent_tokens[agent]
+
+    def _messages(self, prompt: str, context: Optional[Dict[str, Any]], system: str) -> List[Dict[str, str]]:
+        content = normalize_prompt(prompt)
+        if context:
+            content = f"Context:\n{json.dumps(context, sort_keys=True, default=str)}\n\n{content}"
+        messages = [{'role': 'system', 'content': normalize_prompt(system)}] if system else []
+        return messages + [{'role': 'user', 'content': content}]
+
+    def _key(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> str:
+        model = self.backend.model if self.backend is not None else ''
+        body = json.dumps([model, messages, max_tokens, temperature], sort_keys=True)
+        return hashlib.sha256(body.encode()).hexdigest()
+
+    def _estimate(self, messages: List[Dict[str, str]], max_tokens: int) -> int:
+        return sum(estimate_tokens(m['content']) for m in messages) + max_tokens
+
+    async def _cache_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires, text = entry
+            if expires > time.monotonic():
+                self._memory.move_to_end(key)
+                return text
+            del self._memory[key]
+
+        redis = await get_redis()
+        if redis is None:
+            return None
+        try:
+            text = await redis.get(_REDIS_PREFIX + key)
+        except Exception as e:
+            print(f"Error reading LLM cache: {e}")
+            return None
+        if text is not None:
+            self._remember(key, text)
+        return text
+
+    async def _cache_put(self, key: str, text: str):
+        self._remember(key, text)
+        redis = await get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.set(_REDIS_PREFIX + key, text, ex=self.cache_ttl_seconds)
+        except Exception as e:
+            print(f"Error writing LLM cache: {e}")
+
+    def _remember(self, key: str, text: str):
+        self._memory[key] = (time.monotonic() + self.cache_ttl_seconds, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > MEMORY_CACHE_SIZE:
+            self._memory.popitem(last=False)
+
+
+def default_backend() -> Optional[LLMBackend]:
+    """Backend from settings; None when neither an API key nor a base URL is configured"""
+    if not settings.llm_base_url and not settings.openai_api_key:
+        return None
+    return LLMBackend(settings.llm_base_url or OPENAI_BASE_URL, settings.openai_api_key,
+                      settings.llm_model, settings.llm_timeout_seconds)
+
+
+_llm_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Get the process-wide LLM gateway"""
+    global _llm_gateway
+
+    if _llm_gateway is None:
+        _llm_gateway = LLMGateway(default_backend())
+    return _llm_gateway
+
+
+async def close_llm_gateway():
+    global _llm_gateway
+
+    if _llm_gateway is not None:
+        await _llm_gateway.close()
+        _llm_gateway = None
+
+
+def create_stub_app(latency: float = 0.2):
+    """
+    Minimal OpenAI-compatible chat completions server for tests and local runs.
+    Answers deterministically from the last user message after `latency` seconds.
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI(title='Stub LLM')
+    app.state.calls = 0
+
+    @app.post('/v1/chat/completions')
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        await asyncio.sleep(latency)
+        prompt = body['messages'][-1]['content']
+        text = f"stub answer {hashlib.sha256(prompt.encode()).hexdigest()[:8]} to: {prompt[-80:]}"
+        usage = {'prompt_tokens': estimate_tokens(prompt), 'completion_tokens': estimate_tokens(text)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        if not body.get('stream'):
+            return {'choices': [{'message': {'role': 'assistant', 'content': text}}], 'usage': usage}
+
+        async def chunks():
+            for word in text.split(' '):
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n"
+                await asyncio.sleep(0.01)
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(chunks(), media_type='text/event-stream')
+
+    @app.get('/stats')
+    async def stats():
+        return {'calls': app.state.calls}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stub model server')
+    parser.add_argument('command', choices=['stub'])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.2)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_stub_app(args.latency), host='127.0.0.1', port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Redis client
+Shared asyncio Redis connection for coordination between workers
+"""
+from typing import Optional
+import time
+
+from core.config import settings
+
+
+# After a failed connection, wait this long before trying again
+RECONNECT_INTERVAL_SECONDS = 30
+
+_redis = None
+_failed_at: Optional[float] = None
+
+
+async def get_redis():
+    """Get the process-wide asyncio Redis client, or None if Redis is not reachable"""
+    global _redis, _failed_at
+
+    if _redis is not None:
+        return _redis
+    if not settings.redis_url:
+        return None
+    if _failed_at is not None and time.monotonic() - _failed_at < RECONNECT_INTERVAL_SECONDS:
+        return None
+
+    try:
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(settings.redis_url, decode_responses=True)
+        await client.ping()
+        _redis = client
+        _failed_at = None
+    except Exception as e:
+        print(f"Redis at REDIS_URL unreachable, retrying in {RECONNECT_INTERVAL_SECONDS}s "
+              f"(leader-only duties pause until then): {e}")
+        _failed_at = time.monotonic()
+    return _redis
+
+
+async def close_redis():
+    global _redis
+
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
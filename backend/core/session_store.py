@@ -0,0 +1,226 @@
+"""
+Chat Session Store
+Recent turns per chat session, held in an in-process LRU with a TTL and mirrored to
+Redis when available so other workers can pick a session up. With Redis, each cached
+read first checks the session's turn count there and reloads it if another worker
+has added turns since. Agents read conversation
+context from here and the history endpoint pages through it; chat_conversations is
+only read on a cold miss or for pages older than the cached turns.
+"""
+from typing import Dict, Any, Deque, List, Optional
+from collections import OrderedDict, deque
+from datetime import datetime
+import asyncio
+import json
+import time
+
+from core.config import settings
+from core.redis_client import get_redis
+from core.supabase_client import get_supabase_client
+
+
+# Turns handed to agents as conversation context
+CONTEXT_TURNS = 6
+MAX_HISTORY_PAGE = 200
+
+_REDIS_PREFIX = 'cts:session:'
+
+
+class Session:
+    """Newest turns of one session plus the total number of turns it has ever had"""
+
+    def __init__(self, max_turns: int, turns: Optional[List[Dict[str, Any]]] = None, total: int = 0):
+        self.turns: Deque[Dict[str, Any]] = deque(turns or [], maxlen=max_turns)
+        self.total = max(total, len(self.turns))
+        self.touched = time.monotonic()
+
+    @property
+    def first_cached(self) -> int:
+        """Position (oldest first) of the oldest cached turn"""
+        return self.total - len(self.turns)
+
+
+class SessionStore:
+    """LRU of sessions bounded by session count, turns per session and idle TTL"""
+
+    def __init__(self, max_sessions: int = settings.session_cache_max_sessions,
+                 max_turns: int = settings.session_cache_max_turns,
+                 ttl_seconds: int = settings.session_cache_ttl_seconds):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.sessions: 'OrderedDict[str, Session]' = OrderedDict()
+        # Concurrent misses for one session share a single load
+        self._loading: Dict[str, asyncio.Task] = {}
+        self.supabase = get_supabase_client()
+        self.stats = {'hits': 0, 'stale': 0, 'redis_hits': 0, 'db_loads': 0, 'evictions': 0}
+
+    def start(self, session_id: str):
+        """Register a session known to be new, so its first turn skips the cold load"""
+        if session_id not in self.sessions:
+            self._put(session_id, Session(self.max_turns))
+
+    async def recent(self, session_id: str, limit: int = CONTEXT_TURNS) -> List[Dict[str, Any]]:
+        """Newest turns of a session, oldest first, for agent context"""
+        session = await self._load(session_id)
+        return list(session.turns)[-limit:] if limit else []
+
+    async def append(self, session_id: str, turn: Dict[str, Any]):
+        """Record a completed turn locally and in Redis"""
+        session = await self._load(session_id)
+        turn = {**turn, 'created_at': turn.get('created_at') or datetime.utcnow().isoformat()}
+        session.turns.append(turn)
+        session.total += 1
+
+        redis = await get_redis()
+        if redis is None:
+            return
+        try:
+            key = _REDIS_PREFIX + session_id
+            # A session loaded from the database (Redis key absent or expired) is mirrored whole,
+            # so Redis never holds fewer turns or a lower total than the session really has
+            seed = await redis.exists(key, key + ':meta') < 2
+            async with redis.pipeline(transaction=True) as pipe:
+                if seed:
+                    pipe.delete(key)
+                    pipe.rpush(key, *(json.dumps(t, default=str) for t in session.turns))
+                    pipe.hset(key + ':meta', 'total', session.total)
+                else:
+                    pipe.rpush(key, json.dumps(turn, default=str))
+                    pipe.hincrby(key + ':meta', 'total', 1)
+                pipe.ltrim(key, -self.max_turns, -1)
+                pipe.expire(key, self.ttl_seconds)
+                pipe.expire(key + ':meta', self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Error mirroring chat session to Redis: {e}")
+
+    async def history(self, session_id: str, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """A page of a session's turns, oldest first; served from cache when the page is cached"""
+        limit = max(1, min(limit, MAX_HISTORY_PAGE))
+        session = await self._load(session_id)
+        end = min(offset + limit, session.total)
+
+        if offset >= session.first_cached:
+            turns = list(session.turns)[offset - session.first_cached:end - session.first_cached]
+            source = 'cache'
+        else:
+            result = await asyncio.to_thread(
+                lambda: self.supabase.table('chat_conversations')
+                .select('*')
+                .eq('session_id', session_id)
+                .order('created_at', desc=False)
+                .range(offset, offset + limit - 1)
+                .execute()
+            )
+            turns = result.data or []
+            source = 'database'
+
+        return {
+            'conversations': turns,
+            'total': session.total,
+            'offset': offset,
+            'limit': limit,
+            'next_offset': offset + len(turns) if offset + len(turns) < session.total else None,
+            'source': source
+        }
+
+    def evict(self, session_id: str):
+        self.sessions.pop(session_id, None)
+
+    async def _load(self, session_id: str) -> Session:
+        """Cached session, else Redis, else the newest turns from chat_conversations"""
+        now = time.monotonic()
+        session = self.sessions.get(session_id)
+        if session is not None and now - session.touched <= self.ttl_seconds \
+                and not await self._is_stale(session_id, session):
+            self.stats['hits'] += 1
+            session.touched = now
+            self.sessions.move_to_end(session_id)
+            return session
+
+        task = self._loading.get(session_id)
+        if task is None:
+            task = self._loading[session_id] = asyncio.create_task(self._load_cold(session_id))
+            task.add_done_callback(lambda _: self._loading.pop(session_id, None))
+        return await asyncio.shield(task)
+
+    async def _is_stale(self, session_id: str, session: Session) -> bool:
+        """Whether Redis holds a different turn count for the session (another worker appended to it)"""
+        redis = await get_redis()
+        if redis is None:
+            return False
+        try:
+            total = await redis.hget(_REDIS_PREFIX + session_id + ':meta', 'total')
+        except Exception as e:
+            print(f"Error checking chat session in Redis: {e}")
+            return False
+        if total is None or int(total) == session.total:
+            return False
+        self.stats['stale'] += 1
+        return True
+
+    async def _load_cold(self, session_id: str) -> Session:
+        session = await self._load_from_redis(session_id)
+        if session is not None:
+            self.stats['redis_hits'] += 1
+        else:
+            session = await self._load_from_database(session_id)
+            self.stats['db_loads'] += 1
+        self._put(session_id, session)
+        return session
+
+    async def _load_from_redis(self, session_id: str) -> Optional[Session]:
+        redis = await get_redis()
+        if redis is None:
+            return None
+        try:
+            key = _REDIS_PREFIX + session_id
+            raw = await redis.lrange(key, -self.max_turns, -1)
+            if not raw:
+                return None
+            total = int(await redis.hget(key + ':meta', 'total') or 0)
+            return Session(self.max_turns, [json.loads(item) for item in raw], total)
+        except Exception as e:
+            print(f"Error reading chat session from Redis: {e}")
+            return None
+
+    async def _load_from_database(self, session_id: str) -> Session:
+        try:
+            result = await asyncio.to_thread(
+                lambda: self.supabase.table('chat_conversations')
+                .select('message, response, agent_used, metadata, created_at', count='exact')
+                .eq('session_id', session_id)
+                .order('created_at', desc=True)
+                .limit(self.max_turns)
+                .execute()
+            )
+            turns = list(reversed(result.data or []))
+            return Session(self.max_turns, turns, result.count or len(turns))
+        except Exception as e:
+            print(f"Error loading chat session: {e}")
+            return Session(self.max_turns)
+
+    def _put(self, session_id: str, session: Session):
+        self.sessions[session_id] = session
+        self.sessions.move_to_end(session_id)
+        # Expired sessions sit at the LRU end, so sweeping stops at the first live one
+        now = time.monotonic()
+        while self.sessions:
+            oldest_id, oldest = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and now - oldest.touched <= self.ttl_seconds:
+                break
+            del self.sessions[oldest_id]
+            self.stats['evictions'] += 1
+
+
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Get the process-wide chat session store"""
+    global _session_store
+
+    if _session_store is None:
+        _session_store = SessionStore()
+    return _session_store
@@ -3,7 +3,7 @@ Supabase client configuration and utilities
 """
 from supabase import create_client, Client
 import os
-from typing import Optional
+from typing import Any, Optional
 
 _supabase_client: Optional[Client] = None
 
@@ -33,3 +33,28 @@ def get_supabase_client_anon() -> Client:
         raise ValueError("Supabase URL and anon key must be set")
     
     return create_client(supabase_url, supabase_key)
+
+
+def quote_filter_value(value: Any) -> str:
+    """Quote a value for use inside a PostgREST or() filter"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def keyset_after(query, column: str, value: Any, row_id: Any, descending: bool = False, nullable: bool = False):
+    """
+    Restrict a query to rows strictly after (value, row_id) in (column, id) order.
+    Order the query by column then id to page with it; unlike a filter on column alone,
+    rows sharing a value (e.g. a batch inserted with one NOW()) are neither skipped nor repeated.
+    NULLs are placed as Postgres orders them: last ascending, first descending; pass
+    nullable for a column that can hold them.
+    """
+    op = 'lt' if descending else 'gt'
+    row_id = quote_filter_value(row_id)
+    if value is None:
+        after = f"and({column}.is.null,id.{op}.{row_id})"
+        return query.or_(f"{after},{column}.not.is.null" if descending else after)
+    value = quote_filter_value(value)
+    condition = f"{column}.{op}.{value},and({column}.eq.{value},id.{op}.{row_id})"
+    if nullable and not descending:
+        condition += f",{column}.is.null"
+    return query.or_(condition)
@@ -0,0 +1,313 @@
+"""
+Indicator Extraction
+Single-pass extraction of candidate IOCs (IPs, domains, URLs, emails, hashes) and
+entities (CVE ids, IBANs, card numbers) from ingested document text, tolerant of
+defanged indicators and deduplicated per document.
+"""
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+import ipaddress
+import json
+import re
+import time
+
+from core.supabase_client import get_supabase_client
+from intelligence.ioc_engine import normalize_ioc, refang
+
+
+# Rows per insert into extracted_indicators
+WRITE_BATCH_SIZE = 500
+# Distinct indicators kept per document; later ones are counted but not stored
+MAX_INDICATORS_PER_DOCUMENT = 50_000
+# Characters of surrounding text kept with the first occurrence
+CONTEXT_CHARS = 40
+# Distinct raw tokens whose classification is remembered; logs repeat the same few constantly
+CLASSIFY_CACHE_SIZE = 100_000
+
+# Defanged separators are matched in place so the text never has to be rewritten first
+_DOT = r'(?:\.|\[\.\]|\(\.\)|\[dot\]|\(dot\))'
+_AT = r'(?:@|\[@\]|\[at\]|\(at\))'
+_LABEL = r'[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?'
+_HOST = rf'(?:{_LABEL}{_DOT})+[a-z]{{2,63}}'
+# No leading zeros, so a matched address is already in canonical form
+_OCTET = r'(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)'
+
+# One alternation over every indicator type; earlier alternatives win at a position.
+# The leading guard only lets a position through at the start of a token that contains a
+# separator or starts like a CVE id, IBAN, card number or hash, so plain words and short
+# numbers are skipped without trying each alternative on them.
+_INDICATORS = re.compile(
+    r'(?<!\w)(?=\S*?[.:@\[(]|cve-|[a-z0-9]{13}|[a-z]{2}\d{2}[ a-z0-9]|\d{4}[ -]\d)(?:'
+    rf'(?P<url>\b(?:h[tx]{{2}}ps?|f[tx]p)(?:://|\[://\]|\[:\]//)[^\s<>"\'`]+)'
+    rf'|(?P<email>\b[a-z0-9._%+-]+{_AT}{_HOST}\b)'
+    rf'|(?P<ipv4>(?<![\d.]){_OCTET}(?:{_DOT}{_OCTET}){{3}}(?!\d|\.\d))'
+    r'|(?P<cve>\bcve-\d{4}-\d{4,7}\b)'
+    r'|(?P<hash>\b(?:[a-f0-9]{64}|[a-f0-9]{40}|[a-f0-9]{32})\b)'
+    r'|(?P<iban>\b[a-z]{2}\d{2}(?: ?[a-z0-9]{4}){2,7}(?: ?[a-z0-9]{1,3})?\b)'
+    r'|(?P<ipv6>(?<![\w:])(?=[0-9a-f:]*::|(?:[0-9a-f]{1,4}:){7})(?:[0-9a-f]{0,4}:){2,7}[0-9a-f]{0,4}(?![\w:]))'
+    r'|(?P<card>(?<![\d-])\d(?:[ -]?\d){12,18}(?![\d-]))'
+    rf'|(?P<domain>\b{_HOST}\b))',
+    re.IGNORECASE
+)
+_EXTRA_REFANG = [('(dot)', '.'), ('(at)', '@'), ('[://]', '://'), ('[:]', ':'), ('fxp', 'ftp')]
+_URL_TRAILING = '.,;:!?\'")]}>'
+_HASH_TYPES = {32: 'md5', 40: 'sha1', 64: 'sha256'}
+# Tokens that look like host names but are almost always file names
+_FILE_EXTENSIONS = {
+    'bat', 'bin', 'cfg', 'conf', 'csv', 'dat', 'dll', 'doc', 'docx', 'exe', 'gif', 'gz', 'htm', 'html',
+    'ini', 'jar', 'jpeg', 'jpg', 'js', 'json', 'log', 'msi', 'pdf', 'php', 'png', 'ps1', 'py', 'sh',
+    'sys', 'tar', 'tmp', 'txt', 'vbs', 'xls', 'xlsx', 'xml', 'yaml', 'yml', 'zip'
+}
+
+# Indicator types that can be matched against threats; the rest are entities
+IOC_INDICATOR_TYPES = ('ip', 'domain', 'url', 'email', 'hash')
+
+IndicatorKey = Tuple[str, str]
+
+
+def _luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, char in enumerate(reversed(digits)):
+        value = int(char)
+        if i % 2:
+            value = value * 2 - 9 if value > 4 else value * 2
+        total += value
+    return total % 10 == 0
+
+
+def _iban_valid(iban: str) -> bool:
+    if not 15 <= len(iban) <= 34:
+        return False
+    rearranged = iban[4:] + iban[:4]
+    return int(''.join(str(int(char, 36)) for char in rearranged)) % 97 == 1
+
+
+def _refang(token: str) -> str:
+    token = refang(token)
+    for old, new in _EXTRA_REFANG:
+        if old in token:
+            token = token.replace(old, new)
+    return token
+
+
+def classify(kind: str, token: str) -> Optional[Tuple[str, Optional[str], str]]:
+    """(indicator type, subtype, normalized value) for a regex match, or None if it is not valid"""
+    if kind == 'card':
+        digits = re.sub(r'[ -]', '', token)
+        if not 13 <= len(digits) <= 19 or not _luhn_valid(digits):
+            return None
+        # Only the issuer prefix and last four digits are ever stored
+        return 'card', None, f"{digits[:6]}{'*' * (len(digits) - 10)}{digits[-4:]}"
+    if kind == 'iban':
+        value = token.replace(' ', '').upper()
+        return ('iban', None, value) if _iban_valid(value) else None
+    if kind == 'cve':
+        return 'cve', None, token.upper()
+
+    value = _refang(token)
+    if kind == 'ipv4':
+        return 'ip', 'ipv4', value
+    if kind == 'url':
+        value = value.rstrip(_URL_TRAILING)
+    elif kind == 'domain':
+        if value.rsplit('.', 1)[-1].lower() in _FILE_EXTENSIONS:
+            return None
+    elif kind == 'ipv6':
+        try:
+            ipaddress.IPv6Address(value)
+        except ValueError:
+            return None
+
+    ioc_type = 'ip' if kind in ('ipv4', 'ipv6') else kind
+    try:
+        value = normalize_ioc(ioc_type, value)
+    except ValueError:
+        return None
+    subtype = _HASH_TYPES[len(value)] if kind == 'hash' else kind if ioc_type == 'ip' else None
+    return ioc_type, subtype, value
+
+
+def scan(text: str, cache: Optional[Dict[Tuple[str, str], Any]] = None
+         ) -> Iterator[Tuple[str, Optional[str], str, bool, int, int]]:
+    """Yield (type, subtype, value, defanged, start, end) for every valid indicator in text"""
+    for match in _INDICATORS.finditer(text):
+        kind = match.lastgroup
+        token = match.group(kind)
+        if cache is not None and (kind, token) in cache:
+            classified = cache[(kind, token)]
+        else:
+            classified = classify(kind, token)
+            if classified is not None:
+                defanged = kind in ('url', 'email', 'ipv4', 'domain') and _refang(token) != token
+                classified = (*classified, defanged)
+            if cache is not None:
+                if len(cache) >= CLASSIFY_CACHE_SIZE:
+                    cache.clear()
+                cache[(kind, token)] = classified
+        if classified is not None:
+            yield (*classified, match.start(), match.end())
+
+
+class IndicatorSet:
+    """Distinct indicators of one document with occurrence counts; cheap to pickle and merge"""
+
+    def __init__(self, max_indicators: int = MAX_INDICATORS_PER_DOCUMENT):
+        self.max_indicators = max_indicators
+        self.indicators: Dict[IndicatorKey, Dict[str, Any]] = {}
+        self.dropped = 0
+        self.bytes_scanned = 0
+        self.scan_seconds = 0.0
+        self._classified: Dict[Tuple[str, str], Any] = {}
+        # Indicators added or counted since the last save
+        self._changed: Set[IndicatorKey] = set()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Worker processes ship back only the indicators; merging marks them changed
+        return {**self.__dict__, '_classified': {}, '_changed': set()}
+
+    def __len__(self) -> int:
+        return len(self.indicators)
+
+    def add_text(self, text: str):
+        """Scan a chunk of text once and count what it contains"""
+        if not text:
+            return
+        started = time.perf_counter()
+        for indicator_type, subtype, value, defanged, start, end in scan(text, self._classified):
+            key = (indicator_type, value)
+            entry = self.indicators.get(key)
+            if entry is not None:
+                entry['occurrences'] += 1
+                entry['defanged'] = entry['defanged'] or defanged
+                self._changed.add(key)
+            elif len(self.indicators) < self.max_indicators:
+                self._changed.add(key)
+                self.indicators[key] = {
+                    'indicator_type': indicator_type,
+                    'subtype': subtype,
+                    'value': value,
+                    'defanged': defanged,
+                    'occurrences': 1,
+                    'context': ' '.join(text[max(0, start - CONTEXT_CHARS):end + CONTEXT_CHARS].split())
+                }
+            else:
+                self.dropped += 1
+        self.bytes_scanned += len(text.encode('utf-8'))
+        self.scan_seconds += time.perf_counter() - started
+
+    def merge(self, other: 'IndicatorSet'):
+        """Fold in indicators found in another chunk of the same document"""
+        for key, theirs in other.indicators.items():
+            entry = self.indicators.get(key)
+            if entry is not None:
+                entry['occurrences'] += theirs['occurrences']
+                entry['defanged'] = entry['defanged'] or theirs['defanged']
+                self._changed.add(key)
+            elif len(self.indicators) < self.max_indicators:
+                self.indicators[key] = theirs
+                self._changed.add(key)
+            else:
+                self.dropped += theirs['occurrences']
+        self.dropped += other.dropped
+        self.bytes_scanned += other.bytes_scanned
+        self.scan_seconds += other.scan_seconds
+
+    def restore(self, rows: Iterable[Dict[str, Any]]):
+        """Seed with indicators already saved for the document, e.g. when resuming an ingestion"""
+        for row in rows:
+            self.indicators[(row['indicator_type'], row['value'])] = {
+                field: row.get(field) for field in ('indicator_type', 'subtype', 'value', 'defanged', 'occurrences', 'context')
+            }
+
+    def take_changes(self) -> List[Dict[str, Any]]:
+        """Indicators added or counted since the previous call"""
+        changed = [self.indicators[key] for key in self._changed if key in self.indicators]
+        self._changed = set()
+        return changed
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts per type and scan throughput, for ingestion metadata"""
+        by_type: Dict[str, int] = {}
+        for indicator_type, _ in self.indicators:
+            by_type[indicator_type] = by_type.get(indicator_type, 0) + 1
+        return {
+            'distinct': len(self.indicators),
+            'by_type': by_type,
+            'dropped': self.dropped,
+            'mb_per_second': round(self.bytes_scanned / self.scan_seconds / (1024 * 1024), 2)
+            if self.scan_seconds > 0 else None
+        }
+
+
+class IndicatorStore:
+    """Writes a document's indicators to extracted_indicators"""
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE):
+        self.supabase = get_supabase_client()
+        self.batch_size = batch_size
+
+    def save(self, ingestion_id: str, indicators: IndicatorSet) -> int:
+        """
+        Bulk upsert indicators changed since the last save, so a long ingestion can save
+        after every chunk; re-running an ingestion updates its rows instead of duplicating them
+        """
+        rows = [
+            {
+                **entry,
+                'ingestion_id': ingestion_id,
+                'category': 'ioc' if entry['indicator_type'] in IOC_INDICATOR_TYPES else 'entity'
+            }
+            for entry in indicators.take_changes()
+        ]
+        for start in range(0, len(rows), self.batch_size):
+            self.supabase.table('extracted_indicators')\
+                .upsert(rows[start:start + self.batch_size], on_conflict='ingestion_id,indicator_type,value')\
+                .execute()
+        return len(rows)
+
+    def load(self, ingestion_id: str, indicators: IndicatorSet):
+        """Restore the indicators already saved for an ingestion"""
+        start = 0
+        while True:
+            rows = self.supabase.table('extracted_indicators')\
+                .select('indicator_type, subtype, value, defanged, occurrences, context')\
+                .eq('ingestion_id', ingestion_id)\
+                .order('id')\
+                .range(start, start + self.batch_size - 1)\
+                .execute().data or []
+            indicators.restore(rows)
+            if len(rows) < self.batch_size:
+                return
+            start += self.batch_size
+
+
+def benchmark(text: str, repeat: int = 3) -> Dict[str, Any]:
+    """Best-of-n extraction throughput over a block of text"""
+    best = None
+    for _ in range(repeat):
+        indicators = IndicatorSet()
+        indicators.add_text(text)
+        if best is None or indicators.scan_seconds < best.scan_seconds:
+            best = indicators
+    return {'bytes': best.bytes_scanned, 'elapsed_seconds': round(best.scan_seconds, 3), **best.summary()}
+
+
+if __name__ == "__main__":
+    import random
+
+    # Synthetic report text: prose with indicators, some of them defanged, every few lines
+    rng = random.Random(0)
+    words = 'the actor used a loader to reach its server after phishing staff with an invoice lure'.split()
+    lines = []
+    for i in range(100000):
+        line = ' '.join(rng.choice(words) for _ in range(12))
+        if i % 4 == 0:
+            line += rng.choice([
+                f' beacon to 185.{rng.randint(0, 255)}[.]{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+                f' payload hxxps://cdn{rng.randint(0, 999)}.evil-site[.]com/p/{i}.bin',
+                f' dropper sha256 {rng.getrandbits(256):064x}',
+                f' exploited CVE-2024-{rng.randint(1000, 99999)} on the gateway',
+                f' reply to billing{rng.randint(0, 99)}[@]invoice-portal.net',
+                ' wire to GB82 WEST 1234 5698 7654 32',
+            ])
+        lines.append(line)
+    print(json.dumps(benchmark('\n'.join(lines)), indent=2))
@@ -0,0 +1,412 @@
+"""
+Streaming Log Parser
+Parses syslog, JSON-lines, CEF and web access logs into normalized access/auth events
+"""
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import asyncio
+import json
+import os
+import re
+
+from core.supabase_client import get_supabase_client
+from data_ingestion.indicator_extractor import IndicatorSet
+
+
+# Files smaller than this are parsed inline instead of through the process pool
+PARALLEL_THRESHOLD_BYTES = 16 * 1024 * 1024
+# Target size of each byte range handed to a worker process
+CHUNK_SIZE_BYTES = 32 * 1024 * 1024
+# Rows per insert into log_events
+WRITE_BATCH_SIZE = 500
+# Raw message text kept per event
+MAX_MESSAGE_LENGTH = 1024
+# Lines joined into one text block per indicator scan
+INDICATOR_BLOCK_LINES = 2000
+
+_MONTHS = {m: i for i, m in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], start=1
+)}
+
+# <34>Oct 11 22:14:15 mymachine su[123]: message
+_SYSLOG_3164 = re.compile(
+    r'^(?:<(?P<pri>\d{1,3})>)?'
+    r'(?P<mon>[A-Z][a-z]{2}) +(?P<day>\d{1,2}) (?P<time>\d{2}:\d{2}:\d{2}) '
+    r'(?P<host>\S+) (?P<app>[^:\[\s]+)(?:\[(?P<pid>\d+)\])?: ?(?P<msg>.*)$'
+)
+# <165>1 2003-10-11T22:14:15.003Z mymachine.example.com evntslog - ID47 [sd] message
+_SYSLOG_5424 = re.compile(
+    r'^<(?P<pri>\d{1,3})>1 (?P<ts>\S+) (?P<host>\S+) (?P<app>\S+) (?P<pid>\S+) (?P<msgid>\S+) '
+    r'(?P<sd>-|(?:\[[^\]]*\])+) ?(?P<msg>.*)$'
+)
+# 127.0.0.1 - frank [10/Oct/2000:13:55:36 -0700] "GET /apache_pb.gif HTTP/1.0" 200 2326
+_ACCESS_LOG = re.compile(
+    r'^(?P<ip>\S+) \S+ (?P<user>\S+) \[(?P<ts>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<path>\S+)[^"]*" (?P<status>\d{3}) \S+'
+)
+_CEF_HEADER = re.compile(r'CEF:\d+\|')
+_CEF_EXTENSION = re.compile(r'(\w+)=((?:\\=|[^=])*?)(?=\s+\w+=|\s*$)')
+
+# Auth message patterns for syslog payloads (sshd, sudo, su, login)
+_AUTH_PATTERNS: List[Tuple[re.Pattern, str, str]] = [
+    (re.compile(r'Accepted \S+ for (?P<user>\S+) from (?P<ip>\S+)'), 'login', 'success'),
+    (re.compile(r'Failed \S+ for (?:invalid user )?(?P<user>\S+) from (?P<ip>\S+)'), 'login', 'failure'),
+    (re.compile(r'Invalid user (?P<user>\S+) from (?P<ip>\S+)'), 'login', 'failure'),
+    (re.compile(r'authentication failure;.*?rhost=(?P<ip>\S*).*?user=(?P<user>\S+)'), 'login', 'failure'),
+    (re.compile(r'session opened for user (?P<user>\S+)'), 'session_open', 'success'),
+    (re.compile(r'session closed for user (?P<user>\S+)'), 'session_close', 'success'),
+    (re.compile(r'^\s*(?P<user>\S+) : .*COMMAND='), 'sudo', 'success'),
+    (re.compile(r'(?P<user>\S+) : .*incorrect password attempts'), 'sudo', 'failure'),
+]
+
+_JSON_KEYS = {
+    'timestamp': ('timestamp', '@timestamp', 'time', 'ts', 'eventTime', 'date'),
+    'user': ('user', 'username', 'user_name', 'userName', 'account', 'principal'),
+    'source_ip': ('source_ip', 'src_ip', 'client_ip', 'clientIp', 'remote_addr', 'sourceIPAddress', 'ip', 'src'),
+    'action': ('action', 'event', 'eventName', 'event_type', 'type', 'method'),
+    'result': ('result', 'outcome', 'status', 'success'),
+    'host': ('host', 'hostname', 'server'),
+}
+
+_SUCCESS_VALUES = {'success', 'succeeded', 'ok', 'allow', 'allowed', 'accept', 'accepted', 'true', 'pass', 'passed'}
+_FAILURE_VALUES = {'failure', 'failed', 'fail', 'deny', 'denied', 'reject', 'rejected', 'blocked', 'false', 'error'}
+
+
+def _normalize_result(value: Any) -> str:
+    """Map a free-form outcome value to success/failure/unknown"""
+    if value is None:
+        return 'unknown'
+    if isinstance(value, bool):
+        return 'success' if value else 'failure'
+    text = str(value).strip().lower()
+    if text.isdigit() and len(text) == 3:
+        return 'failure' if text[0] in '45' else 'success'
+    if text in _SUCCESS_VALUES:
+        return 'success'
+    if text in _FAILURE_VALUES:
+        return 'failure'
+    return 'unknown'
+
+
+def _event(timestamp: Optional[str], user: Optional[str], source_ip: Optional[str],
+           action: Optional[str], result: str, log_format: str, host: Optional[str],
+           message: str) -> Dict[str, Any]:
+    return {
+        'event_time': timestamp,
+        'user_name': user if user not in ('-', '') else None,
+        'source_ip': source_ip if source_ip not in ('-', '') else None,
+        'action': action,
+        'result': result,
+        'log_format': log_format,
+        'host': host,
+        'message': message[:MAX_MESSAGE_LENGTH],
+    }
+
+
+def _parse_syslog_payload(msg: str) -> Tuple[Optional[str], Optional[str], Optional[str], str]:
+    """Extract (user, ip, action, result) from a syslog message body"""
+    for pattern, action, result in _AUTH_PATTERNS:
+        match = pattern.search(msg)
+        if match:
+            groups = match.groupdict()
+            return groups.get('user'), groups.get('ip') or None, action, result
+    return None, None, None, 'unknown'
+
+
+def parse_syslog(line: str, year: int) -> Optional[Dict[str, Any]]:
+    """Parse an RFC 5424 or RFC 3164 syslog line"""
+    match = _SYSLOG_5424.match(line)
+    if match:
+        timestamp = match.group('ts') if match.group('ts') != '-' else None
+        host = match.group('host')
+        msg = match.group('msg')
+    else:
+        match = _SYSLOG_3164.match(line)
+        if not match:
+            return None
+        month = _MONTHS.get(match.group('mon'))
+        if month is None:
+            return None
+        hh, mm, ss = match.group('time').split(':')
+        timestamp = datetime(year, month, int(match.group('day')), int(hh), int(mm), int(ss),
+                             tzinfo=timezone.utc).isoformat()
+        host = match.group('host')
+        msg = match.group('msg')
+    user, ip, action, result = _parse_syslog_payload(msg)
+    return _event(timestamp, user, ip, action or match.group('app'), result, 'syslog', host, line)
+
+
+def parse_json_line(line: str) -> Optional[Dict[str, Any]]:
+    """Parse a JSON-lines record"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+
+    def pick(field: str) -> Any:
+        for key in _JSON_KEYS[field]:
+            value = record.get(key)
+            if isinstance(value, dict):
+                value = value.get('name') or value.get('ip') or value.get('address')
+            if value not in (None, ''):
+                return value
+        return None
+
+    def pick_str(field: str) -> Optional[str]:
+        value = pick(field)
+        return str(value) if value is not None else None
+
+    timestamp = pick('timestamp')
+    if isinstance(timestamp, (int, float)):
+        seconds = timestamp / 1000 if timestamp > 1e12 else timestamp
+        timestamp = datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()
+    return _event(
+        str(timestamp) if timestamp is not None else None,
+        pick_str('user'),
+        pick_str('source_ip'),
+        pick_str('action'),
+        _normalize_result(pick('result')),
+        'json',
+        pick_str('host'),
+        line,
+    )
+
+
+def _unescape_cef(value: str) -> str:
+    return value.replace('\\=', '=').replace('\\|', '|').replace('\\\\', '\\').strip()
+
+
+def parse_cef(line: str) -> Optional[Dict[str, Any]]:
+    """Parse an ArcSight CEF record (optionally behind a syslog prefix)"""
+    header = _CEF_HEADER.search(line)
+    if not header:
+        return None
+    parts = re.split(r'(?<!\\)\|', line[header.start():], maxsplit=7)
+    if len(parts) < 8:
+        return None
+    name = _unescape_cef(parts[5])
+    extension = {key: _unescape_cef(value) for key, value in _CEF_EXTENSION.findall(parts[7])}
+
+    timestamp = extension.get('rt') or extension.get('start') or extension.get('end')
+    if timestamp and timestamp.isdigit():
+        timestamp = datetime.fromtimestamp(int(timestamp) / 1000, tz=timezone.utc).isoformat()
+    return _event(
+        timestamp,
+        extension.get('suser') or extension.get('duser'),
+        extension.get('src') or extension.get('sourceAddress'),
+        extension.get('act') or name,
+        _normalize_result(extension.get('outcome') or extension.get('act')),
+        'cef',
+        extension.get('dhost') or extension.get('shost'),
+        line,
+    )
+
+
+def parse_access_log(line: str) -> Optional[Dict[str, Any]]:
+    """Parse a common/combined format web access log line"""
+    match = _ACCESS_LOG.match(line)
+    if not match:
+        return None
+    try:
+        timestamp = datetime.strptime(match.group('ts'), '%d/%b/%Y:%H:%M:%S %z').isoformat()
+    except ValueError:
+        timestamp = None
+    return _event(
+        timestamp,
+        match.group('user'),
+        match.group('ip'),
+        f"{match.group('method')} {match.group('path')}",
+        _normalize_result(match.group('status')),
+        'access',
+        None,
+        line,
+    )
+
+
+def parse_line(line: str, year: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Detect the format of a single line and parse it"""
+    line = line.rstrip('\r\n')
+    if not line.strip():
+        return None
+    first = line.lstrip()[:1]
+    if first == '{':
+        return parse_json_line(line)
+    if 'CEF:' in line:
+        return parse_cef(line)
+    if first == '<' or line[:3] in _MONTHS:
+        return parse_syslog(line, year or datetime.utcnow().year)
+    return parse_access_log(line)
+
+
+def iter_events(lines: Iterable[str], year: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Lazily parse an iterable of lines into normalized events"""
+    year = year or datetime.utcnow().year
+    for line in lines:
+        event = parse_line(line, year)
+        if event is not None:
+            yield event
+
+
+def split_ranges(path: str, chunk_size: int = CHUNK_SIZE_BYTES) -> List[Tuple[int, int]]:
+    """Split a file into byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _iter_range_lines(path: str, start: int, end: int) -> Iterator[str]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        for raw in f:
+            if position >= end:
+                break
+            position += len(raw)
+            yield raw.decode('utf-8', errors='ignore')
+
+
+def parse_range(path: str, start: int, end: int, year: int) -> Tuple[int, List[Dict[str, Any]], IndicatorSet]:
+    """Worker entry point: parse one byte range, returning (lines read, events, indicators)"""
+    line_count = 0
+    events = []
+    indicators = IndicatorSet()
+    block = []
+    for line in _iter_range_lines(path, start, end):
+        line_count += 1
+        event = parse_line(line, year)
+        if event is not None:
+            events.append(event)
+        # Lines are scanned for indicators in blocks to keep per-call overhead down
+        block.append(line)
+        if len(block) >= INDICATOR_BLOCK_LINES:
+            indicators.add_text(''.join(block))
+            block = []
+    indicators.add_text(''.join(block))
+    return line_count, events, indicators
+
+
+async def iter_chunk_events(path: str, max_workers: int, first_chunk: int = 0
+                            ) -> AsyncIterator[Tuple[int, int, List[Dict[str, Any]], IndicatorSet]]:
+    """
+    Yield (chunk index, line count, events, indicators) per chunk in file order, using a
+    process pool for large files. Chunk boundaries depend only on the file, so an
+    interrupted ingestion can skip the chunks it already committed with first_chunk.
+    """
+    year = datetime.utcnow().year
+    size = os.path.getsize(path)
+    ranges = await asyncio.to_thread(split_ranges, path) if size >= PARALLEL_THRESHOLD_BYTES else [(0, size)]
+    chunks = list(enumerate(ranges))[first_chunk:]
+    if len(chunks) < 2 or max_workers < 2:
+        # Still off the event loop, so an upload never stalls other requests
+        for index, (start, end) in chunks:
+            yield (index, *await asyncio.to_thread(parse_range, path, start, end, year))
+        return
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Keep at most two chunks per worker in flight to bound memory
+        pending = []
+        for index, (start, end) in chunks:
+            pending.append((index, loop.run_in_executor(executor, parse_range, path, start, end, year)))
+            if len(pending) >= max_workers * 2:
+                index, future = pending.pop(0)
+                yield (index, *await future)
+        for index, future in pending:
+            yield (index, *await future)
+
+
+ChunkCommitted = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class LogIngestionPipeline:
+    """Parse a log file into normalized events and write them in batches"""
+
+    def __init__(self, max_workers: Optional[int] = None, batch_size: int = WRITE_BATCH_SIZE):
+        self.supabase = get_supabase_client()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+
+    async def ingest_file(self, path: str, ingestion_id: str, indicators: Optional[IndicatorSet] = None,
+                          checkpoint: Optional[Dict[str, Any]] = None,
+                          on_chunk: Optional[ChunkCommitted] = None) -> Dict[str, Any]:
+        """
+        Parse the file at path, store its events against an ingestion and collect its indicators.
+        Every chunk's events are written before on_chunk is called with the running totals;
+        passing those totals back as checkpoint resumes after the last committed chunk
+        (an empty checkpoint resumes an ingestion that never committed one).
+        """
+        started = datetime.utcnow()
+        stats = {'chunk': -1, 'lines': 0, 'events': 0, 'by_format': {}}
+        if checkpoint is not None:
+            stats.update({key: checkpoint[key] for key in stats if key in checkpoint})
+            # Events of a chunk that was cut off part way are written again below
+            self.supabase.table('log_events').delete()\
+                .eq('ingestion_id', ingestion_id)\
+                .gt('chunk_index', stats['chunk'])\
+                .execute()
+
+        async for index, line_count, events, chunk_indicators in iter_chunk_events(
+                path, self.max_workers, stats['chunk'] + 1):
+            stats['lines'] += line_count
+            if indicators is not None:
+                indicators.merge(chunk_indicators)
+            for start in range(0, len(events), self.batch_size):
+                batch = events[start:start + self.batch_size]
+                for event in batch:
+                    event['ingestion_id'] = ingestion_id
+                    event['chunk_index'] = index
+                    stats['by_format'][event['log_format']] = stats['by_format'].get(event['log_format'], 0) + 1
+                self._write_batch(batch)
+                stats['events'] += len(batch)
+            stats['chunk'] = index
+            if on_chunk is not None:
+                await on_chunk(stats)
+
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        stats['elapsed_seconds'] = elapsed
+        stats['lines_per_second'] = round(stats['lines'] / elapsed) if elapsed > 0 else stats['lines']
+        return stats
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        """Insert a batch of normalized events"""
+        self.supabase.table('log_events').insert(batch).execute()
+
+
+async def benchmark(path: str, max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """Measure parse throughput for a log file without writing events"""
+    max_workers = max_workers or os.cpu_count() or 1
+    started = datetime.utcnow()
+    lines = events = indicators = 0
+    async for _, line_count, chunk_events, chunk_indicators in iter_chunk_events(path, max_workers):
+        lines += line_count
+        events += len(chunk_events)
+        indicators += len(chunk_indicators)
+    elapsed = (datetime.utcnow() - started).total_seconds() or 1e-9
+    return {
+        'bytes': os.path.getsize(path),
+        'lines': lines,
+        'events': events,
+        'indicators': indicators,
+        'workers': max_workers,
+        'elapsed_seconds': round(elapsed, 3),
+        'lines_per_second': round(lines / elapsed),
+        'mb_per_second': round(os.path.getsize(path) / elapsed / (1024 * 1024), 2)
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    print(json.dumps(asyncio.run(benchmark(sys.argv[1])), indent=2))
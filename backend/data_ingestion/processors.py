@@ -2,14 +2,28 @@
 Data Ingestion Processors
 Handle various file formats and data sources
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from fastapi import UploadFile
-import pandas as pd
+import hashlib
 import io
+import os
+import tempfile
 from datetime import datetime
 import uuid
 
 from core.supabase_client import get_supabase_client
+from data_ingestion.indicator_extractor import IndicatorSet, IndicatorStore
+from data_ingestion.log_parser import LogIngestionPipeline
+from data_ingestion.pdf_extractor import PdfExtractionPipeline
+
+# Source types parsed from an in-memory copy; PDFs and everything else are parsed from the spool file
+BUFFERED_SOURCE_TYPES = ('spreadsheet', 'doc')
+# Bytes read from an upload per spool write and hash update
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# A 'processing' ingestion not checkpointed for this long is treated as interrupted and resumed
+STALE_INGESTION_SECONDS = 600
+# How often an ingestion without chunk checkpoints (PDFs) refreshes updated_at while it runs
+HEARTBEAT_SECONDS = 60
 
 
 class DataIngestionProcessor:
@@ -18,61 +32,151 @@ class DataIngestionProcessor:
     def __init__(self):
         self.supabase = get_supabase_client()
     
-    async def process_file(self, file: UploadFile, source_type: str) -> Dict[str, Any]:
-        """Process an uploaded file"""
-        ingestion_id = str(uuid.uuid4())
+    async def process_file(self, file: UploadFile, source_type: str, extract_tables: bool = False,
+                           reprocess: bool = False) -> Dict[str, Any]:
+        """
+        Process an uploaded file. An upload whose content (SHA-256) matches a completed
+        ingestion of the same source type returns that ingestion's result instead of being
+        parsed again, unless reprocess is set; one matching an interrupted ingestion resumes it.
+        """
+        # Spool the upload to disk, hashing it on the way, so workers can open it by path
+        path, content_hash = await self._spool(file, os.path.splitext(file.filename or '')[1])
+        ingestion_id = None
         
         try:
-            # Create ingestion record
-            self.supabase.table('data_ingestions').insert({
-                'id': ingestion_id,
-                'source_type': source_type,
-                'source_name': file.filename,
-                'file_name': file.filename,
-                'status': 'processing',
-                'created_at': datetime.utcnow().isoformat()
-            }).execute()
-            
-            # Read file content
-            content = await file.read()
+            prior = None if reprocess else self._find_prior_ingestion(content_hash, source_type)
+            if prior is not None and (prior['status'] == 'completed' or not self._is_interrupted(prior)):
+                return {
+                    'ingestion_id': prior['id'],
+                    'status': prior['status'],
+                    'records_processed': prior.get('records_processed') or 0,
+                    'metadata': prior.get('metadata') or {},
+                    'deduplicated': True
+                }
+            
+            checkpoint = None
+            if prior is not None:
+                # Resume the interrupted ingestion under its own id, unless another upload claimed it first
+                if not self._claim(prior):
+                    return {
+                        'ingestion_id': prior['id'],
+                        'status': 'processing',
+                        'records_processed': prior.get('records_processed') or 0,
+                        'metadata': prior.get('metadata') or {},
+                        'deduplicated': True
+                    }
+                ingestion_id = prior['id']
+                # An empty checkpoint still clears events left by a first chunk that never committed
+                checkpoint = prior.get('checkpoint') or {}
+            else:
+                ingestion_id = str(uuid.uuid4())
+                # Create ingestion record
+                self.supabase.table('data_ingestions').insert({
+                    'id': ingestion_id,
+                    'source_type': source_type,
+                    'source_name': file.filename,
+                    'file_name': file.filename,
+                    'content_hash': content_hash,
+                    'status': 'processing',
+                    'created_at': datetime.utcnow().isoformat(),
+                    'updated_at': datetime.utcnow().isoformat()
+                }).execute()
             
             # Process based on type
-            if source_type == 'spreadsheet':
-                result = await self._process_spreadsheet(content, file.filename)
+            if source_type in BUFFERED_SOURCE_TYPES:
+                # Read file content
+                with open(path, 'rb') as f:
+                    content = f.read()
+                
+                if source_type == 'spreadsheet':
+                    result = await self._process_spreadsheet(content, file.filename)
+                else:
+                    result = await self._process_document(content, ingestion_id)
             elif source_type == 'pdf':
-                result = await self._process_pdf(content)
-            elif source_type == 'doc':
-                result = await self._process_document(content)
+                result = await self._process_pdf(path, ingestion_id, extract_tables)
             else:
-                result = await self._process_text(content)
+                result = await self._process_text(path, ingestion_id, checkpoint)
             
             # Update ingestion record
             self.supabase.table('data_ingestions').update({
                 'status': 'completed',
                 'records_processed': result.get('records_processed', 0),
                 'metadata': result.get('metadata', {}),
-                'completed_at': datetime.utcnow().isoformat()
+                'completed_at': datetime.utcnow().isoformat(),
+                'updated_at': datetime.utcnow().isoformat()
             }).eq('id', ingestion_id).execute()
             
             return {
                 'ingestion_id': ingestion_id,
+                'status': 'completed',
                 'records_processed': result.get('records_processed', 0),
-                'metadata': result.get('metadata', {})
+                'metadata': result.get('metadata', {}),
+                'deduplicated': False,
+                'resumed': prior is not None
             }
             
         except Exception as e:
             # Update with error
-            self.supabase.table('data_ingestions').update({
-                'status': 'failed',
-                'error_log': {'error': str(e)},
-                'completed_at': datetime.utcnow().isoformat()
-            }).eq('id', ingestion_id).execute()
+            if ingestion_id is not None:
+                self.supabase.table('data_ingestions').update({
+                    'status': 'failed',
+                    'error_log': {'error': str(e)},
+                    'completed_at': datetime.utcnow().isoformat()
+                }).eq('id', ingestion_id).execute()
             
             raise
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def _find_prior_ingestion(self, content_hash: str, source_type: str) -> Optional[Dict[str, Any]]:
+        """Latest ingestion of identical content, preferring a completed one"""
+        result = self.supabase.table('data_ingestions')\
+            .select('id, status, records_processed, metadata, checkpoint, updated_at')\
+            .eq('content_hash', content_hash)\
+            .eq('source_type', source_type)\
+            .order('created_at', desc=True)\
+            .limit(10)\
+            .execute()
+        rows = result.data or []
+        completed = [row for row in rows if row['status'] == 'completed']
+        return (completed or rows or [None])[0]
+    
+    def _claim(self, ingestion: Dict[str, Any]) -> bool:
+        """Mark an interrupted ingestion processing again, only if no one else has touched it since it was read"""
+        query = self.supabase.table('data_ingestions').update({
+            'status': 'processing',
+            'error_log': None,
+            'updated_at': datetime.utcnow().isoformat()
+        }).eq('id', ingestion['id']).eq('status', ingestion['status'])
+        if ingestion.get('updated_at'):
+            query = query.eq('updated_at', ingestion['updated_at'])
+        else:
+            query = query.is_('updated_at', 'null')
+        return bool(query.execute().data)
+    
+    def _heartbeat(self, ingestion_id: str):
+        """Refresh updated_at so a long-running ingestion is not taken for an interrupted one"""
+        self.supabase.table('data_ingestions').update({
+            'updated_at': datetime.utcnow().isoformat()
+        }).eq('id', ingestion_id).execute()
+    
+    @staticmethod
+    def _is_interrupted(ingestion: Dict[str, Any]) -> bool:
+        """Failed, or still 'processing' without a recent checkpoint (the worker running it died)"""
+        if ingestion['status'] != 'processing':
+            return True
+        updated_at = ingestion.get('updated_at')
+        if not updated_at:
+            return True
+        updated = datetime.fromisoformat(updated_at.replace('Z', '+00:00')).replace(tzinfo=None)
+        return (datetime.utcnow() - updated).total_seconds() > STALE_INGESTION_SECONDS
     
     async def _process_spreadsheet(self, content: bytes, filename: str) -> Dict[str, Any]:
         """Process spreadsheet (Excel, CSV)"""
         try:
+            import pandas as pd
+            
             # Determine file type
             if filename.endswith('.csv'):
                 df = pd.read_csv(io.BytesIO(content))
@@ -95,58 +199,108 @@ class DataIngestionProcessor:
         except Exception as e:
             raise Exception(f"Error processing spreadsheet: {str(e)}")
     
-    async def _process_pdf(self, content: bytes) -> Dict[str, Any]:
-        """Process PDF file"""
+    async def _process_pdf(self, path: str, ingestion_id: str, extract_tables: bool = False) -> Dict[str, Any]:
+        """Process PDF file, extracting page ranges in parallel and streaming pages as they finish"""
         try:
-            import PyPDF2
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
+            # Pages are scanned for indicators as they stream in, so the full text is never held
+            indicators = IndicatorSet()
+            last_heartbeat = datetime.utcnow()
             
-            text_content = ""
-            for page in pdf_reader.pages:
-                text_content += page.extract_text()
+            async def on_page(page: Dict[str, Any]):
+                nonlocal last_heartbeat
+                indicators.add_text(page['text'])
+                if (datetime.utcnow() - last_heartbeat).total_seconds() >= HEARTBEAT_SECONDS:
+                    last_heartbeat = datetime.utcnow()
+                    self._heartbeat(ingestion_id)
             
-            # Process text content (extract entities, etc.)
+            stats = await PdfExtractionPipeline(tables=extract_tables).extract(path, on_page)
             
             return {
                 'records_processed': 1,
                 'metadata': {
-                    'pages': len(pdf_reader.pages),
-                    'text_length': len(text_content)
+                    'pages': stats['pages'],
+                    'text_length': stats['text_length'],
+                    'tables': stats['tables'],
+                    'page_errors': stats['page_errors'],
+                    'truncated': stats['truncated'],
+                    'extractor': stats['extractor'],
+                    'pages_per_second': stats['pages_per_second'],
+                    'indicators': self._save_indicators(ingestion_id, indicators)
                 }
             }
         except Exception as e:
             raise Exception(f"Error processing PDF: {str(e)}")
     
-    async def _process_document(self, content: bytes) -> Dict[str, Any]:
+    async def _process_document(self, content: bytes, ingestion_id: str) -> Dict[str, Any]:
         """Process Word document"""
         try:
             from docx import Document
             doc = Document(io.BytesIO(content))
             
             text_content = "\n".join([para.text for para in doc.paragraphs])
+            indicators = IndicatorSet()
+            indicators.add_text(text_content)
             
             return {
                 'records_processed': 1,
                 'metadata': {
                     'paragraphs': len(doc.paragraphs),
-                    'text_length': len(text_content)
+                    'text_length': len(text_content),
+                    'indicators': self._save_indicators(ingestion_id, indicators)
                 }
             }
         except Exception as e:
             raise Exception(f"Error processing document: {str(e)}")
     
-    async def _process_text(self, content: bytes) -> Dict[str, Any]:
-        """Process plain text/log file"""
+    async def _process_text(self, path: str, ingestion_id: str,
+                            checkpoint: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Process plain text/log file into normalized access and auth events, resuming from checkpoint"""
         try:
-            text = content.decode('utf-8', errors='ignore')
-            lines = text.split('\n')
+            indicators = IndicatorSet()
+            if checkpoint is not None:
+                IndicatorStore().load(ingestion_id, indicators)
+            
+            async def commit_chunk(stats: Dict[str, Any]):
+                # The chunk's events are already written; save its indicators, then record it
+                IndicatorStore().save(ingestion_id, indicators)
+                self.supabase.table('data_ingestions').update({
+                    'last_committed_chunk': stats['chunk'],
+                    'checkpoint': {key: stats[key] for key in ('chunk', 'lines', 'events', 'by_format')},
+                    'updated_at': datetime.utcnow().isoformat()
+                }).eq('id', ingestion_id).execute()
+            
+            stats = await LogIngestionPipeline().ingest_file(path, ingestion_id, indicators, checkpoint, commit_chunk)
             
             return {
-                'records_processed': len(lines),
+                'records_processed': stats['events'],
                 'metadata': {
-                    'lines': len(lines),
-                    'text_length': len(text)
+                    'lines': stats['lines'],
+                    'events': stats['events'],
+                    'events_by_format': stats['by_format'],
+                    'text_length': os.path.getsize(path),
+                    'lines_per_second': stats['lines_per_second'],
+                    'indicators': self._save_indicators(ingestion_id, indicators)
                 }
             }
         except Exception as e:
             raise Exception(f"Error processing text: {str(e)}")
+    
+    @staticmethod
+    def _save_indicators(ingestion_id: str, indicators: IndicatorSet) -> Dict[str, Any]:
+        """Store a document's extracted indicators and summarize them for the ingestion metadata"""
+        IndicatorStore().save(ingestion_id, indicators)
+        return indicators.summary()
+    
+    @staticmethod
+    async def _spool(file: UploadFile, suffix: str) -> Tuple[str, str]:
+        """Copy an upload to a temporary file, returning its path and SHA-256 hex digest"""
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as spool:
+            await file.seek(0)
+            while True:
+                chunk = await file.read(SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                spool.write(chunk)
+            return spool.name, digest.hexdigest()
@@ -0,0 +1,347 @@
+"""
+IOC Enrichment
+Rate-limited VirusTotal/AlienVault OTX lookups with in-flight dedup and a persistent TTL cache.
+Interactive callers can skip the rate-limit wait: they get cached results plus what the
+provider budget allows right now, and the rest is fetched (and cached) in the background.
+"""
+from typing import Dict, Any, List, Optional, Set, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import asyncio
+import base64
+import time
+
+import httpx
+
+from core.supabase_client import get_supabase_client
+from core.config import settings
+from intelligence.ioc_engine import normalize_ioc
+
+
+# Entries held in the in-process cache in front of the ioc_enrichments table
+MEMORY_CACHE_SIZE = 10000
+# Retries after a 429 before giving up on an indicator
+MAX_RATE_LIMIT_RETRIES = 3
+
+IOC = Tuple[str, str]
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def per_minute(cls, requests: int) -> 'TokenBucket':
+        return cls(rate=requests / 60.0, capacity=max(1, requests))
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until tokens are available, then take them"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def available(self) -> int:
+        """Whole tokens that could be taken now without waiting"""
+        tokens = min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate)
+        return max(0, int(tokens))
+
+    def penalize(self, seconds: float):
+        """Drain the bucket after a provider-side 429 so callers back off"""
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class EnrichmentProvider:
+    """Base class for an enrichment API"""
+
+    name = "base"
+    supported_types: Tuple[str, ...] = ()
+    # Indicators per request; providers without a bulk endpoint look up one at a time
+    max_batch_size = 1
+
+    def __init__(self, api_key: str, base_url: str, requests_per_minute: int):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.bucket = TokenBucket.per_minute(requests_per_minute)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    def supports(self, ioc_type: str) -> bool:
+        return ioc_type in self.supported_types
+
+    async def fetch_batch(self, client: httpx.AsyncClient, iocs: List[IOC]) -> Dict[IOC, Dict[str, Any]]:
+        """Look up a batch of indicators; the default issues one request per indicator"""
+        results = {}
+        for ioc in iocs:
+            results[ioc] = await self._fetch_with_retry(client, ioc)
+        return results
+
+    async def _fetch_with_retry(self, client: httpx.AsyncClient, ioc: IOC) -> Dict[str, Any]:
+        for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+            await self.bucket.acquire()
+            url, options = self._request(ioc)
+            response = await client.get(url, **options)
+            if response.status_code == 429:
+                self.bucket.penalize(float(response.headers.get('Retry-After', 60)))
+                continue
+            if response.status_code == 404:
+                return {'found': False}
+            response.raise_for_status()
+            return {'found': True, **self._summarize(response.json())}
+        return {'found': None, 'error': 'rate_limited'}
+
+    def _request(self, ioc: IOC) -> Tuple[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _summarize(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class VirusTotalProvider(EnrichmentProvider):
+    """VirusTotal API v3"""
+
+    name = "virustotal"
+    supported_types = ('ip', 'domain', 'url', 'hash')
+    _paths = {'ip': 'ip_addresses', 'domain': 'domains', 'url': 'urls', 'hash': 'files'}
+
+    def _request(self, ioc: IOC) -> Tuple[str, Dict[str, Any]]:
+        ioc_type, value = ioc
+        if ioc_type == 'url':
+            # URL identifiers are unpadded base64url of the URL
+            value = base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+        return f"{self.base_url}/{self._paths[ioc_type]}/{value}", {'headers': {'x-apikey': self.api_key}}
+
+    def _summarize(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        attributes = payload.get('data', {}).get('attributes', {})
+        stats = attributes.get('last_analysis_stats', {})
+        return {
+            'malicious': stats.get('malicious', 0),
+            'suspicious': stats.get('suspicious', 0),
+            'harmless': stats.get('harmless', 0),
+            'reputation': attributes.get('reputation'),
+            'tags': attributes.get('tags', [])
+        }
+
+
+class OTXProvider(EnrichmentProvider):
+    """AlienVault OTX DirectConnect API v1"""
+
+    name = "alienvault_otx"
+    supported_types = ('ip', 'domain', 'url', 'hash')
+
+    def _request(self, ioc: IOC) -> Tuple[str, Dict[str, Any]]:
+        ioc_type, value = ioc
+        section = {
+            'ip': 'IPv6' if ':' in value else 'IPv4',
+            'domain': 'domain',
+            'url': 'url',
+            'hash': 'file'
+        }[ioc_type]
+        # URLs (and IPv6 zone ids) carry '/', '?' and '#'; the value is one path segment
+        return f"{self.base_url}/indicators/{section}/{quote(value, safe='')}/general", \
+            {'headers': {'X-OTX-API-KEY': self.api_key}}
+
+    def _summarize(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        pulses = payload.get('pulse_info', {})
+        return {
+            'pulse_count': pulses.get('count', 0),
+            'pulses': [pulse.get('name') for pulse in pulses.get('pulses', [])[:10]],
+            'reputation': payload.get('reputation')
+        }
+
+
+def default_providers() -> List[EnrichmentProvider]:
+    """Providers configured from settings"""
+    return [
+        VirusTotalProvider(settings.virustotal_api_key, settings.virustotal_base_url,
+                           settings.virustotal_requests_per_minute),
+        OTXProvider(settings.alienvault_otx_api_key, settings.alienvault_otx_base_url,
+                    settings.alienvault_otx_requests_per_minute),
+    ]
+
+
+class EnrichmentService:
+    """Enrich indicators at most once per TTL per provider"""
+
+    def __init__(self, providers: Optional[List[EnrichmentProvider]] = None, ttl: Optional[timedelta] = None,
+                 persist: bool = True):
+        self.supabase = get_supabase_client() if persist else None
+        self.providers = [p for p in (providers if providers is not None else default_providers()) if p.enabled]
+        self.ttl = ttl or timedelta(hours=settings.enrichment_cache_ttl_hours)
+        self._memory: 'OrderedDict[Tuple[str, IOC], Tuple[datetime, Dict[str, Any]]]' = OrderedDict()
+        self._in_flight: Dict[Tuple[str, IOC], asyncio.Future] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        # Lookups deferred by callers that would not wait for the rate limit
+        self._background: Set[asyncio.Task] = set()
+
+    async def close(self):
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def enrich(self, ioc_type: str, ioc_value: str) -> Dict[str, Any]:
+        """Enrich a single indicator"""
+        results = await self.enrich_many([(ioc_type, ioc_value)])
+        return next(iter(results.values()), {})
+
+    async def enrich_many(self, iocs: List[IOC], wait: bool = True) -> Dict[IOC, Dict[str, Dict[str, Any]]]:
+        """
+        Enrich indicators with every applicable provider, keyed by normalized indicator.
+        With wait=False nothing waits on a provider's rate limit: lookups beyond its current
+        budget come back as {'found': None, 'pending': True} and complete in the background,
+        so asking again later is answered from the cache.
+        """
+        normalized = []
+        for ioc_type, value in iocs:
+            try:
+                normalized.append((ioc_type, normalize_ioc(ioc_type, value)))
+            except ValueError:
+                continue
+        normalized = list(dict.fromkeys(normalized))
+        results: Dict[IOC, Dict[str, Dict[str, Any]]] = {ioc: {} for ioc in normalized}
+
+        await asyncio.gather(*(self._enrich_with(provider, normalized, results, wait) for provider in self.providers))
+        return results
+
+    async def _enrich_with(self, provider: EnrichmentProvider, iocs: List[IOC],
+                           results: Dict[IOC, Dict[str, Dict[str, Any]]], wait: bool = True):
+        supported = [ioc for ioc in iocs if provider.supports(ioc[0])]
+        if not supported:
+            return
+
+        cached = self._cache_get(provider.name, supported)
+        waiting: Dict[IOC, asyncio.Future] = {}
+        to_fetch: List[IOC] = []
+        for ioc in supported:
+            if ioc in cached:
+                results[ioc][provider.name] = cached[ioc]
+            elif (provider.name, ioc) in self._in_flight:
+                # Another caller is already fetching this indicator; share its result
+                waiting[ioc] = self._in_flight[(provider.name, ioc)]
+            else:
+                self._in_flight[(provider.name, ioc)] = asyncio.get_running_loop().create_future()
+                to_fetch.append(ioc)
+
+        if not wait:
+            # Fetch what the provider's budget allows now; the rest continues without the caller
+            budget = provider.bucket.available()
+            deferred = to_fetch[budget:]
+            to_fetch = to_fetch[:budget]
+            if deferred:
+                task = asyncio.create_task(self._fetch(provider, deferred, {ioc: {} for ioc in deferred}))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+            for ioc in deferred + [ioc for ioc, future in waiting.items() if not future.done()]:
+                results[ioc][provider.name] = {'found': None, 'pending': True}
+            waiting = {ioc: future for ioc, future in waiting.items() if future.done()}
+
+        if to_fetch:
+            await self._fetch(provider, to_fetch, results)
+
+        for ioc, future in waiting.items():
+            results[ioc][provider.name] = await future
+
+    async def _fetch(self, provider: EnrichmentProvider, iocs: List[IOC],
+                     results: Dict[IOC, Dict[str, Dict[str, Any]]]):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30)
+        try:
+            for start in range(0, len(iocs), provider.max_batch_size):
+                batch = iocs[start:start + provider.max_batch_size]
+                try:
+                    fetched = await provider.fetch_batch(self._client, batch)
+                except Exception as e:
+                    fetched = {ioc: {'found': None, 'error': str(e)} for ioc in batch}
+
+                # Errors are returned but not cached, so the next call retries them
+                self._cache_put(provider.name, {ioc: r for ioc, r in fetched.items() if r.get('found') is not None})
+                for ioc in batch:
+                    result = fetched.get(ioc, {'found': None, 'error': 'missing'})
+                    results[ioc][provider.name] = result
+                    self._in_flight.pop((provider.name, ioc)).set_result(result)
+        finally:
+            # Release anyone still waiting if this fetch was cancelled
+            for ioc in iocs:
+                future = self._in_flight.pop((provider.name, ioc), None)
+                if future is not None and not future.done():
+                    future.set_result({'found': None, 'error': 'cancelled'})
+
+    def _cache_get(self, provider: str, iocs: List[IOC]) -> Dict[IOC, Dict[str, Any]]:
+        """Read fresh entries from memory, then one batched query for the rest"""
+        now = datetime.utcnow()
+        hits: Dict[IOC, Dict[str, Any]] = {}
+        missing: List[IOC] = []
+        for ioc in iocs:
+            entry = self._memory.get((provider, ioc))
+            if entry and entry[0] > now:
+                self._memory.move_to_end((provider, ioc))
+                hits[ioc] = entry[1]
+            else:
+                missing.append(ioc)
+
+        if missing and self.supabase is not None:
+            try:
+                rows = self.supabase.table('ioc_enrichments')\
+                    .select('ioc_type, ioc_value, result, expires_at')\
+                    .eq('provider', provider)\
+                    .in_('ioc_value', list({value for _, value in missing}))\
+                    .gt('expires_at', now.isoformat())\
+                    .execute().data or []
+                wanted = set(missing)
+                for row in rows:
+                    ioc = (row['ioc_type'], row['ioc_value'])
+                    if ioc in wanted:
+                        hits[ioc] = row['result']
+                        expires_at = datetime.fromisoformat(row['expires_at'].replace('Z', '+00:00')).replace(tzinfo=None)
+                        self._remember(provider, ioc, expires_at, row['result'])
+            except Exception as e:
+                print(f"Error reading enrichment cache: {e}")
+        return hits
+
+    def _cache_put(self, provider: str, results: Dict[IOC, Dict[str, Any]]):
+        if not results:
+            return
+        fetched_at = datetime.utcnow()
+        expires_at = fetched_at + self.ttl
+        for ioc, result in results.items():
+            self._remember(provider, ioc, expires_at, result)
+        if self.supabase is None:
+            return
+        try:
+            self.supabase.table('ioc_enrichments').upsert([
+                {
+                    'provider': provider,
+                    'ioc_type': ioc[0],
+                    'ioc_value': ioc[1],
+                    'result': result,
+                    'fetched_at': fetched_at.isoformat(),
+                    'expires_at': expires_at.isoformat()
+                }
+                for ioc, result in results.items()
+            ], on_conflict='provider,ioc_type,ioc_value').execute()
+        except Exception as e:
+            print(f"Error writing enrichment cache: {e}")
+
+    def _remember(self, provider: str, ioc: IOC, expires_at: datetime, result: Dict[str, Any]):
+        self._memory[(provider, ioc)] = (expires_at, result)
+        self._memory.move_to_end((provider, ioc))
+        while len(self._memory) > MEMORY_CACHE_SIZE:
+            self._memory.popitem(last=False)
+
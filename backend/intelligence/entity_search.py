@@ -0,0 +1,236 @@
+"""
+Entity Search
+Entity extraction from chat messages and an in-memory prefix index for typeahead
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import asyncio
+import re
+
+from core.supabase_client import get_supabase_client, quote_filter_value
+
+
+# How long a loaded index is served before it is rebuilt in the background
+INDEX_TTL = timedelta(minutes=5)
+# How long to wait before retrying after a failed build
+RETRY_AFTER = timedelta(seconds=30)
+# Rows fetched per page while building the index
+PAGE_SIZE = 1000
+
+_EMAIL = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+_DOMAIN = re.compile(r'\b(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,}\b')
+_QUOTED = re.compile(r'"([^"]{2,100})"|“([^”]{2,100})”|(?:^|(?<=\s))\'([^\']{2,100})\'(?=[\s.,;:?!]|$)')
+_CAPITALIZED_RUN = re.compile(r'\b[A-Z][a-zA-Z\'-]+(?:\s+[A-Z][a-zA-Z\'-]+)+\b')
+_TOKEN = re.compile(r"[a-z0-9@._'-]+")
+_LIKE_SPECIAL = re.compile(r'[%_\\]')
+
+# Capitalized words that start chat requests rather than names
+_LEADING_WORDS = {
+    'search', 'find', 'lookup', 'look', 'show', 'check', 'get', 'list', 'who', 'what',
+    'is', 'are', 'the', 'please', 'can', 'could', 'analyze', 'review', 'user', 'organization'
+}
+_STOPWORDS = _LEADING_WORDS | {
+    'for', 'a', 'an', 'of', 'in', 'on', 'at', 'to', 'me', 'up', 'named', 'called', 'with',
+    'individual', 'individuals', 'person', 'employee', 'company', 'org', 'organizations', 'and', 'or'
+}
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+def extract_entities(message: str) -> Dict[str, List[str]]:
+    """Extract emails, domains and candidate names from a chat message"""
+    emails = list(dict.fromkeys(match.lower() for match in _EMAIL.findall(message)))
+
+    # Domains that are only the host part of an extracted email are not separate entities
+    without_emails = _EMAIL.sub(' ', message)
+    domains = list(dict.fromkeys(match.lower() for match in _DOMAIN.findall(without_emails)))
+
+    names = []
+    for groups in _QUOTED.findall(message):
+        name = next(group for group in groups if group).strip()
+        if name:
+            names.append(name)
+
+    unquoted = _QUOTED.sub(' ', without_emails)
+    for run in _CAPITALIZED_RUN.findall(unquoted):
+        words = run.split()
+        while words and words[0].lower() in _LEADING_WORDS:
+            words = words[1:]
+        if len(words) >= 2:
+            names.append(' '.join(words))
+
+    keywords = [
+        token for token in _TOKEN.findall(_normalize(unquoted))
+        if token not in _STOPWORDS and len(token) > 2 and '@' not in token
+    ]
+    return {
+        'emails': emails,
+        'domains': domains,
+        'names': list(dict.fromkeys(names)),
+        'keywords': list(dict.fromkeys(keywords))
+    }
+
+
+def escape_filter_value(value: str) -> str:
+    """Strip characters that would break a PostgREST or() filter"""
+    return re.sub(r'[,()%*]', ' ', value).strip()
+
+
+def email_filter(emails: List[str], column: str = 'email') -> str:
+    """PostgREST or() filter matching any of the emails regardless of case"""
+    # ilike without wildcards is a case-insensitive equality once LIKE metacharacters are escaped;
+    # '*' (PostgREST's wildcard alias) cannot be escaped, so addresses containing it are dropped
+    conditions = []
+    for email in emails:
+        if '*' not in email:
+            pattern = _LIKE_SPECIAL.sub(lambda match: '\\' + match.group(), email)
+            conditions.append(f"{column}.ilike.{quote_filter_value(pattern)}")
+    return ','.join(conditions)
+
+
+class PrefixIndex:
+    """Sorted-key prefix index; lookups are a binary search plus a short scan"""
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._refs: List[Tuple[str, str]] = []
+        self._entities: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def build(self, entities: List[Dict[str, Any]]):
+        """Build the index from entities carrying entity_type, id, label and search terms"""
+        pairs = []
+        for entity in entities:
+            ref = (entity['entity_type'], entity['id'])
+            self._entities[ref] = entity
+            for term in entity.get('terms', []):
+                normalized = _normalize(term)
+                if not normalized:
+                    continue
+                # Index the full term and every word suffix so "smi" finds "John Smith"
+                words = normalized.split()
+                for i in range(len(words)):
+                    pairs.append((' '.join(words[i:]), ref))
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._refs = [ref for _, ref in pairs]
+
+    def search(self, prefix: str, limit: int = 10, entity_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return up to limit entities with a term starting with prefix"""
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+
+        results = []
+        seen = set()
+        position = bisect_left(self._keys, prefix)
+        while position < len(self._keys) and self._keys[position].startswith(prefix):
+            ref = self._refs[position]
+            position += 1
+            if ref in seen or (entity_type and ref[0] != entity_type):
+                continue
+            seen.add(ref)
+            entity = self._entities[ref]
+            results.append({k: v for k, v in entity.items() if k != 'terms'})
+            if len(results) >= limit:
+                break
+        return results
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+
+class EntitySearchIndex:
+    """Typeahead index over individuals and organizations, refreshed on a TTL"""
+
+    def __init__(self):
+        self.supabase = get_supabase_client()
+        self.index = PrefixIndex()
+        self.built_at: Optional[datetime] = None
+        self.failed_at: Optional[datetime] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        # One rebuild at a time; requests that arrive during a build wait for it instead of starting another
+        self._refresh_lock = asyncio.Lock()
+
+    async def search(self, prefix: str, limit: int = 10, entity_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Prefix search, loading the index on first use"""
+        await self.ensure_fresh()
+        return self.index.search(prefix, limit, entity_type)
+
+    async def ensure_fresh(self):
+        """Build the index if missing; rebuild in the background once stale"""
+        now = datetime.utcnow()
+        if self.failed_at is not None and now - self.failed_at < RETRY_AFTER:
+            # The last build failed; serve what is loaded (possibly nothing) until the retry delay passes
+            return
+        if self.built_at is None:
+            await self.refresh()
+        elif now - self.built_at > INDEX_TTL:
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self.refresh())
+
+    async def refresh(self):
+        """Reload entities and swap in a freshly built index; on failure the previous index stays in place"""
+        requested_at = datetime.utcnow()
+        async with self._refresh_lock:
+            # Another request built (or failed to build) the index while this one waited
+            if max(self.built_at or datetime.min, self.failed_at or datetime.min) >= requested_at:
+                return
+            try:
+                self.index = await asyncio.to_thread(self._build)
+                self.built_at = datetime.utcnow()
+                self.failed_at = None
+            except Exception as e:
+                self.failed_at = datetime.utcnow()
+                print(f"Error building entity search index: {e}")
+
+    def _build(self) -> PrefixIndex:
+        """Fetch every entity and build an index from them (runs in a worker thread)"""
+        entities = []
+        for row in self._fetch_all('individuals', 'id, full_name, email, risk_score'):
+            entities.append({
+                'entity_type': 'individual',
+                'id': row['id'],
+                'label': row.get('full_name') or row.get('email'),
+                'email': row.get('email'),
+                'risk_score': row.get('risk_score'),
+                'terms': [t for t in (row.get('full_name'), row.get('email')) if t]
+            })
+        for row in self._fetch_all('organizations', 'id, name, domain, risk_score'):
+            entities.append({
+                'entity_type': 'organization',
+                'id': row['id'],
+                'label': row.get('name'),
+                'domain': row.get('domain'),
+                'risk_score': row.get('risk_score'),
+                'terms': [t for t in (row.get('name'), row.get('domain')) if t]
+            })
+
+        index = PrefixIndex()
+        index.build(entities)
+        return index
+
+    def _fetch_all(self, table: str, columns: str) -> List[Dict[str, Any]]:
+        rows = []
+        start = 0
+        while True:
+            result = self.supabase.table(table).select(columns).order('id').range(start, start + PAGE_SIZE - 1).execute()
+            rows.extend(result.data or [])
+            if not result.data or len(result.data) < PAGE_SIZE:
+                return rows
+            start += PAGE_SIZE
+
+
+_entity_search_index: Optional[EntitySearchIndex] = None
+
+
+def get_entity_search_index() -> EntitySearchIndex:
+    """Get or create the process-wide entity search index"""
+    global _entity_search_index
+
+    if _entity_search_index is None:
+        _entity_search_index = EntitySearchIndex()
+
+    return _entity_search_index
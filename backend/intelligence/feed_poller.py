@@ -0,0 +1,286 @@
+"""
+Threat Feed Poller
+Polls active STIX/TAXII feeds from the threat_feeds table and merges indicators into threats.
+Each collection resumes from the server's own X-TAXII-Date-Added-Last, never the local clock,
+and a Redis lock keeps overlapping scheduled runs from polling the same feeds twice.
+"""
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import re
+import uuid
+
+import httpx
+
+from core.redis_client import get_redis
+from core.supabase_client import get_supabase_client
+from intelligence.threat_store import ThreatSightingWriter
+
+
+# Collections polled at the same time across all feeds
+MAX_CONCURRENT_COLLECTIONS = 4
+# Objects requested per TAXII page
+PAGE_SIZE = 500
+# Distinct IOCs buffered before merging into threats
+MERGE_BATCH_SIZE = 500
+DEFAULT_FREQUENCY = timedelta(hours=1)
+REQUEST_TIMEOUT_SECONDS = 60
+# Held while a poll runs; expires on its own if the worker holding it dies
+POLL_LOCK_KEY = 'cts:lock:feed-poll'
+POLL_LOCK_TTL_SECONDS = 30 * 60
+
+TAXII_MEDIA_TYPE = 'application/taxii+json;version=2.1'
+_RELEASE_LOCK = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+_FREQUENCY_WORDS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+    'realtime': timedelta(minutes=5),
+}
+_FREQUENCY = re.compile(r'^\s*(\d+)\s*(m|min|mins|minutes?|h|hrs?|hours?|d|days?|w|weeks?)\s*$', re.IGNORECASE)
+
+# [ipv4-addr:value = '198.51.100.1'] OR [file:hashes.'SHA-256' = '...']
+_PATTERN_COMPARISON = re.compile(r"([\w-]+):([\w.'-]+)\s*=\s*'((?:\\'|[^'])*)'")
+_STIX_OBJECT_TYPES = {
+    ('ipv4-addr', 'value'): 'ip',
+    ('ipv6-addr', 'value'): 'ip',
+    ('domain-name', 'value'): 'domain',
+    ('url', 'value'): 'url',
+    ('email-addr', 'value'): 'email',
+    ('file', 'name'): 'filename',
+}
+
+
+def parse_frequency(value: Optional[str]) -> timedelta:
+    """Parse threat_feeds.update_frequency ('hourly', '15m', '6 hours', ...)"""
+    if not value:
+        return DEFAULT_FREQUENCY
+    text = value.strip().lower()
+    if text in _FREQUENCY_WORDS:
+        return _FREQUENCY_WORDS[text]
+    match = _FREQUENCY.match(text)
+    if not match:
+        return DEFAULT_FREQUENCY
+    amount, unit = int(match.group(1)), match.group(2)[0]
+    return {
+        'm': timedelta(minutes=amount),
+        'h': timedelta(hours=amount),
+        'd': timedelta(days=amount),
+        'w': timedelta(weeks=amount),
+    }[unit]
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def is_due(feed: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """Whether a feed's update frequency has elapsed since its last update"""
+    now = now or datetime.now(timezone.utc)
+    last_update = _parse_timestamp(feed.get('last_update'))
+    return last_update is None or now - last_update >= parse_frequency(feed.get('update_frequency'))
+
+
+def parse_indicator_pattern(pattern: str) -> List[Tuple[str, str]]:
+    """Extract (ioc_type, value) pairs from the equality comparisons of a STIX pattern"""
+    iocs = []
+    for object_type, path, value in _PATTERN_COMPARISON.findall(pattern or ''):
+        value = value.replace("\\'", "'")
+        if object_type == 'file' and path.startswith('hashes.'):
+            iocs.append(('hash', value.lower()))
+        elif (object_type, path) in _STIX_OBJECT_TYPES:
+            iocs.append((_STIX_OBJECT_TYPES[(object_type, path)], value))
+    return iocs
+
+
+def _severity(indicator: Dict[str, Any]) -> str:
+    confidence = indicator.get('confidence')
+    if confidence is None:
+        return 'medium'
+    if confidence >= 85:
+        return 'high'
+    if confidence >= 50:
+        return 'medium'
+    return 'low'
+
+
+def indicator_to_threats(indicator: Dict[str, Any], feed_name: str) -> Iterator[Dict[str, Any]]:
+    """Map one STIX indicator to threat sightings, one per IOC in its pattern"""
+    tactics = [
+        phase['phase_name'] for phase in indicator.get('kill_chain_phases', [])
+        if phase.get('kill_chain_name') == 'mitre-attack' and phase.get('phase_name')
+    ]
+    techniques = [
+        ref['external_id'] for ref in indicator.get('external_references', [])
+        if ref.get('source_name') == 'mitre-attack' and ref.get('external_id')
+    ]
+    seen_at = indicator.get('modified') or indicator.get('created') or datetime.now(timezone.utc).isoformat()
+    iocs = parse_indicator_pattern(indicator.get('pattern', ''))
+    for ioc_type, value in iocs:
+        yield {
+            'title': indicator.get('name') or f"{ioc_type.upper()} indicator {value}",
+            'description': indicator.get('description'),
+            'severity': _severity(indicator),
+            'threat_type': ', '.join(indicator.get('indicator_types', [])) or 'indicator',
+            'source': feed_name,
+            'ioc_type': ioc_type,
+            'ioc_value': value,
+            'mitre_attack_tactics': tactics,
+            'mitre_attack_techniques': techniques,
+            'metadata': {
+                'stix_id': indicator['id'],
+                'pattern': indicator.get('pattern'),
+                'confidence': indicator.get('confidence'),
+                'labels': indicator.get('labels', [])
+            },
+            'first_seen': indicator.get('valid_from') or seen_at,
+            'last_seen': seen_at
+        }
+
+
+async def fetch_objects(client: httpx.AsyncClient, url: str, added_after: Optional[str] = None,
+                        auth: Optional[Tuple[str, str]] = None,
+                        page_size: int = PAGE_SIZE) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """
+    Page through a TAXII 2.1 collection's indicators added after added_after.
+    Yields (objects, date_added_last) per page; date_added_last is the server's
+    X-TAXII-Date-Added-Last header, the value to pass as added_after next time.
+    """
+    params: Dict[str, Any] = {'match[type]': 'indicator', 'limit': page_size}
+    if added_after:
+        params['added_after'] = added_after
+    while True:
+        response = await client.get(url.rstrip('/') + '/objects/', params=params, auth=auth,
+                                    headers={'Accept': TAXII_MEDIA_TYPE})
+        response.raise_for_status()
+        envelope = response.json() if response.content else {}
+        yield envelope.get('objects', []), response.headers.get('X-TAXII-Date-Added-Last')
+        if not envelope.get('more') or not envelope.get('next'):
+            return
+        params['next'] = envelope['next']
+
+
+class ThreatFeedPoller:
+    """Poll due TAXII feeds concurrently with bounded parallelism"""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_COLLECTIONS):
+        self.supabase = get_supabase_client()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.running = False
+
+    async def run_forever(self, check_interval: int = 60):
+        """Poll due feeds every check_interval seconds"""
+        self.running = True
+        while self.running:
+            try:
+                await self.poll_due_feeds()
+            except Exception as e:
+                print(f"Error in feed poller: {e}")
+            await asyncio.sleep(check_interval)
+
+    def stop(self):
+        self.running = False
+
+    async def poll_due_feeds(self) -> Dict[str, Any]:
+        """Poll every active feed whose update frequency has elapsed; skipped while another run holds the lock"""
+        redis = await get_redis()
+        token = uuid.uuid4().hex
+        if redis is not None and not await redis.set(POLL_LOCK_KEY, token, nx=True, ex=POLL_LOCK_TTL_SECONDS):
+            print("Feed poll already running elsewhere, skipping")
+            return {}
+        try:
+            result = self.supabase.table('threat_feeds').select('*').eq('status', 'active').execute()
+            due = [feed for feed in result.data or [] if is_due(feed)]
+            outcomes = await asyncio.gather(*(self.poll_feed(feed) for feed in due))
+            return {feed['feed_name']: outcome for feed, outcome in zip(due, outcomes)}
+        finally:
+            if redis is not None:
+                await redis.eval(_RELEASE_LOCK, 1, POLL_LOCK_KEY, token)
+
+    async def poll_feed(self, feed: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fetch everything added to a feed's collections since the last poll.
+        configuration.added_after keeps each collection's server-side watermark; last_update
+        (the local poll time) only schedules the next poll, or seeds a collection polled
+        for the first time by a feed that predates per-collection watermarks.
+        """
+        poll_started = datetime.now(timezone.utc)
+        configuration = feed.get('configuration') or {}
+        watermarks = dict(configuration.get('added_after') or {})
+        try:
+            collections = await self._collection_urls(feed)
+            counts = await asyncio.gather(*(
+                self._poll_collection(feed, url, watermarks.get(url) or feed.get('last_update')) for url in collections
+            ))
+            # Only advance the watermarks once every collection succeeded
+            for url, (_, _, date_added_last) in zip(collections, counts):
+                if date_added_last:
+                    watermarks[url] = date_added_last
+            configuration.pop('last_error', None)
+            configuration['added_after'] = watermarks
+            self.supabase.table('threat_feeds').update({
+                'last_update': poll_started.isoformat(),
+                'configuration': configuration
+            }).eq('id', feed['id']).execute()
+            return {
+                'collections': len(collections),
+                'threats': sum(written for written, _, _ in counts),
+                'new_threats': sum(new for _, new, _ in counts)
+            }
+        except Exception as e:
+            print(f"Error polling feed {feed.get('feed_name')}: {e}")
+            configuration['last_error'] = {'error': str(e), 'at': poll_started.isoformat()}
+            self.supabase.table('threat_feeds').update({
+                'configuration': configuration
+            }).eq('id', feed['id']).execute()
+            return {'error': str(e)}
+
+    async def _collection_urls(self, feed: Dict[str, Any]) -> List[str]:
+        """Resolve collection URLs from configuration or API root discovery"""
+        configuration = feed.get('configuration') or {}
+        base_url = feed['source_url'].rstrip('/') + '/'
+        if configuration.get('collections'):
+            return [f"{base_url}collections/{collection_id}/" for collection_id in configuration['collections']]
+
+        from taxii2client.v21 import ApiRoot
+
+        def discover() -> List[str]:
+            api_root = ApiRoot(base_url, user=configuration.get('username'), password=configuration.get('password'))
+            return [collection.url for collection in api_root.collections if collection.can_read]
+
+        return await asyncio.to_thread(discover)
+
+    async def _poll_collection(self, feed: Dict[str, Any], url: str,
+                               added_after: Optional[str]) -> Tuple[int, int, Optional[str]]:
+        """
+        Stream one collection page by page, merging indicators as they arrive.
+        Returns (written, new, the newest X-TAXII-Date-Added-Last seen).
+        """
+        configuration = feed.get('configuration') or {}
+        auth = (configuration['username'], configuration.get('password') or '') \
+            if configuration.get('username') else None
+        async with self.semaphore:
+            written = new = 0
+            date_added_last = None
+            writer = ThreatSightingWriter()
+            async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT_SECONDS) as client:
+                async for objects, page_added_last in fetch_objects(client, url, added_after, auth):
+                    date_added_last = max(filter(None, (date_added_last, page_added_last)), default=None)
+                    for obj in objects:
+                        if obj.get('type') != 'indicator' or obj.get('revoked'):
+                            continue
+                        for sighting in indicator_to_threats(obj, feed['feed_name']):
+                            writer.add(sighting)
+                        if len(writer) >= MERGE_BATCH_SIZE:
+                            merged = await writer.flush()
+                            written += len(merged)
+                            new += sum(1 for row in merged if row.get('inserted'))
+            merged = await writer.flush()
+            written += len(merged)
+            new += sum(1 for row in merged if row.get('inserted'))
+            return written, new, date_added_last
+
@@ -0,0 +1,480 @@
+"""
+IOC Matching Engine
+In-memory index over threat indicators for single-pass scanning of free text and logs
+"""
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+from collections import deque
+from datetime import datetime, timedelta
+import asyncio
+import ipaddress
+import re
+import time
+
+from core.supabase_client import get_supabase_client, keyset_after
+
+
+IOC_TYPES = ('ip', 'domain', 'url', 'hash', 'email', 'filename')
+# Rows fetched per page while loading threats
+PAGE_SIZE = 1000
+# How often the indicator index is rebuilt from the whole threats table
+REBUILD_INTERVAL = timedelta(minutes=10)
+
+# One alternation tokenizes every candidate indicator that is looked up exactly
+_CANDIDATES = re.compile(
+    r'(?P<email>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b)'
+    r'|(?P<ipv4>(?<![\d.])(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)(?!\d|\.\w))'
+    r'|(?P<ipv6>(?<![\w:])(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f]{0,4}(?![\w:]))'
+    r'|(?P<hash>\b(?:[A-Fa-f0-9]{64}|[A-Fa-f0-9]{40}|[A-Fa-f0-9]{32})\b)'
+    r'|(?P<domain>\b(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63}\b)'
+)
+_SCHEME = re.compile(r'^[a-z][a-z0-9+.-]*://')
+_REFANG = [('[.]', '.'), ('(.)', '.'), ('[dot]', '.'), ('[@]', '@'), ('[at]', '@'), ('hxxp', 'http')]
+
+IOCKey = Tuple[str, str]
+
+
+def refang(text: str) -> str:
+    """Undo common indicator defanging (hxxp, [.], [@])"""
+    for old, new in _REFANG:
+        if old in text:
+            text = text.replace(old, new)
+    return text
+
+
+def normalize_ioc(ioc_type: str, value: str) -> str:
+    """Canonical form used as the lookup key for an indicator"""
+    value = refang(value.strip()).lower()
+    if ioc_type == 'domain':
+        return value.rstrip('.')
+    if ioc_type == 'url':
+        return _SCHEME.sub('', value)
+    if ioc_type == 'ip':
+        return str(ipaddress.ip_network(value, strict=False)) if '/' in value else str(ipaddress.ip_address(value))
+    return value
+
+
+def extract_candidates(text: str) -> List[Tuple[str, str]]:
+    """Distinct (ioc_type, value) candidates appearing in text"""
+    kinds = {'email': 'email', 'ipv4': 'ip', 'ipv6': 'ip', 'hash': 'hash', 'domain': 'domain'}
+    candidates = []
+    for match in _CANDIDATES.finditer(refang(text)):
+        kind = match.lastgroup
+        value = match.group(kind).lower()
+        if kind == 'ipv6':
+            try:
+                ipaddress.ip_address(value)
+            except ValueError:
+                continue
+        candidates.append((kinds[kind], value))
+    return list(dict.fromkeys(candidates))
+
+
+class IPPrefixTree:
+    """Binary prefix tree over address bits; a stored CIDR matches every address inside it"""
+
+    def __init__(self):
+        # node = [zero child, one child, key]
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self.size = 0
+
+    def add(self, value: str, key: IOCKey):
+        network = ipaddress.ip_network(value, strict=False)
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for i in range(network.prefixlen):
+            bit = (bits >> (width - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            self.size += 1
+        node[2] = key
+
+    def remove(self, value: str):
+        network = ipaddress.ip_network(value, strict=False)
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for i in range(network.prefixlen):
+            node = node[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                return
+        if node[2] is not None:
+            self.size -= 1
+        node[2] = None
+
+    def lookup(self, address: str) -> List[IOCKey]:
+        """Return every stored prefix that contains address, shortest first"""
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return []
+        node = self._roots[ip.version]
+        bits = int(ip)
+        width = ip.max_prefixlen
+        matches = []
+        for i in range(width):
+            if node[2] is not None:
+                matches.append(node[2])
+            node = node[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                return matches
+        if node[2] is not None:
+            matches.append(node[2])
+        return matches
+
+
+class DomainTrie:
+    """Trie over reversed domain labels; a stored domain also matches its subdomains"""
+
+    _KEY = '\0'
+
+    def __init__(self):
+        self._root: Dict[str, Any] = {}
+        self.size = 0
+
+    def add(self, domain: str, key: IOCKey):
+        node = self._root
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        if self._KEY not in node:
+            self.size += 1
+        node[self._KEY] = key
+
+    def remove(self, domain: str):
+        node = self._root
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                return
+        if node.pop(self._KEY, None) is not None:
+            self.size -= 1
+
+    def lookup(self, domain: str) -> List[IOCKey]:
+        """Return stored domains equal to or parent of domain"""
+        node = self._root
+        matches = []
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            if self._KEY in node:
+                matches.append(node[self._KEY])
+        return matches
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton for substring matching; rebuilt lazily after changes"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Set[IOCKey]] = [set()]
+        self._out_link: List[int] = [0]
+        self._built = True
+        self.size = 0
+
+    def add(self, pattern: str, key: IOCKey):
+        node = 0
+        for char in pattern:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+                self._out_link.append(0)
+                self._goto[node][char] = child
+            node = child
+        if key not in self._out[node]:
+            self.size += 1
+        self._out[node].add(key)
+        self._built = False
+
+    def remove(self, pattern: str, key: IOCKey):
+        node = 0
+        for char in pattern:
+            node = self._goto[node].get(char)
+            if node is None:
+                return
+        if key in self._out[node]:
+            self.size -= 1
+            self._out[node].discard(key)
+            self._built = False
+
+    def _build(self):
+        """Compute failure links and output links breadth-first"""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._out_link[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                fail = self._fail[child]
+                self._out_link[child] = fail if self._out[fail] else self._out_link[fail]
+                queue.append(child)
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, IOCKey]]:
+        """Yield (end position, key) for every stored pattern occurring in text"""
+        if self.size == 0:
+            return
+        if not self._built:
+            self._build()
+        goto, fail, out, out_link = self._goto, self._fail, self._out, self._out_link
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if out[node] else out_link[node]
+            while match:
+                for key in out[match]:
+                    yield position, key
+                match = out_link[match]
+
+
+class IOCEngine:
+    """Index threat indicators by type and scan text against all of them in one pass"""
+
+    def __init__(self):
+        self.hashes: Dict[str, IOCKey] = {}
+        self.emails: Dict[str, IOCKey] = {}
+        self.ips = IPPrefixTree()
+        self.domains = DomainTrie()
+        self.substrings = AhoCorasick()
+        self.threats: Dict[IOCKey, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.threats)
+
+    def add(self, ioc_type: str, ioc_value: str, threat: Optional[Dict[str, Any]] = None) -> Optional[IOCKey]:
+        """Add or replace an indicator; returns its key, or None if it is invalid"""
+        if ioc_type not in IOC_TYPES or not ioc_value:
+            return None
+        try:
+            value = normalize_ioc(ioc_type, ioc_value)
+        except ValueError:
+            return None
+        key = (ioc_type, value)
+
+        if ioc_type == 'hash':
+            self.hashes[value] = key
+        elif ioc_type == 'email':
+            self.emails[value] = key
+        elif ioc_type == 'ip':
+            self.ips.add(value, key)
+        elif ioc_type == 'domain':
+            self.domains.add(value, key)
+        else:
+            self.substrings.add(value, key)
+
+        self.threats[key] = threat or {'ioc_type': ioc_type, 'ioc_value': ioc_value}
+        return key
+
+    def remove(self, ioc_type: str, ioc_value: str):
+        """Remove an indicator"""
+        try:
+            value = normalize_ioc(ioc_type, ioc_value)
+        except ValueError:
+            return
+        key = (ioc_type, value)
+        if self.threats.pop(key, None) is None:
+            return
+
+        if ioc_type == 'hash':
+            self.hashes.pop(value, None)
+        elif ioc_type == 'email':
+            self.emails.pop(value, None)
+        elif ioc_type == 'ip':
+            self.ips.remove(value)
+        elif ioc_type == 'domain':
+            self.domains.remove(value)
+        else:
+            self.substrings.remove(value, key)
+
+    def prepare(self):
+        """Finish lazy index builds up front, e.g. before scanning from several threads"""
+        if self.substrings.size and not self.substrings._built:
+            self.substrings._build()
+
+    def scan(self, text: str) -> List[Dict[str, Any]]:
+        """Return one match per indicator found in text"""
+        if not text or not self.threats:
+            return []
+        text = refang(text)
+        found: Dict[IOCKey, str] = {}
+
+        for match in _CANDIDATES.finditer(text):
+            kind = match.lastgroup
+            token = match.group(kind).lower()
+            if kind == 'email':
+                keys = [self.emails[token]] if token in self.emails else []
+                keys += self.domains.lookup(token.rsplit('@', 1)[1])
+            elif kind in ('ipv4', 'ipv6'):
+                keys = self.ips.lookup(token)
+            elif kind == 'hash':
+                keys = [self.hashes[token]] if token in self.hashes else []
+            else:
+                keys = self.domains.lookup(token.rstrip('.'))
+            for key in keys:
+                found.setdefault(key, token)
+
+        if self.substrings.size:
+            lowered = text.lower()
+            for end, key in self.substrings.iter_matches(lowered):
+                found.setdefault(key, lowered[end - len(key[1]) + 1:end + 1])
+
+        return [
+            {'ioc_type': key[0], 'ioc_value': key[1], 'matched': matched, 'threat': self.threats.get(key)}
+            for key, matched in found.items()
+        ]
+
+    def scan_lines(self, lines: Iterable[str]) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """Yield (line number, matches) for each line with at least one match"""
+        for number, line in enumerate(lines, start=1):
+            matches = self.scan(line)
+            if matches:
+                yield number, matches
+
+    def stats(self) -> Dict[str, int]:
+        """Indicator counts per structure"""
+        return {
+            'total': len(self.threats),
+            'hashes': len(self.hashes),
+            'emails': len(self.emails),
+            'ip_prefixes': self.ips.size,
+            'domains': self.domains.size,
+            'substrings': self.substrings.size
+        }
+
+
+class ThreatIndicatorIndex:
+    """
+    IOCEngine kept in sync with the threats table. Each refresh appends threats created since
+    the last one; every REBUILD_INTERVAL the engine is rebuilt from the whole table instead, so
+    threats merged in place (e.g. raised severity) or deleted are reflected.
+    """
+
+    def __init__(self):
+        self.supabase = get_supabase_client()
+        self.engine = IOCEngine()
+        # (created_at, id) of the last threat loaded
+        self.loaded_until: Optional[str] = None
+        self.loaded_id: Optional[str] = None
+        self.built_at: Optional[datetime] = None
+
+    async def refresh(self) -> int:
+        """Load threats created since the last refresh, or rebuild once due; returns indicators added"""
+        if self.built_at is None or datetime.utcnow() - self.built_at > REBUILD_INTERVAL:
+            return await self.rebuild()
+
+        added = 0
+        cursor = (self.loaded_until, self.loaded_id)
+        try:
+            while True:
+                rows = self._page(cursor)
+                for row in rows:
+                    if self.engine.add(row.get('ioc_type'), row.get('ioc_value'), row):
+                        added += 1
+                if rows:
+                    cursor = (rows[-1]['created_at'], rows[-1]['id'])
+                if len(rows) < PAGE_SIZE:
+                    break
+        except Exception as e:
+            print(f"Error loading threat indicators: {e}")
+        # Advance only past what was actually loaded
+        self.loaded_until, self.loaded_id = cursor
+        return added
+
+    async def rebuild(self) -> int:
+        """Build a new engine from every threat and swap it in; on failure the current one stays"""
+        built_at = datetime.utcnow()
+        try:
+            engine, cursor = await asyncio.to_thread(self._build)
+        except Exception as e:
+            print(f"Error rebuilding threat indicators: {e}")
+            return 0
+        self.engine = engine
+        self.loaded_until, self.loaded_id = cursor
+        self.built_at = built_at
+        return len(engine)
+
+    def _build(self) -> Tuple[IOCEngine, Tuple[Optional[str], Optional[str]]]:
+        """Load every threat into a new engine (runs in a worker thread)"""
+        engine = IOCEngine()
+        cursor = (None, None)
+        while True:
+            rows = self._page(cursor)
+            for row in rows:
+                engine.add(row.get('ioc_type'), row.get('ioc_value'), row)
+            if rows:
+                cursor = (rows[-1]['created_at'], rows[-1]['id'])
+            if len(rows) < PAGE_SIZE:
+                return engine, cursor
+
+    def _page(self, cursor: Tuple[Optional[str], Optional[str]]) -> List[Dict[str, Any]]:
+        """Threats with an indicator after the (created_at, id) cursor, oldest first"""
+        query = self.supabase.table('threats')\
+            .select('id, threat_id, title, severity, threat_type, ioc_type, ioc_value, created_at')\
+            .not_.is_('ioc_value', 'null')
+        if cursor[0]:
+            query = keyset_after(query, 'created_at', *cursor)
+        return query.order('created_at').order('id').limit(PAGE_SIZE).execute().data or []
+
+
+_threat_indicator_index: Optional[ThreatIndicatorIndex] = None
+
+
+async def get_threat_indicator_index() -> ThreatIndicatorIndex:
+    """Get the process-wide indicator index, loading it on first use"""
+    global _threat_indicator_index
+
+    if _threat_indicator_index is None:
+        _threat_indicator_index = ThreatIndicatorIndex()
+        await _threat_indicator_index.refresh()
+
+    return _threat_indicator_index
+
+
+def benchmark(engine: IOCEngine, lines: List[str]) -> Dict[str, Any]:
+    """Measure scan throughput of an engine over a list of lines"""
+    started = time.perf_counter()
+    matched_lines = sum(1 for _ in engine.scan_lines(lines))
+    elapsed = time.perf_counter() - started or 1e-9
+    return {
+        'indicators': len(engine),
+        'lines': len(lines),
+        'matched_lines': matched_lines,
+        'elapsed_seconds': round(elapsed, 3),
+        'lines_per_second': round(len(lines) / elapsed)
+    }
+
+
+if __name__ == "__main__":
+    import json
+    import random
+
+    # Synthetic benchmark: 100k indicators across every structure, 100k log lines
+    rng = random.Random(0)
+    engine = IOCEngine()
+    for i in range(20000):
+        engine.add('ip', f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}')
+        engine.add('ip', f'172.{rng.randint(16, 31)}.{rng.randint(0, 255)}.0/24')
+        engine.add('domain', f'bad{i}.example{rng.randint(0, 99)}.com')
+        engine.add('hash', f'{rng.getrandbits(256):064x}')
+        engine.add('url', f'evil{i}.test/payload{i}')
+    lines = [
+        f'{datetime.utcnow().isoformat()} sshd: accepted from 10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)} '
+        f'GET http://cdn{i}.bad{rng.randint(0, 30000)}.example{rng.randint(0, 99)}.com/index.html'
+        for i in range(100000)
+    ]
+    print(json.dumps({**benchmark(engine, lines), 'structures': engine.stats()}, indent=2))
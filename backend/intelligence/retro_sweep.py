@@ -0,0 +1,247 @@
+"""
+Retroactive IOC Sweep
+Scans historical transactions and ingested events against newly added threat indicators
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import hashlib
+import uuid
+
+from core.redis_client import get_redis
+from core.supabase_client import get_supabase_client, keyset_after
+from intelligence.ioc_engine import IOCEngine
+
+
+SWEEP_NAME = 'ioc_retro_sweep'
+# Rows fetched and scanned per chunk
+CHUNK_SIZE = 1000
+# Chunks fetched at the same time across all sources and partitions
+MAX_CONCURRENT_CHUNKS = 4
+# Matching rows kept per threat as incident evidence
+MAX_SAMPLES_PER_THREAT = 20
+# The id space of each source is split into this many ranges that are swept independently
+PARTITIONS = 4
+# Held while a sweep runs and extended after every chunk; expires on its own if the worker holding it dies
+SWEEP_LOCK_KEY = 'cts:lock:retro-sweep'
+SWEEP_LOCK_TTL_SECONDS = 10 * 60
+
+_RELEASE_LOCK = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+_EXTEND_LOCK = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) else return 0 end"
+
+# History sources: table -> (columns fetched, columns scanned)
+SWEEP_SOURCES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    'transactions': (
+        'id, transaction_id, source_ip, individual_id, organization_id, created_at',
+        ('source_ip',)
+    ),
+    'log_events': (
+        'id, ingestion_id, user_name, source_ip, message, event_time',
+        ('source_ip', 'message')
+    ),
+    'extracted_indicators': (
+        'id, ingestion_id, indicator_type, value, created_at',
+        ('value',)
+    ),
+}
+
+_SEVERITY_TO_INCIDENT = {'critical': 'critical', 'high': 'high', 'medium': 'medium', 'low': 'low', 'info': 'low'}
+
+
+def _partition_bounds(partition: int) -> Tuple[str, Optional[str]]:
+    """UUID range [lower, upper) covered by a partition"""
+    step = 16 // PARTITIONS
+    lower = f"{partition * step:x}0000000-0000-0000-0000-000000000000"
+    upper = None if partition == PARTITIONS - 1 else f"{(partition + 1) * step:x}0000000-0000-0000-0000-000000000000"
+    return lower, upper
+
+
+class RetroactiveSweep:
+    """
+    Sweep history against threats added since the last completed sweep.
+    Progress (per-partition cursors and hits so far) is stored in sweep_watermarks
+    after every chunk, so an interrupted sweep resumes where it stopped. A Redis lock
+    keeps a second sweep (scheduled, or queued after a feed poll) from running alongside.
+    """
+
+    def __init__(self):
+        self.supabase = get_supabase_client()
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHUNKS)
+        self._state_lock = asyncio.Lock()
+        self.state: Dict[str, Any] = {}
+        self.redis = None
+        self._lock_token = uuid.uuid4().hex
+
+    async def run(self) -> Dict[str, Any]:
+        """Run (or resume) a sweep over every history source; skipped while another sweep holds the lock"""
+        self.redis = await get_redis()
+        if self.redis is not None and not await self.redis.set(
+                SWEEP_LOCK_KEY, self._lock_token, nx=True, ex=SWEEP_LOCK_TTL_SECONDS):
+            print("Retroactive sweep already running elsewhere, skipping")
+            return {'skipped': True}
+        try:
+            return await self._run()
+        finally:
+            if self.redis is not None:
+                await self.redis.eval(_RELEASE_LOCK, 1, SWEEP_LOCK_KEY, self._lock_token)
+
+    async def _run(self) -> Dict[str, Any]:
+        self.state = self._load_state()
+        if not self.state.get('pending_until'):
+            self.state.update({
+                'pending_until': datetime.utcnow().isoformat(),
+                'cursors': {},
+                'hits': {}
+            })
+            self._save_state()
+
+        threats = self._new_threats()
+        if not threats:
+            return self._complete(threats, [])
+
+        engine = IOCEngine()
+        for threat in threats:
+            engine.add(threat['ioc_type'], threat['ioc_value'], threat)
+        engine.prepare()
+
+        await asyncio.gather(*(
+            self._sweep_partition(engine, table, partition)
+            for table in SWEEP_SOURCES
+            for partition in range(PARTITIONS)
+        ))
+
+        incidents = self._open_incidents(threats)
+        return self._complete(threats, incidents)
+
+    def _load_state(self) -> Dict[str, Any]:
+        result = self.supabase.table('sweep_watermarks').select('*').eq('sweep_name', SWEEP_NAME).execute()
+        if result.data:
+            state = result.data[0]
+            state['cursors'] = state.get('cursors') or {}
+            state['hits'] = state.get('hits') or {}
+            return state
+        return {'sweep_name': SWEEP_NAME, 'threats_until': None, 'pending_until': None, 'cursors': {}, 'hits': {}}
+
+    def _save_state(self):
+        self.state['updated_at'] = datetime.utcnow().isoformat()
+        self.supabase.table('sweep_watermarks').upsert(self.state, on_conflict='sweep_name').execute()
+
+    def _new_threats(self) -> List[Dict[str, Any]]:
+        """Threats created after the last completed sweep, up to this sweep's bound"""
+        threats = []
+        while True:
+            query = self.supabase.table('threats')\
+                .select('id, threat_id, title, severity, ioc_type, ioc_value, created_at')\
+                .not_.is_('ioc_value', 'null')\
+                .lte('created_at', self.state['pending_until'])
+            if self.state.get('threats_until'):
+                query = query.gt('created_at', self.state['threats_until'])
+            # Keyset on (created_at, id): sighting batches share one created_at, which offset paging can split
+            if threats:
+                query = keyset_after(query, 'created_at', threats[-1]['created_at'], threats[-1]['id'])
+            rows = query.order('created_at').order('id').limit(CHUNK_SIZE).execute().data or []
+            threats.extend(rows)
+            if len(rows) < CHUNK_SIZE:
+                return threats
+
+    async def _sweep_partition(self, engine: IOCEngine, table: str, partition: int):
+        """Page through one id range of a source with a keyset cursor"""
+        cursor_key = f"{table}:{partition}"
+        lower, upper = _partition_bounds(partition)
+
+        while self.state['cursors'].get(cursor_key) != 'done':
+            async with self.semaphore:
+                # Reading the chunk is a blocking PostgREST call, so it runs in the worker thread with the scan
+                rows, hits = await asyncio.to_thread(
+                    self._read_and_scan, engine, table, self.state['cursors'].get(cursor_key), lower, upper
+                )
+
+            async with self._state_lock:
+                for threat_id, samples in hits.items():
+                    entry = self.state['hits'].setdefault(threat_id, {'count': 0, 'samples': []})
+                    entry['count'] += len(samples)
+                    room = MAX_SAMPLES_PER_THREAT - len(entry['samples'])
+                    entry['samples'].extend(samples[:max(room, 0)])
+                self.state['cursors'][cursor_key] = rows[-1]['id'] if len(rows) == CHUNK_SIZE else 'done'
+                await asyncio.to_thread(self._save_state)
+                if self.redis is not None:
+                    await self.redis.eval(_EXTEND_LOCK, 1, SWEEP_LOCK_KEY, self._lock_token, SWEEP_LOCK_TTL_SECONDS)
+
+    def _read_and_scan(self, engine: IOCEngine, table: str, cursor: Optional[str], lower: str,
+                       upper: Optional[str]) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+        """Read the chunk after cursor within [lower, upper) and scan it"""
+        columns, scanned = SWEEP_SOURCES[table]
+        query = self.supabase.table(table).select(columns)
+        query = query.gt('id', cursor) if cursor else query.gte('id', lower)
+        if upper:
+            query = query.lt('id', upper)
+        rows = query.order('id').limit(CHUNK_SIZE).execute().data or []
+        return rows, self._scan_rows(engine, table, rows, scanned)
+
+    @staticmethod
+    def _scan_rows(engine: IOCEngine, table: str, rows: List[Dict[str, Any]],
+                   scanned: Tuple[str, ...]) -> Dict[str, List[Dict[str, Any]]]:
+        hits: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            text = ' '.join(str(row[column]) for column in scanned if row.get(column))
+            for match in engine.scan(text):
+                hits.setdefault(match['threat']['id'], []).append({
+                    'source': table,
+                    'matched': match['matched'],
+                    **{k: v for k, v in row.items() if k != 'message'}
+                })
+        return hits
+
+    def _open_incidents(self, threats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Open one incident per new threat that matched history"""
+        # Incident ids are derived from the threat and sweep bound, so a resumed sweep that
+        # already opened its incidents leaves them (and any triage since) as they are
+        by_id = {threat['id']: threat for threat in threats}
+        incidents = []
+        for threat_id, hit in self.state['hits'].items():
+            threat = by_id.get(threat_id)
+            if threat is None or not hit['count']:
+                continue
+
+            individuals = {s.get('individual_id') for s in hit['samples'] if s.get('individual_id')}
+            organizations = {s.get('organization_id') for s in hit['samples'] if s.get('organization_id')}
+            incidents.append({
+                'incident_id': "INC-RETRO-" + hashlib.sha256(
+                    f"{threat_id}:{self.state['pending_until']}".encode()
+                ).hexdigest()[:12].upper(),
+                'title': f"Retroactive IOC match: {threat['ioc_value']} ({threat['ioc_type']})",
+                'description': f"{hit['count']} historical record(s) matched newly added threat \"{threat['title']}\".",
+                'severity': _SEVERITY_TO_INCIDENT.get(threat.get('severity'), 'medium'),
+                'status': 'open',
+                'threat_id': threat_id,
+                'individual_id': individuals.pop() if len(individuals) == 1 else None,
+                'organization_id': organizations.pop() if len(organizations) == 1 else None,
+                'forensic_data': {
+                    'sweep': SWEEP_NAME,
+                    'match_count': hit['count'],
+                    'samples': hit['samples']
+                },
+                'timeline': [{'at': datetime.utcnow().isoformat(), 'event': 'opened_by_retroactive_sweep'}]
+            })
+
+        if incidents:
+            self.supabase.table('incidents').upsert(
+                incidents, on_conflict='incident_id', ignore_duplicates=True
+            ).execute()
+        return incidents
+
+    def _complete(self, threats: List[Dict[str, Any]], incidents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Advance the watermark past this sweep's threats and clear progress"""
+        swept_until = self.state['pending_until']
+        self.state.update({
+            'threats_until': swept_until,
+            'pending_until': None,
+            'cursors': {},
+            'hits': {}
+        })
+        self._save_state()
+        return {
+            'threats_swept': len(threats),
+            'incidents_opened': len(incidents),
+            'swept_until': swept_until
+        }
@@ -0,0 +1,69 @@
+"""
+Risk Scoring
+Incremental recomputation of individual, organization and transaction risk scores
+"""
+from typing import List, Dict, Any
+from datetime import datetime
+
+from core.supabase_client import get_supabase_client
+
+
+ENTITY_TYPES = ('individual', 'organization', 'transaction')
+
+
+def risk_level(score: float) -> str:
+    """Map a 0-100 risk score to a risk level"""
+    if score >= 75:
+        return 'critical'
+    if score >= 50:
+        return 'high'
+    if score >= 25:
+        return 'medium'
+    return 'low'
+
+
+class RiskScoringEngine:
+    """Rescore entities touched since the last run using set-based database aggregates"""
+
+    def __init__(self):
+        self.supabase = get_supabase_client()
+
+    async def recompute(self, full: bool = False) -> Dict[str, Any]:
+        """
+        Rescore the dirty set (or every entity when full=True).
+        Dirty marks are written by database triggers on incidents, transactions,
+        individuals, organizations, sanctions entries and IP threats.
+        """
+        try:
+            started = datetime.utcnow()
+            result = self.supabase.rpc('recompute_risk_scores', {'p_full': full}).execute()
+            counts = result.data or {}
+            return {
+                **counts,
+                'full': full,
+                'elapsed_seconds': (datetime.utcnow() - started).total_seconds()
+            }
+        except Exception as e:
+            print(f"Error recomputing risk scores: {e}")
+            return {'error': str(e)}
+
+    async def mark_dirty(self, entity_type: str, entity_ids: List[str]) -> int:
+        """Queue entities for rescoring on the next run"""
+        if entity_type not in ENTITY_TYPES:
+            raise ValueError(f"Unknown entity type: {entity_type}")
+
+        rows = [
+            {'entity_type': entity_type, 'entity_id': entity_id, 'marked_at': datetime.utcnow().isoformat()}
+            for entity_id in set(entity_ids) if entity_id
+        ]
+        if rows:
+            self.supabase.table('risk_dirty_entities').upsert(
+                rows,
+                on_conflict='entity_type,entity_id'
+            ).execute()
+        return len(rows)
+
+    async def pending_count(self) -> int:
+        """Number of entities waiting to be rescored"""
+        result = self.supabase.table('risk_dirty_entities').select('entity_id', count='exact').limit(1).execute()
+        return result.count or 0
@@ -0,0 +1,110 @@
+"""
+Threat Store
+Batch write path that merges IOC sightings into one threats row per (ioc_type, ioc_value)
+"""
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from datetime import datetime
+import hashlib
+
+from core.supabase_client import get_supabase_client
+from intelligence.ioc_engine import IOC_TYPES, normalize_ioc
+
+
+# Distinct IOCs per merge_threat_sightings call
+MERGE_BATCH_SIZE = 500
+
+_SEVERITY_RANK = {'info': 0, 'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
+_ARRAY_FIELDS = ('sources', 'mitre_attack_tactics', 'mitre_attack_techniques', 'related_threat_actors')
+
+IOCKey = Tuple[str, str]
+
+
+def storage_value(ioc_type: str, ioc_value: str) -> str:
+    """Value stored in threats.ioc_value; URLs and filenames keep their case"""
+    if ioc_type in ('url', 'filename'):
+        return ioc_value.strip()
+    return normalize_ioc(ioc_type, ioc_value)
+
+
+def ioc_threat_id(ioc_type: str, ioc_value: str) -> str:
+    """Deterministic threat_id for an IOC row, so every sighting of it maps to the same id"""
+    digest = hashlib.sha256(f"{ioc_type}:{ioc_value}".encode()).hexdigest()[:32]
+    return f"ioc--{ioc_type}--{digest}"
+
+
+class ThreatSightingWriter:
+    """Group sightings in memory and merge them with one bulk upsert per batch"""
+
+    def __init__(self, batch_size: int = MERGE_BATCH_SIZE):
+        self.supabase = get_supabase_client()
+        self.batch_size = batch_size
+        self._pending: Dict[IOCKey, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, sighting: Dict[str, Any]) -> Optional[IOCKey]:
+        """Fold a sighting into the pending row for its IOC; returns the IOC key"""
+        ioc_type = sighting.get('ioc_type')
+        if ioc_type not in IOC_TYPES or not sighting.get('ioc_value'):
+            return None
+        try:
+            value = storage_value(ioc_type, sighting['ioc_value'])
+        except ValueError:
+            return None
+        key = (ioc_type, value)
+
+        seen_at = sighting.get('last_seen') or sighting.get('first_seen') or datetime.utcnow().isoformat()
+        sources = set(sighting.get('sources') or [])
+        if sighting.get('source'):
+            sources.add(sighting['source'])
+
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = {
+                **sighting,
+                'threat_id': ioc_threat_id(ioc_type, value),
+                'title': sighting.get('title') or f"{ioc_type.upper()} indicator {value}",
+                'ioc_value': value,
+                'severity': sighting.get('severity') or 'medium',
+                'sighting_count': sighting.get('sighting_count', 1),
+                'sources': sorted(sources),
+                'first_seen': sighting.get('first_seen') or seen_at,
+                'last_seen': seen_at,
+                'metadata': dict(sighting.get('metadata') or {})
+            }
+            return key
+
+        pending['sighting_count'] += sighting.get('sighting_count', 1)
+        pending['first_seen'] = min(pending['first_seen'], sighting.get('first_seen') or seen_at)
+        pending['last_seen'] = max(pending['last_seen'], seen_at)
+        pending['sources'] = sorted(set(pending['sources']) | sources)
+        for field in _ARRAY_FIELDS[1:]:
+            if sighting.get(field):
+                pending[field] = sorted(set(pending.get(field) or []) | set(sighting[field]))
+        if _SEVERITY_RANK.get(sighting.get('severity'), -1) > _SEVERITY_RANK.get(pending['severity'], -1):
+            pending['severity'] = sighting['severity']
+        pending['metadata'].update(sighting.get('metadata') or {})
+        return key
+
+    async def write(self, sightings: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Add sightings and flush them; returns the merged rows"""
+        for sighting in sightings:
+            self.add(sighting)
+        return await self.flush()
+
+    async def flush(self) -> List[Dict[str, Any]]:
+        """
+        Merge all pending IOCs into threats.
+        Returned rows carry id, threat_id, ioc_type, ioc_value and `inserted`,
+        which is true for IOCs seen for the first time.
+        """
+        pending = list(self._pending.values())
+        self._pending = {}
+
+        merged = []
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            result = self.supabase.rpc('merge_threat_sightings', {'p_sightings': batch}).execute()
+            merged.extend(result.data or [])
+        return merged
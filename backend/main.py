@@ -9,9 +9,15 @@ from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
-from api.routes import chat, agents, threats, incidents, data_ingestion, analytics
+from api.routes import chat, agents, threats, incidents, data_ingestion, analytics, search, stream
 from core.supabase_client import get_supabase_client
 from core.agent_orchestrator import AgentOrchestrator
+from core.event_stream import get_event_stream
+from core.redis_client import close_redis
+from core.admission import AdmissionControlMiddleware
+from core.config import settings
+from data_ingestion.pdf_extractor import shutdown_process_pools
+from prometheus_client import make_asgi_app
 
 load_dotenv()
 
@@ -29,11 +35,15 @@ async def lifespan(app: FastAPI):
     await orchestrator.initialize()
     # Store orchestrator in app state for dependency injection
     app.state.orchestrator = orchestrator
+    await get_event_stream().start()
     yield
     # Shutdown
+    await get_event_stream().stop()
     print("Shutting down Agent Orchestrator...")
     if orchestrator:
         await orchestrator.shutdown()
+    shutdown_process_pools()
+    await close_redis()
 
 
 app = FastAPI(
@@ -43,6 +53,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Priority admission control (added before CORS so 429 responses still carry CORS headers)
+if settings.admission_control_enabled:
+    app.add_middleware(AdmissionControlMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -74,6 +88,9 @@ async def health_check():
     return health_status
 
 
+# Prometheus metrics (admission queue depth, shed counts, ...)
+app.mount("/metrics", make_asgi_app())
+
 # Include routers
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 app.include_router(agents.router, prefix="/api/agents", tags=["agents"])
@@ -81,6 +98,8 @@ app.include_router(threats.router, prefix="/api/threats", tags=["threats"])
 app.include_router(incidents.router, prefix="/api/incidents", tags=["incidents"])
 app.include_router(data_ingestion.router, prefix="/api/ingestion", tags=["ingestion"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
+app.include_router(stream.router, prefix="/api/stream", tags=["stream"])
 
 
 @app.exception_handler(Exception)
@@ -0,0 +1 @@
+# SOAR modules
@@ -0,0 +1,117 @@
+"""
+SOAR Action Handlers
+Built-in response actions available to playbooks
+"""
+from typing import Dict, Any, Awaitable, Callable, List
+from datetime import datetime
+import uuid
+
+import httpx
+
+from core.supabase_client import get_supabase_client
+from soar.coalescer import get_action_coalescer
+
+
+# handler(params, context) -> result
+ActionHandler = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# Display names used in chat and older playbooks -> handler names
+ACTION_ALIASES = {
+    'block': 'block_ip',
+    'quarantine': 'quarantine_host',
+    'send_notification': 'notify',
+    'webhook': 'notify',
+    'create_ticket': 'create_incident',
+}
+
+
+def normalize_action_type(action_type: str) -> str:
+    """'Block IP' -> 'block_ip', applying aliases"""
+    name = '_'.join(str(action_type).strip().lower().replace('-', ' ').split())
+    return ACTION_ALIASES.get(name, name)
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(v) for v in value if v]
+    return [str(value)]
+
+
+async def block_ip(params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Block addresses at the firewall; concurrent requests are batched by the coalescer"""
+    ips = _as_list(params.get('ips') or params.get('ip'))
+    if not ips:
+        raise ValueError("block_ip requires 'ip' or 'ips'")
+    results = await get_action_coalescer().submit(
+        'block_ip', ips, params.get('reason') or f"SOAR execution {context.get('execution_id')}"
+    )
+    return {'blocked': ips, 'results': results}
+
+
+async def quarantine_host(params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Isolate hosts through the EDR; concurrent requests are batched by the coalescer"""
+    hosts = _as_list(params.get('hosts') or params.get('host'))
+    if not hosts:
+        raise ValueError("quarantine_host requires 'host' or 'hosts'")
+    results = await get_action_coalescer().submit(
+        'quarantine_host', hosts, params.get('reason') or f"SOAR execution {context.get('execution_id')}"
+    )
+    return {'quarantined': hosts, 'results': results}
+
+
+async def notify(params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """POST a notification to a webhook"""
+    url = params.get('url')
+    if not url:
+        raise ValueError("notify requires 'url'")
+    payload = {
+        'message': params.get('message', ''),
+        'execution_id': context.get('execution_id'),
+        'incident_id': context.get('incident_id'),
+        'event': context.get('event')
+    }
+    async with httpx.AsyncClient(timeout=30) as client:
+        response = await client.post(url, json=payload, headers=params.get('headers') or {})
+        response.raise_for_status()
+    return {'status_code': response.status_code}
+
+
+async def create_incident(params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Open an incident for the execution"""
+    supabase = get_supabase_client()
+    result = supabase.table('incidents').insert({
+        'incident_id': params.get('incident_id') or f"INC-SOAR-{uuid.uuid4().hex[:12].upper()}",
+        'title': params.get('title') or 'SOAR playbook incident',
+        'description': params.get('description'),
+        'severity': params.get('severity', 'medium'),
+        'status': 'open',
+        'timeline': [{'at': datetime.utcnow().isoformat(), 'event': 'opened_by_playbook',
+                      'execution_id': context.get('execution_id')}]
+    }).execute()
+    incident = result.data[0] if result.data else {}
+    return {'incident_id': incident.get('id'), 'reference': incident.get('incident_id')}
+
+
+async def update_incident(params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Update the status or assignee of the execution's incident"""
+    incident_id = params.get('incident_id') or context.get('incident_id')
+    if not incident_id:
+        raise ValueError("update_incident requires an incident")
+    updates = {k: params[k] for k in ('status', 'assigned_to', 'severity') if params.get(k)}
+    if not updates:
+        raise ValueError("update_incident requires 'status', 'assigned_to' or 'severity'")
+    updates['updated_at'] = datetime.utcnow().isoformat()
+    supabase = get_supabase_client()
+    supabase.table('incidents').update(updates).eq('id', incident_id).execute()
+    return {'incident_id': incident_id, 'updated': sorted(updates)}
+
+
+DEFAULT_HANDLERS: Dict[str, ActionHandler] = {
+    'block_ip': block_ip,
+    'quarantine_host': quarantine_host,
+    'notify': notify,
+    'create_incident': create_incident,
+    'update_incident': update_incident,
+}
@@ -0,0 +1,205 @@
+"""
+SOAR Action Coalescer
+Collects enforcement actions of the same type over a short window, dedupes their
+targets and issues one batched call per enforcement backend, fanning results back
+to every waiting execution
+"""
+from typing import Dict, Any, List, Optional
+import asyncio
+import time
+
+import httpx
+
+from core.config import settings
+
+
+# How long the first request of a batch waits for others to join it
+COALESCE_WINDOW_SECONDS = 0.25
+# Targets per backend call; a full batch is sent without waiting for the window
+MAX_BATCH_TARGETS = 500
+
+
+class EnforcementBackend:
+    """An enforcement point that applies one action type to many targets per call"""
+
+    name = "base"
+    action_type = ""
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    async def execute_batch(self, targets: List[str], reasons: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Apply the action to every target; returns a result per target"""
+        raise NotImplementedError
+
+
+class HttpEnforcementBackend(EnforcementBackend):
+    """
+    POSTs {<targets_field>: [...], "reason": str, "reasons": [...]} to <url>/<path>.
+    reason joins the batch's distinct reasons for endpoints that read a single string.
+    """
+
+    def __init__(self, name: str, action_type: str, url: str, api_key: str, path: str, targets_field: str):
+        self.name = name
+        self.action_type = action_type
+        self.url = url.rstrip('/')
+        self.api_key = api_key
+        self.path = path
+        self.targets_field = targets_field
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    async def execute_batch(self, targets: List[str], reasons: List[str]) -> Dict[str, Dict[str, Any]]:
+        headers = {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.post(
+                f"{self.url}/{self.path}",
+                json={self.targets_field: targets, 'reason': '; '.join(reasons), 'reasons': reasons},
+                headers=headers
+            )
+            response.raise_for_status()
+            payload = response.json() if response.content else {}
+
+        # Backends may report per-target outcomes under "results"; otherwise the call applied to all
+        per_target = payload.get('results') if isinstance(payload, dict) else None
+        if isinstance(per_target, dict):
+            return {target: per_target.get(target, {'status': 'unknown'}) for target in targets}
+        return {target: {'status': 'applied'} for target in targets}
+
+
+def default_backends() -> List[EnforcementBackend]:
+    """Backends configured from settings"""
+    return [
+        HttpEnforcementBackend('firewall', 'block_ip', settings.soar_firewall_url,
+                               settings.soar_firewall_api_key, 'block', 'ips'),
+        HttpEnforcementBackend('edr', 'quarantine_host', settings.soar_edr_url,
+                               settings.soar_edr_api_key, 'quarantine', 'hosts'),
+    ]
+
+
+class _Batch:
+    """Targets queued for one backend, each with the future its callers wait on"""
+
+    def __init__(self):
+        self.futures: Dict[str, asyncio.Future] = {}
+        self.reasons: List[str] = []
+        self.timer: Optional[asyncio.Task] = None
+
+
+class ActionCoalescer:
+    """Batch enforcement actions per backend; duplicate targets share one result"""
+
+    def __init__(self, backends: Optional[List[EnforcementBackend]] = None,
+                 window: float = COALESCE_WINDOW_SECONDS, max_batch: int = MAX_BATCH_TARGETS):
+        self.backends = [b for b in (backends if backends is not None else default_backends()) if b.enabled]
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[str, _Batch] = {}
+        # backend -> target -> future of a batch already sent; late duplicates join it
+        self._in_flight: Dict[str, Dict[str, asyncio.Future]] = {}
+        self.stats = {'requested': 0, 'deduplicated': 0, 'batches': 0, 'targets_sent': 0}
+
+    def supports(self, action_type: str) -> bool:
+        return any(b.action_type == action_type for b in self.backends)
+
+    async def submit(self, action_type: str, targets: List[str], reason: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Queue targets for an action and wait for their batch to complete.
+        Returns {target: {backend name: result}}; raises if a backend call failed.
+        """
+        backends = [b for b in self.backends if b.action_type == action_type]
+        if not backends:
+            raise RuntimeError(f"No enforcement backend configured for {action_type}")
+        targets = list(dict.fromkeys(t for t in targets if t))
+
+        waits: Dict[str, Dict[str, asyncio.Future]] = {target: {} for target in targets}
+        for backend in backends:
+            for target in targets:
+                waits[target][backend.name] = self._enqueue(backend, target, reason)
+
+        results: Dict[str, Dict[str, Any]] = {}
+        for target, futures in waits.items():
+            # shield: one caller being cancelled must not cancel the result others share
+            results[target] = {name: await asyncio.shield(future) for name, future in futures.items()}
+        return results
+
+    def _enqueue(self, backend: EnforcementBackend, target: str, reason: Optional[str]) -> asyncio.Future:
+        self.stats['requested'] += 1
+        in_flight = self._in_flight.get(backend.name, {}).get(target)
+        if in_flight is not None and not in_flight.done():
+            self.stats['deduplicated'] += 1
+            return in_flight
+
+        batch = self._pending.setdefault(backend.name, _Batch())
+        if target in batch.futures:
+            self.stats['deduplicated'] += 1
+            return batch.futures[target]
+
+        future = asyncio.get_running_loop().create_future()
+        batch.futures[target] = future
+        if reason and reason not in batch.reasons:
+            batch.reasons.append(reason)
+
+        if len(batch.futures) >= self.max_batch:
+            if batch.timer is not None:
+                batch.timer.cancel()
+            self._send(backend)
+        elif batch.timer is None:
+            batch.timer = asyncio.create_task(self._flush_after_window(backend))
+        return future
+
+    async def _flush_after_window(self, backend: EnforcementBackend):
+        await asyncio.sleep(self.window)
+        self._send(backend)
+
+    def _send(self, backend: EnforcementBackend):
+        batch = self._pending.pop(backend.name, None)
+        if batch is None or not batch.futures:
+            return
+        self._in_flight.setdefault(backend.name, {}).update(batch.futures)
+        asyncio.create_task(self._execute(backend, batch))
+
+    async def _execute(self, backend: EnforcementBackend, batch: _Batch):
+        targets = list(batch.futures)
+        self.stats['batches'] += 1
+        self.stats['targets_sent'] += len(targets)
+        started = time.perf_counter()
+        try:
+            results = await backend.execute_batch(targets, batch.reasons)
+            duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            for target, future in batch.futures.items():
+                if not future.done():
+                    future.set_result({
+                        **results.get(target, {'status': 'unknown'}),
+                        'batch_size': len(targets),
+                        'duration_ms': duration_ms
+                    })
+        except Exception as e:
+            for future in batch.futures.values():
+                if not future.done():
+                    future.set_exception(RuntimeError(f"{backend.name} {backend.action_type} failed: {e}"))
+        finally:
+            in_flight = self._in_flight.get(backend.name, {})
+            for target, future in batch.futures.items():
+                if in_flight.get(target) is future:
+                    del in_flight[target]
+                # Retrieve the exception so unawaited failures are not reported as never retrieved
+                if future.done() and not future.cancelled():
+                    future.exception()
+
+
+_action_coalescer: Optional[ActionCoalescer] = None
+
+
+def get_action_coalescer() -> ActionCoalescer:
+    """Get or create the process-wide action coalescer"""
+    global _action_coalescer
+
+    if _action_coalescer is None:
+        _action_coalescer = ActionCoalescer()
+
+    return _action_coalescer
+
@@ -0,0 +1,318 @@
+"""
+Playbook Engine
+Runs soar_playbooks.actions as a dependency graph: independent actions run concurrently
+with bounded parallelism, each with its own timeout, retry with backoff and cancellation.
+Progress streams into soar_executions.execution_log.
+"""
+from typing import Dict, Any, List, Optional
+from collections import defaultdict
+from datetime import datetime
+import asyncio
+import random
+import time
+
+from core.supabase_client import get_supabase_client
+from soar.actions import ActionHandler, DEFAULT_HANDLERS, normalize_action_type
+
+
+# Actions of one execution running at the same time
+MAX_PARALLEL_ACTIONS = 4
+DEFAULT_TIMEOUT_SECONDS = 30.0
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def topological_order(specs: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Order action ids so dependencies come first; raises ValueError on cycles"""
+    remaining = {action_id: len(spec['depends_on']) for action_id, spec in specs.items()}
+    dependents = defaultdict(list)
+    for action_id, spec in specs.items():
+        for dependency in spec['depends_on']:
+            dependents[dependency].append(action_id)
+
+    order = [action_id for action_id, count in remaining.items() if count == 0]
+    for action_id in order:
+        for dependent in dependents[action_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                order.append(dependent)
+
+    if len(order) != len(specs):
+        cyclic = sorted(action_id for action_id in specs if action_id not in set(order))
+        raise ValueError(f"Playbook actions form a cycle: {', '.join(cyclic)}")
+    return order
+
+
+def parse_actions(actions: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Normalize soar_playbooks.actions into {action_id: spec}.
+    Each action is {"id", "type", "params", "depends_on", "timeout", "retries", "backoff"};
+    a bare string is an action type with no parameters or dependencies.
+    """
+    if isinstance(actions, dict):
+        actions = actions.get('steps') or actions.get('actions') or []
+
+    specs: Dict[str, Dict[str, Any]] = {}
+    for index, raw in enumerate(actions or []):
+        if isinstance(raw, str):
+            raw = {'type': raw}
+        action_id = str(raw.get('id') or f"step_{index + 1}")
+        if action_id in specs:
+            raise ValueError(f"Duplicate action id '{action_id}'")
+        specs[action_id] = {
+            'id': action_id,
+            'type': normalize_action_type(raw.get('type') or raw.get('action') or ''),
+            'params': raw.get('params') or {},
+            'depends_on': _as_list(raw.get('depends_on')),
+            'timeout': float(raw.get('timeout', DEFAULT_TIMEOUT_SECONDS)),
+            'retries': int(raw.get('retries', DEFAULT_RETRIES)),
+            'backoff': float(raw.get('backoff', DEFAULT_BACKOFF_SECONDS))
+        }
+
+    for spec in specs.values():
+        for dependency in spec['depends_on']:
+            if dependency not in specs:
+                raise ValueError(f"Action '{spec['id']}' depends on unknown action '{dependency}'")
+    topological_order(specs)
+    return specs
+
+
+def resolve_params(value: Any, context: Dict[str, Any]) -> Any:
+    """Substitute "$event.field" and "$results.<action_id>.field" references from the execution context"""
+    if isinstance(value, str) and value.startswith('$'):
+        current: Any = context
+        for part in value[1:].split('.'):
+            if not isinstance(current, dict):
+                return None
+            current = current.get(part)
+        return current
+    if isinstance(value, dict):
+        return {k: resolve_params(v, context) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_params(v, context) for v in value]
+    return value
+
+
+class PlaybookEngine:
+    """Execute playbooks against registered action handlers"""
+
+    def __init__(self, handlers: Optional[Dict[str, ActionHandler]] = None,
+                 max_parallel: int = MAX_PARALLEL_ACTIONS, persist: bool = True):
+        self.supabase = get_supabase_client() if persist else None
+        self.handlers: Dict[str, ActionHandler] = dict(DEFAULT_HANDLERS if handlers is None else handlers)
+        self.max_parallel = max_parallel
+        # execution id -> in-flight action tasks, for cancellation
+        self._running: Dict[str, Dict[asyncio.Task, str]] = {}
+        self._cancelled: set = set()
+
+    def register(self, action_type: str, handler: ActionHandler):
+        self.handlers[normalize_action_type(action_type)] = handler
+
+    def cancel(self, execution_id: str) -> bool:
+        """Cancel a running execution; in-flight actions are cancelled and pending ones never start"""
+        tasks = self._running.get(execution_id)
+        if tasks is None:
+            return False
+        self._cancelled.add(execution_id)
+        for task in tasks:
+            task.cancel()
+        return True
+
+    async def execute(self, playbook: Dict[str, Any], event: Optional[Dict[str, Any]] = None,
+                      incident_id: Optional[str] = None) -> Dict[str, Any]:
+        """Run every action of a playbook once its dependencies succeed; returns the execution summary"""
+        specs = parse_actions(playbook.get('actions'))
+        unknown = sorted({spec['type'] for spec in specs.values() if spec['type'] not in self.handlers})
+        if unknown:
+            raise ValueError(f"No handler for action type(s): {', '.join(unknown)}")
+
+        log = {
+            'playbook_name': playbook.get('name'),
+            'event': event or {},
+            'entries': [],
+            'actions': {action_id: {'type': spec['type'], 'status': 'pending'} for action_id, spec in specs.items()}
+        }
+        execution_id = self._start_execution(playbook, incident_id, log)
+        context = {
+            'execution_id': execution_id,
+            'incident_id': incident_id,
+            'event': event or {},
+            'results': {}
+        }
+        writer = _LogWriter(self.supabase, execution_id, log)
+        semaphore = asyncio.Semaphore(self.max_parallel)
+
+        waiting_on = {action_id: set(spec['depends_on']) for action_id, spec in specs.items()}
+        dependents = defaultdict(list)
+        for action_id, spec in specs.items():
+            for dependency in spec['depends_on']:
+                dependents[dependency].append(action_id)
+
+        running: Dict[asyncio.Task, str] = {}
+        self._running[execution_id] = running
+        started = time.perf_counter()
+
+        def start_ready():
+            if execution_id in self._cancelled:
+                return
+            for action_id in [a for a, deps in waiting_on.items() if not deps]:
+                del waiting_on[action_id]
+                task = asyncio.create_task(self._run_action(specs[action_id], context, semaphore, writer))
+                running[task] = action_id
+
+        def skip_dependents(action_id: str, reason: str):
+            for dependent in dependents[action_id]:
+                if dependent in waiting_on:
+                    del waiting_on[dependent]
+                    log['actions'][dependent]['status'] = 'skipped'
+                    writer.add(dependent, specs[dependent]['type'], 'skipped', error=reason)
+                    skip_dependents(dependent, reason)
+
+        try:
+            start_ready()
+            while running:
+                done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    action_id = running.pop(task)
+                    if task.cancelled():
+                        log['actions'][action_id]['status'] = 'cancelled'
+                        continue
+                    outcome = task.result()
+                    log['actions'][action_id].update(outcome)
+                    if outcome['status'] == 'succeeded':
+                        context['results'][action_id] = outcome.get('result')
+                        for dependent in dependents[action_id]:
+                            if dependent in waiting_on:
+                                waiting_on[dependent].discard(action_id)
+                    else:
+                        skip_dependents(action_id, f"dependency '{action_id}' {outcome['status']}")
+                start_ready()
+        except asyncio.CancelledError:
+            # The caller itself was cancelled: stop in-flight actions before propagating
+            self._cancelled.add(execution_id)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            await self._finish(execution_id, log, writer, started)
+            raise
+        finally:
+            self._running.pop(execution_id, None)
+
+        return await self._finish(execution_id, log, writer, started)
+
+    async def _run_action(self, spec: Dict[str, Any], context: Dict[str, Any],
+                          semaphore: asyncio.Semaphore, writer: '_LogWriter') -> Dict[str, Any]:
+        """Run one action with timeout and retries; never raises except on cancellation"""
+        handler = self.handlers[spec['type']]
+        attempts = 0
+        async with semaphore:
+            action_started = time.perf_counter()
+            while True:
+                attempts += 1
+                attempt_started = time.perf_counter()
+                writer.add(spec['id'], spec['type'], 'started', attempt=attempts)
+                try:
+                    params = resolve_params(spec['params'], context)
+                    result = await asyncio.wait_for(handler(params, context), timeout=spec['timeout'])
+                    writer.add(spec['id'], spec['type'], 'succeeded', attempt=attempts,
+                               duration_ms=_elapsed_ms(attempt_started))
+                    await writer.flush()
+                    return {'status': 'succeeded', 'attempts': attempts, 'result': result,
+                            'duration_ms': _elapsed_ms(action_started)}
+                except asyncio.CancelledError:
+                    writer.add(spec['id'], spec['type'], 'cancelled', attempt=attempts,
+                               duration_ms=_elapsed_ms(attempt_started))
+                    await asyncio.shield(writer.flush())
+                    raise
+                except Exception as e:
+                    error = 'timed out' if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+                    # Bad parameters will not succeed on retry
+                    retryable = not isinstance(e, ValueError) and attempts <= spec['retries']
+                    writer.add(spec['id'], spec['type'], 'retrying' if retryable else 'failed',
+                               attempt=attempts, duration_ms=_elapsed_ms(attempt_started), error=error)
+                    await writer.flush()
+                    if not retryable:
+                        return {'status': 'failed', 'attempts': attempts, 'error': error,
+                                'duration_ms': _elapsed_ms(action_started)}
+                    delay = min(spec['backoff'] * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _start_execution(self, playbook: Dict[str, Any], incident_id: Optional[str], log: Dict[str, Any]) -> str:
+        if self.supabase is None:
+            return f"local-{int(time.time() * 1000)}-{random.randrange(1 << 16):04x}"
+        result = self.supabase.table('soar_executions').insert({
+            'playbook_id': playbook.get('id'),
+            'incident_id': incident_id,
+            'status': 'running',
+            'execution_log': log
+        }).execute()
+        return result.data[0]['id']
+
+    async def _finish(self, execution_id: str, log: Dict[str, Any], writer: '_LogWriter',
+                      started: float) -> Dict[str, Any]:
+        cancelled = execution_id in self._cancelled
+        self._cancelled.discard(execution_id)
+        for action in log['actions'].values():
+            if action['status'] == 'pending':
+                action['status'] = 'cancelled' if cancelled else 'skipped'
+
+        statuses = [action['status'] for action in log['actions'].values()]
+        status = 'completed' if all(s == 'succeeded' for s in statuses) else 'failed'
+        log['summary'] = {
+            'status': 'cancelled' if cancelled else status,
+            'duration_ms': _elapsed_ms(started),
+            'succeeded': statuses.count('succeeded'),
+            'failed': statuses.count('failed'),
+            'skipped': statuses.count('skipped'),
+            'cancelled': statuses.count('cancelled')
+        }
+        await writer.flush(status=status)
+        return {'execution_id': execution_id, 'status': status, 'execution_log': log}
+
+
+class _LogWriter:
+    """Appends log entries and writes them through to soar_executions in order"""
+
+    def __init__(self, supabase, execution_id: str, log: Dict[str, Any]):
+        self.supabase = supabase
+        self.execution_id = execution_id
+        self.log = log
+        self._lock = asyncio.Lock()
+
+    def add(self, action_id: str, action_type: str, event: str, **details):
+        self.log['entries'].append({
+            'action_id': action_id,
+            'type': action_type,
+            'event': event,
+            'at': datetime.utcnow().isoformat(),
+            **{k: v for k, v in details.items() if v is not None}
+        })
+
+    async def flush(self, status: Optional[str] = None):
+        if self.supabase is None:
+            return
+        async with self._lock:
+            update: Dict[str, Any] = {'execution_log': self.log}
+            if status:
+                update['status'] = status
+                update['completed_at'] = datetime.utcnow().isoformat()
+            try:
+                await asyncio.to_thread(
+                    lambda: self.supabase.table('soar_executions').update(update).eq('id', self.execution_id).execute()
+                )
+            except Exception as e:
+                print(f"Error writing execution log {self.execution_id}: {e}")
+
+
+def _elapsed_ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 2)
+
@@ -0,0 +1,372 @@
+"""
+Playbook Triggers
+Compiles soar_playbooks.trigger_conditions into cached predicates, indexed by the
+event fields they test so each alert is evaluated only against candidate playbooks
+"""
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+from itertools import product
+import asyncio
+import random
+import re
+import time
+
+from core.supabase_client import get_supabase_client
+
+
+SEVERITY_ORDER = ('info', 'low', 'medium', 'high', 'critical')
+# Event fields playbooks are indexed by, in index key order
+INDEXED_FIELDS = ('severity', 'ioc_type', 'agent')
+# Index keys per playbook before the widest field is treated as "any"
+MAX_KEYS_PER_PLAYBOOK = 64
+# How often the cache checks soar_playbooks for changes
+CHANGE_CHECK_INTERVAL = timedelta(seconds=10)
+
+ANY = '*'
+Predicate = Callable[[Dict[str, Any]], bool]
+
+_SEVERITY_RANK = {severity: rank for rank, severity in enumerate(SEVERITY_ORDER)}
+_MISSING = object()
+
+
+def _norm(value: Any) -> Any:
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+def _lookup(event: Dict[str, Any], path: Tuple[str, ...]) -> Any:
+    current: Any = event
+    for part in path:
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        current = current[part]
+    return current
+
+
+def _rank(field: str, value: Any) -> Any:
+    """Severities compare by rank; everything else by value"""
+    if field == 'severity':
+        return _SEVERITY_RANK.get(_norm(value), -1)
+    return value
+
+
+def _compile_operator(field: str, operator: str, operand: Any) -> Callable[[Any], bool]:
+    if operator == 'eq':
+        expected = _norm(operand)
+        return lambda v: _norm(v) == expected
+    if operator == 'ne':
+        expected = _norm(operand)
+        return lambda v: _norm(v) != expected
+    if operator == 'in':
+        allowed = frozenset(_norm(o) for o in operand)
+        return lambda v: _norm(v) in allowed
+    if operator == 'not_in':
+        denied = frozenset(_norm(o) for o in operand)
+        return lambda v: _norm(v) not in denied
+    if operator in ('gt', 'gte', 'lt', 'lte'):
+        bound = _rank(field, operand)
+        compare = {
+            'gt': lambda a, b: a > b,
+            'gte': lambda a, b: a >= b,
+            'lt': lambda a, b: a < b,
+            'lte': lambda a, b: a <= b,
+        }[operator]
+
+        def ordered(v: Any) -> bool:
+            try:
+                return compare(_rank(field, v), bound)
+            except TypeError:
+                return False
+        return ordered
+    if operator == 'contains':
+        needle = _norm(operand)
+        return lambda v: needle in (_norm(v) if isinstance(v, str) else [_norm(i) for i in v or []])
+    if operator == 'regex':
+        pattern = re.compile(operand, re.IGNORECASE)
+        return lambda v: isinstance(v, str) and pattern.search(v) is not None
+    raise ValueError(f"Unknown trigger operator '{operator}' on '{field}'")
+
+
+def _compile_field(field: str, spec: Any) -> Predicate:
+    path = tuple(field.split('.'))
+    if isinstance(spec, dict):
+        exists = spec.get('exists')
+        checks = [_compile_operator(field, op, operand) for op, operand in spec.items() if op != 'exists']
+
+        def test(event: Dict[str, Any]) -> bool:
+            value = _lookup(event, path)
+            if value is _MISSING or value is None:
+                return exists is False
+            if exists is False:
+                return False
+            return all(check(value) for check in checks)
+        return test
+
+    check = _compile_operator(field, 'in' if isinstance(spec, list) else 'eq', spec)
+
+    def test(event: Dict[str, Any]) -> bool:
+        value = _lookup(event, path)
+        return value is not _MISSING and value is not None and check(value)
+    return test
+
+
+def compile_condition(condition: Any) -> Predicate:
+    """
+    Compile a trigger condition into a predicate over an event dict.
+    Keys of a mapping are ANDed; "all", "any" and "not" combine sub-conditions.
+    A field maps to a value (equality), a list (membership) or operators:
+    eq, ne, in, not_in, gt, gte, lt, lte, contains, regex, exists.
+    Severities compare by rank, so {"severity": {"gte": "high"}} matches high and critical.
+    """
+    if isinstance(condition, list):
+        condition = {'all': condition}
+    if not isinstance(condition, dict):
+        raise ValueError(f"Trigger condition must be an object, got {type(condition).__name__}")
+
+    parts: List[Predicate] = []
+    for key, spec in condition.items():
+        if key == 'all':
+            subs = [compile_condition(c) for c in spec]
+            parts.append(lambda e, subs=subs: all(s(e) for s in subs))
+        elif key == 'any':
+            subs = [compile_condition(c) for c in spec]
+            parts.append(lambda e, subs=subs: any(s(e) for s in subs))
+        elif key == 'not':
+            sub = compile_condition(spec)
+            parts.append(lambda e, sub=sub: not sub(e))
+        elif key == 'min_severity':
+            parts.append(_compile_field('severity', {'gte': spec}))
+        else:
+            parts.append(_compile_field(key, spec))
+
+    if len(parts) == 1:
+        return parts[0]
+    return lambda event: all(part(event) for part in parts)
+
+
+def _allowed_values(field: str, spec: Any) -> Optional[set]:
+    """Values of an indexed field a top-level condition can match, or None if not enumerable"""
+    if isinstance(spec, list):
+        return {_norm(v) for v in spec}
+    if not isinstance(spec, dict):
+        return {_norm(spec)}
+
+    allowed: Optional[set] = None
+    if 'eq' in spec:
+        allowed = {_norm(spec['eq'])}
+    if 'in' in spec:
+        values = {_norm(v) for v in spec['in']}
+        allowed = values if allowed is None else allowed & values
+    if field == 'severity' and any(op in spec for op in ('gt', 'gte', 'lt', 'lte')):
+        check = _compile_field('severity', {op: spec[op] for op in ('gt', 'gte', 'lt', 'lte') if op in spec})
+        values = {s for s in SEVERITY_ORDER if check({'severity': s})}
+        allowed = values if allowed is None else allowed & values
+    return allowed
+
+
+def index_keys(condition: Any) -> List[Tuple[Any, ...]]:
+    """Index keys (one slot per INDEXED_FIELDS entry, ANY where unconstrained) for a condition"""
+    allowed: Dict[str, Optional[set]] = {field: None for field in INDEXED_FIELDS}
+    if isinstance(condition, dict):
+        for field in INDEXED_FIELDS:
+            if field in condition:
+                allowed[field] = _allowed_values(field, condition[field])
+        if 'min_severity' in condition:
+            values = _allowed_values('severity', {'gte': condition['min_severity']})
+            allowed['severity'] = values if allowed['severity'] is None else allowed['severity'] & values
+
+    def key_count() -> int:
+        count = 1
+        for values in allowed.values():
+            count *= len(values) if values is not None else 1
+        return count
+
+    # Very wide conditions fall back to "any" on their widest field; the predicate still filters
+    while key_count() > MAX_KEYS_PER_PLAYBOOK:
+        widest = max((f for f in INDEXED_FIELDS if allowed[f] is not None), key=lambda f: len(allowed[f]))
+        allowed[widest] = None
+
+    slots = [sorted(allowed[f], key=str) if allowed[f] is not None else [ANY] for f in INDEXED_FIELDS]
+    return list(product(*slots))
+
+
+class PlaybookTriggerIndex:
+    """Compiled trigger predicates keyed by (severity, ioc_type, agent)"""
+
+    def __init__(self):
+        self.playbooks: Dict[str, Dict[str, Any]] = {}
+        self._predicates: Dict[str, Predicate] = {}
+        self._buckets: Dict[Tuple[Any, ...], List[str]] = {}
+        self.errors: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._predicates)
+
+    def build(self, playbooks: Iterable[Dict[str, Any]]):
+        """Compile every playbook with trigger conditions; playbooks without them are manual-only"""
+        for playbook in playbooks:
+            playbook_id = str(playbook['id'])
+            self.playbooks[playbook_id] = playbook
+            condition = playbook.get('trigger_conditions')
+            if not condition:
+                continue
+            try:
+                self._predicates[playbook_id] = compile_condition(condition)
+                keys = index_keys(condition)
+            except (ValueError, TypeError, re.error) as e:
+                self.errors[playbook_id] = str(e)
+                self._predicates.pop(playbook_id, None)
+                continue
+            for key in keys:
+                self._buckets.setdefault(key, []).append(playbook_id)
+
+    def candidates(self, event: Dict[str, Any]) -> List[str]:
+        """Playbook ids whose indexed fields admit this event"""
+        values = [_norm(event.get(field)) for field in INDEXED_FIELDS]
+        slots = [(value, ANY) if value not in (None, ANY) else (ANY,) for value in values]
+        found: List[str] = []
+        for key in product(*slots):
+            found.extend(self._buckets.get(key, ()))
+        return list(dict.fromkeys(found))
+
+    def match(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Playbooks whose trigger conditions hold for the event"""
+        matched = []
+        for playbook_id in self.candidates(event):
+            try:
+                if self._predicates[playbook_id](event):
+                    matched.append(self.playbooks[playbook_id])
+            except Exception as e:
+                print(f"Error evaluating trigger for playbook {playbook_id}: {e}")
+        return matched
+
+
+class PlaybookTriggerCache:
+    """Active playbooks and their compiled triggers, rebuilt when soar_playbooks changes"""
+
+    def __init__(self):
+        self.supabase = get_supabase_client()
+        self.index = PlaybookTriggerIndex()
+        self.version: Optional[Tuple[Any, ...]] = None
+        self.checked_at: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def playbooks(self) -> List[Dict[str, Any]]:
+        return list(self.index.playbooks.values())
+
+    def invalidate(self):
+        """Force a change check on next use (call after writing to soar_playbooks)"""
+        self.checked_at = None
+
+    async def match(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        await self.ensure_fresh()
+        return self.index.match(event)
+
+    async def ensure_fresh(self):
+        """Rebuild when the playbook table changed since the last build"""
+        if self.checked_at and datetime.utcnow() - self.checked_at < CHANGE_CHECK_INTERVAL:
+            return
+        async with self._lock:
+            if self.checked_at and datetime.utcnow() - self.checked_at < CHANGE_CHECK_INTERVAL:
+                return
+            try:
+                version = self._current_version()
+                if version != self.version:
+                    self.index = self._build()
+                    self.version = version
+                self.checked_at = datetime.utcnow()
+            except Exception as e:
+                print(f"Error refreshing playbook triggers: {e}")
+
+    def _current_version(self) -> Tuple[Any, ...]:
+        # Row count catches deletes; the newest updated_at catches inserts and edits
+        result = self.supabase.table('soar_playbooks')\
+            .select('updated_at', count='exact')\
+            .order('updated_at', desc=True)\
+            .limit(1)\
+            .execute()
+        newest = result.data[0]['updated_at'] if result.data else None
+        return (result.count, newest)
+
+    def _build(self) -> PlaybookTriggerIndex:
+        result = self.supabase.table('soar_playbooks').select('*').eq('status', 'active').execute()
+        index = PlaybookTriggerIndex()
+        index.build(result.data or [])
+        for playbook_id, error in index.errors.items():
+            print(f"Invalid trigger conditions on playbook {playbook_id}: {error}")
+        return index
+
+
+_playbook_trigger_cache: Optional[PlaybookTriggerCache] = None
+
+
+def get_playbook_trigger_cache() -> PlaybookTriggerCache:
+    """Get or create the process-wide playbook trigger cache"""
+    global _playbook_trigger_cache
+
+    if _playbook_trigger_cache is None:
+        _playbook_trigger_cache = PlaybookTriggerCache()
+
+    return _playbook_trigger_cache
+
+
+def benchmark(index: PlaybookTriggerIndex, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Measure match throughput of an index over a list of events"""
+    started = time.perf_counter()
+    matches = sum(len(index.match(event)) for event in events)
+    elapsed = time.perf_counter() - started or 1e-9
+    candidates = sum(len(index.candidates(event)) for event in events)
+    return {
+        'playbooks': len(index),
+        'events': len(events),
+        'avg_candidates': round(candidates / max(len(events), 1), 1),
+        'avg_matches': round(matches / max(len(events), 1), 2),
+        'elapsed_seconds': round(elapsed, 3),
+        'events_per_second': round(len(events) / elapsed)
+    }
+
+
+if __name__ == "__main__":
+    rng = random.Random(7)
+    ioc_types = ['ip', 'domain', 'url', 'hash', 'email', 'filename']
+    agents = ['threat_intel', 'individual', 'organization', 'sanctions', 'soar', 'master']
+
+    def synthetic_condition() -> Dict[str, Any]:
+        condition: Dict[str, Any] = {}
+        if rng.random() < 0.8:
+            condition['severity'] = {'gte': rng.choice(SEVERITY_ORDER[1:])}
+        if rng.random() < 0.9:
+            condition['ioc_type'] = rng.sample(ioc_types, rng.randint(1, 2))
+        if rng.random() < 0.8:
+            condition['agent'] = rng.choice(agents)
+        if rng.random() < 0.3:
+            condition['confidence'] = {'gte': rng.randint(50, 95)}
+        if rng.random() < 0.2:
+            condition['tags'] = {'contains': rng.choice(['ransomware', 'phishing', 'c2', 'apt'])}
+        return condition or {'any': [{'severity': 'critical'}, {'tags': {'contains': 'apt'}}]}
+
+    playbooks = [
+        {'id': str(i), 'name': f"playbook-{i}", 'status': 'active', 'trigger_conditions': synthetic_condition()}
+        for i in range(1000)
+    ]
+    events = [
+        {
+            'severity': rng.choice(SEVERITY_ORDER),
+            'ioc_type': rng.choice(ioc_types),
+            'agent': rng.choice(agents),
+            'confidence': rng.randint(0, 100),
+            'tags': rng.sample(['ransomware', 'phishing', 'c2', 'apt', 'botnet'], 2)
+        }
+        for _ in range(50000)
+    ]
+
+    indexed = PlaybookTriggerIndex()
+    indexed.build(playbooks)
+    print('indexed:', benchmark(indexed, events))
+
+    # Baseline: evaluate every compiled predicate for every event
+    predicates = [compile_condition(p['trigger_conditions']) for p in playbooks]
+    started = time.perf_counter()
+    for event in events[:5000]:
+        sum(1 for predicate in predicates if predicate(event))
+    print('scan all:', {'events_per_second': round(5000 / (time.perf_counter() - started))})
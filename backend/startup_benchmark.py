@@ -0,0 +1,113 @@
+"""
+Startup Benchmark
+Starts the API in a fresh process and times how long /health takes to report the
+orchestrator operational. Exits non-zero if readiness regresses past the budget or
+if heavy optional dependencies are imported at startup.
+
+    python startup_benchmark.py --runs 3 --max-seconds 5
+"""
+from typing import List, Optional
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+# Modules that must only be imported on first use
+HEAVY_MODULES = ('pandas', 'numpy', 'PyPDF2', 'docx', 'sklearn', 'torch')
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_CHECK_IMPORTS = (
+    "import sys, json, time; started = time.perf_counter(); import main; "
+    "print(json.dumps({'seconds': time.perf_counter() - started, "
+    "'heavy': [m for m in %r if m in sys.modules]}))"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _ready(port: int) -> bool:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=0.5) as response:
+            return json.loads(response.read()).get('orchestrator') == 'operational'
+    except Exception:
+        return False
+
+
+def check_imports() -> dict:
+    """Import time of the app module and any heavy modules it pulled in"""
+    output = subprocess.run(
+        [sys.executable, '-c', _CHECK_IMPORTS % (HEAVY_MODULES,)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def time_to_ready(timeout: float) -> Optional[float]:
+    """Seconds from process start until /health reports operational, or None on timeout"""
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                return None
+            if _ready(port):
+                return time.perf_counter() - started
+            time.sleep(0.02)
+        return None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=5.0,
+                        help='budget for the median time to /health readiness')
+    args = parser.parse_args(argv)
+
+    failed = False
+    imports = check_imports()
+    print(f"import main: {imports['seconds'] * 1000:.0f}ms")
+    if imports['heavy']:
+        print(f"FAIL heavy modules imported at startup: {', '.join(imports['heavy'])}")
+        failed = True
+
+    timings = []
+    for run in range(args.runs):
+        seconds = time_to_ready(timeout=args.max_seconds * 4)
+        if seconds is None:
+            print(f"run {run + 1}: FAIL not ready within {args.max_seconds * 4:.1f}s")
+            return 1
+        timings.append(seconds)
+        print(f"run {run + 1}: ready in {seconds * 1000:.0f}ms")
+
+    median = statistics.median(timings)
+    print(f"median time to ready: {median * 1000:.0f}ms (budget {args.max_seconds * 1000:.0f}ms)")
+    if median > args.max_seconds:
+        print("FAIL startup readiness regressed past the budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
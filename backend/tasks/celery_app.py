@@ -9,7 +9,8 @@ redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 celery_app = Celery(
     "cybersecurity_platform",
     broker=redis_url,
-    backend=redis_url
+    backend=redis_url,
+    include=["tasks.risk_scoring", "tasks.feed_polling", "tasks.retro_sweep"]
 )
 
 celery_app.conf.update(
@@ -18,4 +19,20 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    beat_schedule={
+        "recompute-risk-scores": {
+            "task": "tasks.risk_scoring.recompute_risk_scores",
+            "schedule": 300.0,
+        },
+        "poll-threat-feeds": {
+            "task": "tasks.feed_polling.poll_threat_feeds",
+            "schedule": 60.0,
+            # A run still queued when the next is due is dropped; the poller's Redis lock covers running ones
+            "options": {"expires": 55.0},
+        },
+        "sweep-new-iocs": {
+            "task": "tasks.retro_sweep.sweep_new_iocs",
+            "schedule": 900.0,
+        },
+    },
 )
@@ -0,0 +1,29 @@
+"""
+Threat feed polling background tasks
+"""
+import asyncio
+
+from core.redis_client import close_redis
+from tasks.celery_app import celery_app
+from tasks.retro_sweep import sweep_new_iocs
+from intelligence.feed_poller import ThreatFeedPoller
+
+
+async def _poll_due_feeds():
+    try:
+        return await ThreatFeedPoller().poll_due_feeds()
+    finally:
+        # The Redis client is bound to this task's event loop
+        await close_redis()
+
+
+@celery_app.task(name="tasks.feed_polling.poll_threat_feeds")
+def poll_threat_feeds():
+    """Poll every active threat feed whose update frequency has elapsed"""
+    results = asyncio.run(_poll_due_feeds())
+    
+    # Newly seen IOCs may already have touched us; sweep history for them
+    if any(result.get('new_threats') for result in results.values()):
+        sweep_new_iocs.delay()
+    
+    return results
@@ -0,0 +1,22 @@
+"""
+Retroactive IOC sweep background tasks
+"""
+import asyncio
+
+from core.redis_client import close_redis
+from tasks.celery_app import celery_app
+from intelligence.retro_sweep import RetroactiveSweep
+
+
+async def _sweep():
+    try:
+        return await RetroactiveSweep().run()
+    finally:
+        # The Redis client is bound to this task's event loop
+        await close_redis()
+
+
+@celery_app.task(name="tasks.retro_sweep.sweep_new_iocs")
+def sweep_new_iocs():
+    """Sweep history against threats added since the last completed sweep; skipped if one is running"""
+    return asyncio.run(_sweep())
@@ -0,0 +1,13 @@
+"""
+Risk scoring background tasks
+"""
+import asyncio
+
+from tasks.celery_app import celery_app
+from intelligence.risk_scoring import RiskScoringEngine
+
+
+@celery_app.task(name="tasks.risk_scoring.recompute_risk_scores")
+def recompute_risk_scores(full: bool = False):
+    """Rescore entities marked dirty since the last run"""
+    return asyncio.run(RiskScoringEngine().recompute(full=full))
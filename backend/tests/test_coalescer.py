@@ -0,0 +1,126 @@
+"""
+Action coalescer tests against a local fake firewall backend
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from soar.coalescer import ActionCoalescer, EnforcementBackend, HttpEnforcementBackend
+
+
+class FakeFirewall(EnforcementBackend):
+    name = "fake_firewall"
+    action_type = "block_ip"
+
+    def __init__(self, delay: float = 0.05, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+
+    async def execute_batch(self, targets, reasons):
+        self.calls.append((list(targets), list(reasons)))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("firewall unreachable")
+        return {target: {'status': 'blocked'} for target in targets}
+
+
+def test_burst_is_coalesced_into_few_deduplicated_calls():
+    async def burst():
+        firewall = FakeFirewall()
+        coalescer = ActionCoalescer(backends=[firewall], window=0.1)
+        ips = [f"198.51.100.{i % 40}" for i in range(300)]
+
+        async def execution(ip, delay):
+            await asyncio.sleep(delay)
+            return await coalescer.submit('block_ip', [ip], reason='burst')
+
+        results = await asyncio.gather(*(execution(ip, i * 0.0005) for i, ip in enumerate(ips)))
+        return firewall, coalescer, ips, results
+
+    firewall, coalescer, ips, results = asyncio.run(burst())
+
+    assert all(result[ip]['fake_firewall']['status'] == 'blocked' for result, ip in zip(results, ips))
+    sent = [ip for targets, _ in firewall.calls for ip in targets]
+    assert sorted(sent) == sorted(set(ips))
+    assert len(firewall.calls) <= 2
+    assert coalescer.stats['requested'] == 300
+    assert coalescer.stats['targets_sent'] == 40
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    async def run():
+        firewall = FakeFirewall(delay=0)
+        coalescer = ActionCoalescer(backends=[firewall], window=60, max_batch=10)
+        await asyncio.wait_for(coalescer.submit('block_ip', [f"10.0.0.{i}" for i in range(10)]), timeout=5)
+        return firewall
+
+    firewall = asyncio.run(run())
+
+    assert len(firewall.calls) == 1 and len(firewall.calls[0][0]) == 10
+
+
+def test_target_requested_while_in_flight_joins_the_sent_batch():
+    async def run():
+        firewall = FakeFirewall(delay=0.2)
+        coalescer = ActionCoalescer(backends=[firewall], window=0.01)
+        first = asyncio.create_task(coalescer.submit('block_ip', ['203.0.113.7'], reason='first'))
+        # The first batch has left the window and is waiting on the backend
+        await asyncio.sleep(0.1)
+        second = await coalescer.submit('block_ip', ['203.0.113.7'], reason='second')
+        return firewall, coalescer, await first, second
+
+    firewall, coalescer, first, second = asyncio.run(run())
+
+    assert firewall.calls == [(['203.0.113.7'], ['first'])]
+    assert first == second
+    assert coalescer.stats['deduplicated'] == 1
+
+
+def test_backend_failure_reaches_every_waiting_execution():
+    async def run():
+        firewall = FakeFirewall(fail=True)
+        coalescer = ActionCoalescer(backends=[firewall], window=0.05)
+        outcomes = await asyncio.gather(
+            coalescer.submit('block_ip', ['192.0.2.1']),
+            coalescer.submit('block_ip', ['192.0.2.1', '192.0.2.2']),
+            coalescer.submit('block_ip', ['192.0.2.3']),
+            return_exceptions=True
+        )
+        # A later request is not stuck behind the failed batch
+        firewall.fail = False
+        retry = await coalescer.submit('block_ip', ['192.0.2.1'])
+        return firewall, outcomes, retry
+
+    firewall, outcomes, retry = asyncio.run(run())
+
+    assert len(firewall.calls) == 2
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert all('firewall unreachable' in str(outcome) for outcome in outcomes)
+    assert retry['192.0.2.1']['fake_firewall']['status'] == 'blocked'
+
+
+def test_unconfigured_action_type_is_rejected():
+    with pytest.raises(RuntimeError):
+        asyncio.run(ActionCoalescer(backends=[FakeFirewall()]).submit('quarantine_host', ['host-1']))
+
+
+def test_http_backend_sends_reason_alongside_reasons(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json={'results': {'192.0.2.1': {'status': 'blocked'}}})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(httpx, 'AsyncClient',
+                        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs))
+    backend = HttpEnforcementBackend('firewall', 'block_ip', 'http://firewall.test', '', 'block', 'ips')
+
+    results = asyncio.run(backend.execute_batch(['192.0.2.1', '192.0.2.2'], ['alert A', 'alert B']))
+
+    assert requests == [{'ips': ['192.0.2.1', '192.0.2.2'], 'reason': 'alert A; alert B',
+                         'reasons': ['alert A', 'alert B']}]
+    assert results == {'192.0.2.1': {'status': 'blocked'}, '192.0.2.2': {'status': 'unknown'}}
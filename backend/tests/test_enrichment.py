@@ -0,0 +1,124 @@
+"""
+Enrichment service tests against a stand-in reputation API
+"""
+import asyncio
+import time
+
+import httpx
+
+from intelligence.enrichment import EnrichmentService, OTXProvider, TokenBucket, VirusTotalProvider
+
+
+class StandInApi:
+    """Answers VirusTotal and OTX paths; `responses` queues overrides for the next requests"""
+
+    def __init__(self):
+        self.requested = []
+        self.responses = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requested.append(request.url.raw_path.decode())
+        if self.responses:
+            return self.responses.pop(0)
+        if request.url.path.endswith('/general'):
+            return httpx.Response(200, json={'pulse_info': {'count': 1, 'pulses': [{'name': 'stand-in'}]}})
+        return httpx.Response(200, json={'data': {'attributes': {'last_analysis_stats': {'malicious': 2}}}})
+
+
+def _service(api, providers):
+    service = EnrichmentService(providers, persist=False)
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(api))
+    return service
+
+
+def _pending(results):
+    return sum(1 for providers in results.values() for result in providers.values() if result.get('pending'))
+
+
+def test_otx_url_lookup_is_one_quoted_path_segment():
+    otx = OTXProvider('key', 'https://otx.invalid/api/v1', 60)
+
+    url, options = otx._request(('url', 'http://evil.test/a?b=c#frag'))
+
+    assert url == 'https://otx.invalid/api/v1/indicators/url/http%3A%2F%2Fevil.test%2Fa%3Fb%3Dc%23frag/general'
+    assert options == {'headers': {'X-OTX-API-KEY': 'key'}}
+
+
+def test_virustotal_url_lookup_uses_the_unpadded_base64_id():
+    virustotal = VirusTotalProvider('key', 'https://vt.invalid/api/v3', 4)
+
+    url, _ = virustotal._request(('url', 'http://evil.test/'))
+
+    assert url == 'https://vt.invalid/api/v3/urls/aHR0cDovL2V2aWwudGVzdC8'
+
+
+def test_chat_lookups_do_not_wait_for_the_rate_limit():
+    api = StandInApi()
+
+    async def run():
+        virustotal = VirusTotalProvider('key', 'https://vt.invalid/api/v3', 4)
+        # Four lookups at once, then twenty a second, so the background drain is quick
+        virustotal.bucket = TokenBucket(rate=20, capacity=4)
+        otx = OTXProvider('key', 'https://otx.invalid/api/v1', 60)
+        service = _service(api, [virustotal, otx])
+        iocs = [('ip', f'203.0.113.{i}') for i in range(10)] + [('url', 'http://evil.test/a?b=c#frag')]
+        try:
+            started = time.perf_counter()
+            first = await service.enrich_many(iocs, wait=False)
+            elapsed = time.perf_counter() - started
+
+            await asyncio.gather(*service._background)
+            before = len(api.requested)
+            second = await service.enrich_many(iocs, wait=False)
+            return first, elapsed, second, before
+        finally:
+            await service.close()
+
+    first, elapsed, second, before = asyncio.run(run())
+
+    # VirusTotal answers four now and defers seven; OTX has budget for all eleven
+    assert _pending(first) == 7
+    assert all(r['virustotal'].get('pending') or r['virustotal']['found'] for r in first.values())
+    assert elapsed < 0.2
+    # The deferred lookups were cached, so asking again sends nothing
+    assert _pending(second) == 0
+    assert len(api.requested) == before == 2 * 11
+
+
+def test_concurrent_callers_share_one_lookup():
+    api = StandInApi()
+
+    async def run():
+        service = _service(api, [OTXProvider('key', 'https://otx.invalid/api/v1', 60)])
+        try:
+            return await asyncio.gather(*(service.enrich('domain', 'Evil.Test') for _ in range(5)))
+        finally:
+            await service.close()
+
+    results = asyncio.run(run())
+
+    assert len(api.requested) == 1
+    assert all(result['alienvault_otx']['pulse_count'] == 1 for result in results)
+
+
+def test_rate_limited_lookup_is_retried_and_errors_are_not_cached():
+    api = StandInApi()
+    api.responses = [httpx.Response(429, headers={'Retry-After': '0'}), httpx.Response(500)]
+
+    async def run():
+        otx = OTXProvider('key', 'https://otx.invalid/api/v1', 60)
+        service = _service(api, [otx])
+        try:
+            failed = await service.enrich('ip', '198.51.100.7')
+            retried = await service.enrich('ip', '198.51.100.7')
+            cached = await service.enrich('ip', '198.51.100.7')
+            return failed, retried, cached
+        finally:
+            await service.close()
+
+    failed, retried, cached = asyncio.run(run())
+
+    assert failed['alienvault_otx']['found'] is None and 'error' in failed['alienvault_otx']
+    assert retried['alienvault_otx']['found'] is True
+    assert cached == retried
+    assert len(api.requested) == 3
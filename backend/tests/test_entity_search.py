@@ -0,0 +1,26 @@
+"""
+Entity extraction and email filter tests
+"""
+from intelligence.entity_search import email_filter, extract_entities
+
+
+def test_emails_are_extracted_lowercased_without_their_domains():
+    entities = extract_entities('Search for Jane.Doe@Acme.com and check evil-corp.net')
+
+    assert entities['emails'] == ['jane.doe@acme.com']
+    assert entities['domains'] == ['evil-corp.net']
+
+
+def test_email_filter_matches_case_insensitively():
+    assert email_filter(['jane.doe@acme.com', 'bob@x.io']) == \
+        'email.ilike."jane.doe@acme.com",email.ilike."bob@x.io"'
+
+
+def test_email_filter_escapes_like_wildcards():
+    # '_' and '%' would otherwise match any character in ilike
+    assert email_filter(['jane_doe@acme.com']) == 'email.ilike."jane\\\\_doe@acme.com"'
+    assert email_filter(['a%b@x.io']) == 'email.ilike."a\\\\%b@x.io"'
+
+
+def test_email_filter_drops_addresses_with_postgrest_wildcards():
+    assert email_filter(['*@acme.com']) == ''
@@ -0,0 +1,258 @@
+"""
+Feed poller tests against a stand-in TAXII 2.1 server whose clock runs behind ours
+"""
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+import asyncio
+import json
+import threading
+import uuid
+
+import httpx
+import pytest
+
+import intelligence.feed_poller as feed_poller
+import intelligence.threat_store as threat_store
+from intelligence.feed_poller import TAXII_MEDIA_TYPE, ThreatFeedPoller, fetch_objects, indicator_to_threats
+
+SERVER_SKEW = timedelta(minutes=-10)
+
+
+class StandInTaxii:
+    """One TAXII collection served over HTTP, stamping date_added with a skewed clock"""
+
+    def __init__(self):
+        self.objects = []
+        self.requests = 0
+        self.fail = False
+        taxii = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                taxii.requests += 1
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if taxii.fail or not url.path.endswith('/objects/'):
+                    self.send_error(503 if taxii.fail else 404)
+                    return
+                matching = [obj for obj in taxii.objects if obj['date_added'] > query.get('added_after', '')]
+                start, limit = int(query.get('next', 0)), int(query['limit'])
+                page = matching[start:start + limit]
+                more = start + limit < len(matching)
+                envelope = {'more': more,
+                            'objects': [{k: v for k, v in obj.items() if k != 'date_added'} for obj in page]}
+                if more:
+                    envelope['next'] = str(start + limit)
+                body = json.dumps(envelope).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', TAXII_MEDIA_TYPE)
+                if page:
+                    self.send_header('X-TAXII-Date-Added-First', page[0]['date_added'])
+                    self.send_header('X-TAXII-Date-Added-Last', page[-1]['date_added'])
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/taxii2/"
+        self.collection_url = self.base_url + 'collections/demo/'
+
+    def publish(self, count: int):
+        """Add indicators stamped with the server's clock, as a feed would"""
+        for _ in range(count):
+            n = len(self.objects)
+            added = datetime.now(timezone.utc) + SERVER_SKEW + timedelta(microseconds=n)
+            self.objects.append({
+                'type': 'indicator', 'spec_version': '2.1', 'id': f"indicator--{uuid.UUID(int=n)}",
+                'name': f"Scanner {n}", 'pattern': f"[ipv4-addr:value = '198.51.{n // 256 % 256}.{n % 256}']",
+                'pattern_type': 'stix', 'valid_from': added.isoformat(), 'confidence': 90,
+                'date_added': added.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            })
+
+
+@pytest.fixture
+def taxii():
+    stand_in = StandInTaxii()
+    thread = threading.Thread(target=stand_in.server.serve_forever, daemon=True)
+    thread.start()
+    yield stand_in
+    stand_in.server.shutdown()
+    stand_in.server.server_close()
+
+
+class FakeSupabase:
+    """threat_feeds rows plus the merge_threat_sightings RPC, enough for the poller"""
+
+    def __init__(self, feeds):
+        self.feeds = feeds
+        self.known = set()
+        self.merged = 0
+
+    def table(self, name):
+        assert name == 'threat_feeds'
+        return FakeFeedQuery(self)
+
+    def rpc(self, name, params):
+        assert name == 'merge_threat_sightings'
+        rows = []
+        for sighting in params['p_sightings']:
+            key = (sighting['ioc_type'], sighting['ioc_value'])
+            rows.append({**sighting, 'inserted': key not in self.known})
+            self.known.add(key)
+        self.merged += len(rows)
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=rows))
+
+
+class FakeFeedQuery:
+    def __init__(self, db):
+        self.db = db
+        self.filters = {}
+        self.payload = None
+
+    def select(self, *args):
+        return self
+
+    def update(self, payload):
+        self.payload = payload
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def execute(self):
+        rows = [feed for feed in self.db.feeds if all(feed.get(k) == v for k, v in self.filters.items())]
+        if self.payload is not None:
+            for feed in rows:
+                feed.update(json.loads(json.dumps(self.payload)))
+        return SimpleNamespace(data=[dict(feed) for feed in rows])
+
+
+class FakeRedis:
+    """SET NX and the compare-and-delete release script"""
+
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token):
+        if self.values.get(key) == token:
+            del self.values[key]
+            return 1
+        return 0
+
+
+@pytest.fixture
+def supabase(monkeypatch, taxii):
+    db = FakeSupabase([{
+        'id': 'feed-1', 'feed_name': 'stand-in', 'status': 'active', 'source_url': taxii.base_url,
+        'update_frequency': 'hourly', 'last_update': None, 'configuration': {'collections': ['demo']}
+    }])
+    monkeypatch.setattr(feed_poller, 'get_supabase_client', lambda: db)
+    monkeypatch.setattr(threat_store, 'get_supabase_client', lambda: db)
+    return db
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+
+    async def get_redis():
+        return fake
+
+    monkeypatch.setattr(feed_poller, 'get_redis', get_redis)
+    return fake
+
+
+async def _poll(url, added_after):
+    """(pages, sightings, watermark) for one poll of the collection"""
+    pages = sightings = 0
+    watermark = None
+    async with httpx.AsyncClient() as client:
+        async for objects, date_added_last in fetch_objects(client, url, added_after, page_size=500):
+            pages += 1
+            sightings += sum(len(list(indicator_to_threats(obj, 'stand-in'))) for obj in objects)
+            watermark = max(filter(None, (watermark, date_added_last)), default=None)
+    return pages, sightings, watermark
+
+
+def test_pages_resume_from_the_server_watermark_not_the_local_clock(taxii):
+    taxii.publish(1200)
+    pages, sightings, watermark = asyncio.run(_poll(taxii.collection_url, None))
+    client_clock = datetime.now(timezone.utc).isoformat()
+    assert (pages, sightings) == (3, 1200)
+
+    taxii.publish(300)
+    _, sightings, next_watermark = asyncio.run(_poll(taxii.collection_url, watermark))
+    _, missed, _ = asyncio.run(_poll(taxii.collection_url, client_clock))
+    assert sightings == 300
+    # The server's clock is behind ours, so a local-clock watermark skips everything added since
+    assert missed == 0
+
+    _, sightings, _ = asyncio.run(_poll(taxii.collection_url, next_watermark))
+    assert sightings == 0
+
+
+def test_poll_due_feeds_merges_and_advances_the_collection_watermark(taxii, supabase, redis):
+    taxii.publish(700)
+    results = asyncio.run(ThreatFeedPoller().poll_due_feeds())
+    feed = supabase.feeds[0]
+    watermark = feed['configuration']['added_after'][taxii.collection_url]
+
+    assert results == {'stand-in': {'collections': 1, 'threats': 700, 'new_threats': 700}}
+    assert watermark == taxii.objects[-1]['date_added']
+    assert feed['last_update'] is not None
+    assert redis.values == {}
+
+    taxii.publish(50)
+    feed['last_update'] = None
+    results = asyncio.run(ThreatFeedPoller().poll_due_feeds())
+    assert results['stand-in']['new_threats'] == 50
+    assert feed['configuration']['added_after'][taxii.collection_url] == taxii.objects[-1]['date_added']
+
+
+def test_failed_poll_keeps_the_previous_watermark(taxii, supabase, redis):
+    taxii.publish(10)
+    asyncio.run(ThreatFeedPoller().poll_due_feeds())
+    feed = supabase.feeds[0]
+    watermark = feed['configuration']['added_after'][taxii.collection_url]
+
+    taxii.publish(10)
+    taxii.fail = True
+    feed['last_update'] = None
+    results = asyncio.run(ThreatFeedPoller().poll_due_feeds())
+
+    assert 'error' in results['stand-in']
+    assert feed['configuration']['added_after'][taxii.collection_url] == watermark
+    assert feed['configuration']['last_error']
+
+
+def test_overlapping_runs_poll_each_feed_once(taxii, supabase, redis):
+    taxii.publish(100)
+
+    async def overlapping():
+        return await asyncio.gather(ThreatFeedPoller().poll_due_feeds(), ThreatFeedPoller().poll_due_feeds())
+
+    first, second = asyncio.run(overlapping())
+
+    assert [bool(first), bool(second)].count(True) == 1
+    assert supabase.merged == 100
+    assert redis.values == {}
+
+
+def test_lock_held_elsewhere_skips_the_run(taxii, supabase, redis):
+    redis.values[feed_poller.POLL_LOCK_KEY] = 'another-worker'
+    taxii.publish(5)
+
+    assert asyncio.run(ThreatFeedPoller().poll_due_feeds()) == {}
+    assert taxii.requests == 0
+    assert redis.values[feed_poller.POLL_LOCK_KEY] == 'another-worker'
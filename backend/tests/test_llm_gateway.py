@@ -0,0 +1,152 @@
+"""
+LLM gateway tests against the in-process stub model server
+"""
+import asyncio
+
+import httpx
+import pytest
+
+import core.llm_gateway as llm_gateway
+from core.llm_gateway import LLMBackend, LLMGateway, create_stub_app
+
+
+@pytest.fixture(autouse=True)
+def no_redis(monkeypatch):
+    async def get_redis():
+        return None
+
+    monkeypatch.setattr(llm_gateway, 'get_redis', get_redis)
+
+
+def _stub_backend(latency: float = 0.05):
+    app = create_stub_app(latency)
+    backend = LLMBackend('http://stub/v1', model='stub')
+    backend._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://stub/v1')
+    return app, backend
+
+
+class CountingBackend(LLMBackend):
+    """Records how many calls overlap; fails while `failures` remain"""
+
+    def __init__(self, failures: int = 0):
+        super().__init__('http://unused', model='counting')
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+        self.failures = failures
+
+    async def complete(self, messages, max_tokens, temperature):
+        self.calls += 1
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.02)
+            if self.failures:
+                self.failures -= 1
+                raise httpx.ConnectError("model unavailable")
+            return {'text': f"answer to {messages[-1]['content']}", 'usage': {'total_tokens': 10}}
+        finally:
+            self.running -= 1
+
+
+def test_burst_of_repeated_prompts_makes_one_call_per_distinct_prompt():
+    app, backend = _stub_backend()
+    agents = ['threat_intel', 'individual', 'soar']
+
+    async def run():
+        gateway = LLMGateway(backend, max_concurrency=4, agent_max_concurrency=2)
+        try:
+            results = await asyncio.gather(*(
+                gateway.complete(agents[i % 3], f"Summarize   threat report {i % 10}") for i in range(60)
+            ))
+            repeat = await gateway.complete('threat_intel', 'Summarize threat report 0')
+            return gateway, results, repeat
+        finally:
+            await gateway.close()
+
+    gateway, results, repeat = asyncio.run(run())
+
+    assert app.state.calls == 10
+    assert gateway.stats['model_calls'] == 10
+    assert gateway.stats['coalesced'] + gateway.stats['cache_hits'] == 51
+    assert len({r['text'] for r in results}) == 10
+    assert repeat['cached'] is True
+
+
+def test_whitespace_variants_share_a_cache_entry_but_sampled_requests_do_not():
+    backend = CountingBackend()
+
+    async def run():
+        gateway = LLMGateway(backend)
+        first = await gateway.complete('soar', 'Block  this\nIP')
+        second = await gateway.complete('soar', ' Block this IP ')
+        await gateway.complete('soar', 'Block this IP', temperature=0.7)
+        await gateway.complete('soar', 'Block this IP', cache=False)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert second['cached'] is True
+    assert second['text'] == first['text']
+    assert backend.calls == 3
+
+
+def test_concurrency_is_limited_globally_and_per_agent():
+    backend = CountingBackend()
+
+    async def run(gateway, agents):
+        await asyncio.gather(*(gateway.complete(agent, f"prompt {i}") for i, agent in enumerate(agents)))
+
+    asyncio.run(run(LLMGateway(backend, max_concurrency=3, agent_max_concurrency=8), ['a', 'b'] * 10))
+    assert backend.peak == 3
+
+    backend.peak = 0
+    asyncio.run(run(LLMGateway(backend, max_concurrency=8, agent_max_concurrency=2), ['a'] * 10))
+    assert backend.peak == 2
+
+
+def test_failed_calls_reach_every_coalesced_caller_and_are_not_cached():
+    backend = CountingBackend(failures=1)
+
+    async def run():
+        gateway = LLMGateway(backend)
+        failed = await asyncio.gather(*(gateway.complete('soar', 'same prompt') for _ in range(3)),
+                                      return_exceptions=True)
+        retried = await gateway.complete('soar', 'same prompt')
+        return gateway, failed, retried
+
+    gateway, failed, retried = asyncio.run(run())
+
+    assert all(isinstance(outcome, httpx.ConnectError) for outcome in failed)
+    assert retried['cached'] is False and retried['text'] == 'answer to same prompt'
+    assert backend.calls == 2
+    assert gateway.stats['errors'] == 1
+
+
+def test_stream_is_cached_once_complete():
+    app, backend = _stub_backend(latency=0)
+
+    async def run():
+        gateway = LLMGateway(backend)
+        try:
+            streamed = [chunk async for chunk in gateway.stream('soar', 'Stream a fresh answer')]
+            repeated = [chunk async for chunk in gateway.stream('soar', 'Stream a fresh answer')]
+            completed = await gateway.complete('soar', 'Stream a fresh answer')
+            return streamed, repeated, completed
+        finally:
+            await gateway.close()
+
+    streamed, repeated, completed = asyncio.run(run())
+
+    assert len(streamed) > 1
+    assert repeated == [''.join(streamed)]
+    assert completed['cached'] is True and completed['text'] == ''.join(streamed)
+    assert app.state.calls == 1
+
+
+def test_gateway_without_backend_refuses_requests():
+    gateway = LLMGateway(None)
+
+    assert not gateway.enabled
+    with pytest.raises(RuntimeError):
+        asyncio.run(gateway.complete('soar', 'anything'))
@@ -0,0 +1,148 @@
+"""
+Playbook engine tests with stand-in action handlers
+"""
+from collections import defaultdict
+import asyncio
+import time
+
+import pytest
+
+from soar.playbook_engine import PlaybookEngine, parse_actions, resolve_params
+
+
+def _engine(handlers, **kwargs):
+    return PlaybookEngine(handlers=handlers, persist=False, **kwargs)
+
+
+def _events(outcome, action_id):
+    return [entry['event'] for entry in outcome['execution_log']['entries'] if entry['action_id'] == action_id]
+
+
+def test_parse_actions_accepts_bare_types_and_aliases():
+    specs = parse_actions(['Block IP', {'type': 'send_notification', 'depends_on': 'step_1'}])
+
+    assert specs['step_1']['type'] == 'block_ip'
+    assert specs['step_2']['type'] == 'notify'
+    assert specs['step_2']['depends_on'] == ['step_1']
+
+
+@pytest.mark.parametrize('actions, message', [
+    ([{'id': 'a', 'type': 'notify', 'depends_on': 'b'}, {'id': 'b', 'type': 'notify', 'depends_on': 'a'}], 'cycle'),
+    ([{'id': 'a', 'type': 'notify', 'depends_on': 'missing'}], 'unknown action'),
+    ([{'id': 'a', 'type': 'notify'}, {'id': 'a', 'type': 'notify'}], 'Duplicate'),
+])
+def test_parse_actions_rejects_invalid_graphs(actions, message):
+    with pytest.raises(ValueError, match=message):
+        parse_actions(actions)
+
+
+def test_resolve_params_reads_event_and_earlier_results():
+    context = {'event': {'source_ip': '203.0.113.7'}, 'results': {'lookup': {'asn': 64500}}}
+
+    params = resolve_params({'ip': '$event.source_ip', 'tags': ['$results.lookup.asn', 'x'], 'none': '$event.a.b'},
+                            context)
+
+    assert params == {'ip': '203.0.113.7', 'tags': [64500, 'x'], 'none': None}
+
+
+def test_diamond_graph_with_retry_timeout_and_skip():
+    calls = defaultdict(int)
+
+    async def lookup(params, context):
+        await asyncio.sleep(0.05)
+        return {'ip': params['ip']}
+
+    async def flaky(params, context):
+        calls['flaky'] += 1
+        if calls['flaky'] < 2:
+            raise RuntimeError("transient backend error")
+        return {'ok': True}
+
+    async def slow(params, context):
+        await asyncio.sleep(1)
+        return {}
+
+    async def record(params, context):
+        return {'inputs': sorted(context['results'])}
+
+    playbook = {
+        'name': 'diamond',
+        'actions': [
+            {'id': 'lookup', 'type': 'lookup', 'params': {'ip': '$event.source_ip'}},
+            {'id': 'block', 'type': 'flaky', 'depends_on': ['lookup'], 'backoff': 0.01},
+            {'id': 'scan', 'type': 'slow', 'depends_on': ['lookup'], 'timeout': 0.1, 'retries': 1, 'backoff': 0.01},
+            {'id': 'report', 'type': 'record', 'depends_on': ['block']},
+            {'id': 'close', 'type': 'record', 'depends_on': ['scan', 'report']},
+        ]
+    }
+    engine = _engine({'lookup': lookup, 'flaky': flaky, 'slow': slow, 'record': record})
+
+    outcome = asyncio.run(engine.execute(playbook, event={'source_ip': '203.0.113.7'}))
+    actions = outcome['execution_log']['actions']
+
+    assert outcome['status'] == 'failed'
+    assert actions['lookup']['result'] == {'ip': '203.0.113.7'}
+    assert actions['block']['status'] == 'succeeded' and actions['block']['attempts'] == 2
+    assert actions['scan']['status'] == 'failed' and actions['scan']['error'] == 'timed out'
+    assert actions['report']['result'] == {'inputs': ['block', 'lookup']}
+    assert actions['close']['status'] == 'skipped'
+    assert _events(outcome, 'scan') == ['started', 'retrying', 'started', 'failed']
+    summary = outcome['execution_log']['summary']
+    assert [summary[k] for k in ('succeeded', 'failed', 'skipped', 'cancelled')] == [3, 1, 1, 0]
+
+
+def test_independent_actions_run_concurrently_up_to_the_limit():
+    running = {'now': 0, 'peak': 0}
+
+    async def work(params, context):
+        running['now'] += 1
+        running['peak'] = max(running['peak'], running['now'])
+        await asyncio.sleep(0.1)
+        running['now'] -= 1
+        return {}
+
+    playbook = {'actions': [{'id': f"a{i}", 'type': 'work'} for i in range(6)]}
+    started = time.perf_counter()
+    outcome = asyncio.run(_engine({'work': work}, max_parallel=3).execute(playbook))
+
+    assert outcome['status'] == 'completed'
+    assert running['peak'] == 3
+    assert time.perf_counter() - started < 0.5
+
+
+def test_value_errors_are_not_retried():
+    calls = defaultdict(int)
+
+    async def bad(params, context):
+        calls['bad'] += 1
+        raise ValueError("missing 'ip'")
+
+    outcome = asyncio.run(_engine({'bad': bad}).execute({'actions': [{'id': 'a', 'type': 'bad', 'retries': 3}]}))
+
+    assert calls['bad'] == 1
+    assert outcome['execution_log']['actions']['a']['error'] == "ValueError: missing 'ip'"
+
+
+def test_unknown_action_type_is_rejected_before_running():
+    with pytest.raises(ValueError, match='No handler'):
+        asyncio.run(_engine({}).execute({'actions': ['block_ip']}))
+
+
+def test_cancel_stops_running_and_pending_actions():
+    async def hang(params, context):
+        await asyncio.sleep(10)
+
+    async def run():
+        engine = _engine({'hang': hang})
+        playbook = {'actions': [{'id': 'first', 'type': 'hang'}, {'id': 'then', 'type': 'hang', 'depends_on': 'first'}]}
+        execution = asyncio.create_task(engine.execute(playbook))
+        await asyncio.sleep(0.05)
+        execution_id = next(iter(engine._running))
+        assert engine.cancel(execution_id)
+        return await asyncio.wait_for(execution, timeout=2)
+
+    outcome = asyncio.run(run())
+
+    assert outcome['execution_log']['summary']['status'] == 'cancelled'
+    assert outcome['execution_log']['actions']['first']['status'] == 'cancelled'
+    assert outcome['execution_log']['actions']['then']['status'] == 'cancelled'
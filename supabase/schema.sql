@@ -3,6 +3,8 @@
 
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+-- Trigram matching for indexed ILIKE name search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Users and Authentication (Supabase handles auth, this is for additional user data)
 CREATE TABLE IF NOT EXISTS users (
@@ -23,6 +25,8 @@ CREATE TABLE IF NOT EXISTS organizations (
     industry TEXT,
     country_code TEXT,
     risk_score NUMERIC(5,2) DEFAULT 0,
+    risk_factors JSONB,
+    risk_scored_at TIMESTAMP WITH TIME ZONE,
     status TEXT CHECK (status IN ('active', 'suspended', 'blocked')) DEFAULT 'active',
     metadata JSONB,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
@@ -37,6 +41,8 @@ CREATE TABLE IF NOT EXISTS individuals (
     full_name TEXT,
     organization_id UUID REFERENCES organizations(id),
     risk_score NUMERIC(5,2) DEFAULT 0,
+    risk_factors JSONB,
+    risk_scored_at TIMESTAMP WITH TIME ZONE,
     behavior_profile JSONB,
     access_patterns JSONB,
     anomaly_flags JSONB,
@@ -60,7 +66,8 @@ CREATE TABLE IF NOT EXISTS transactions (
     metadata JSONB,
     source_ip TEXT,
     geolocation JSONB,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    flagged_at TIMESTAMP WITH TIME ZONE
 );
 
 -- Agents Registry
@@ -92,6 +99,8 @@ CREATE TABLE IF NOT EXISTS threats (
     mitre_attack_techniques TEXT[],
     related_threat_actors TEXT[],
     metadata JSONB,
+    sighting_count INTEGER DEFAULT 1,
+    sources TEXT[],
     first_seen TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     last_seen TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
@@ -179,15 +188,51 @@ CREATE TABLE IF NOT EXISTS data_ingestions (
     source_type TEXT CHECK (source_type IN ('api', 'file', 'spreadsheet', 'pdf', 'doc', 'email', 'log')),
     source_name TEXT,
     file_name TEXT,
+    content_hash TEXT,
     status TEXT CHECK (status IN ('pending', 'processing', 'completed', 'failed')) DEFAULT 'pending',
     records_processed INTEGER DEFAULT 0,
     records_failed INTEGER DEFAULT 0,
     error_log JSONB,
     metadata JSONB,
+    -- Resume point for chunked ingestions: last chunk fully written and running totals at that point
+    last_committed_chunk INTEGER DEFAULT -1,
+    checkpoint JSONB,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     completed_at TIMESTAMP WITH TIME ZONE
 );
 
+-- Normalized access/auth events parsed from ingested logs
+CREATE TABLE IF NOT EXISTS log_events (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    ingestion_id UUID REFERENCES data_ingestions(id) ON DELETE CASCADE,
+    event_time TIMESTAMP WITH TIME ZONE,
+    user_name TEXT,
+    source_ip TEXT,
+    action TEXT,
+    result TEXT CHECK (result IN ('success', 'failure', 'unknown')) DEFAULT 'unknown',
+    log_format TEXT CHECK (log_format IN ('syslog', 'json', 'cef', 'access')),
+    host TEXT,
+    message TEXT,
+    chunk_index INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Candidate IOCs and entities extracted from ingested documents, one row per distinct value per document
+CREATE TABLE IF NOT EXISTS extracted_indicators (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    ingestion_id UUID REFERENCES data_ingestions(id) ON DELETE CASCADE,
+    indicator_type TEXT NOT NULL CHECK (indicator_type IN ('ip', 'domain', 'url', 'email', 'hash', 'cve', 'iban', 'card')),
+    subtype TEXT,
+    category TEXT CHECK (category IN ('ioc', 'entity')),
+    value TEXT NOT NULL,
+    defanged BOOLEAN DEFAULT FALSE,
+    occurrences INTEGER DEFAULT 1,
+    context TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE(ingestion_id, indicator_type, value)
+);
+
 -- Threat Intelligence Feeds
 CREATE TABLE IF NOT EXISTS threat_feeds (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -201,12 +246,25 @@ CREATE TABLE IF NOT EXISTS threat_feeds (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Cached IOC enrichment results from external reputation providers
+CREATE TABLE IF NOT EXISTS ioc_enrichments (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    provider TEXT NOT NULL,
+    ioc_type TEXT NOT NULL,
+    ioc_value TEXT NOT NULL,
+    result JSONB,
+    fetched_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    UNIQUE(provider, ioc_type, ioc_value)
+);
+
 -- Analytics and Metrics
 CREATE TABLE IF NOT EXISTS analytics (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     metric_type TEXT NOT NULL,
     metric_name TEXT NOT NULL,
     value NUMERIC(15,2),
+    cumulative_value NUMERIC(15,2),
     metadata JSONB,
     timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     UNIQUE(metric_type, metric_name, timestamp)
@@ -224,13 +282,126 @@ CREATE TABLE IF NOT EXISTS chat_conversations (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Risk scoring: entities touched since the last recompute
+CREATE TABLE IF NOT EXISTS risk_dirty_entities (
+    entity_type TEXT NOT NULL CHECK (entity_type IN ('individual', 'organization', 'transaction')),
+    entity_id UUID NOT NULL,
+    marked_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (entity_type, entity_id)
+);
+
+-- Progress of incremental background sweeps (e.g. retroactive IOC sweeps)
+CREATE TABLE IF NOT EXISTS sweep_watermarks (
+    sweep_name TEXT PRIMARY KEY,
+    threats_until TIMESTAMP WITH TIME ZONE,
+    pending_until TIMESTAMP WITH TIME ZONE,
+    cursors JSONB,
+    hits JSONB,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Columns added since the first release (CREATE TABLE IF NOT EXISTS leaves existing tables as they were)
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS flagged_at TIMESTAMP WITH TIME ZONE;
+UPDATE transactions SET flagged_at = created_at
+WHERE flagged_at IS NULL AND (fraud_indicator OR status = 'flagged');
+
+ALTER TABLE organizations ADD COLUMN IF NOT EXISTS risk_factors JSONB;
+ALTER TABLE organizations ADD COLUMN IF NOT EXISTS risk_scored_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE individuals ADD COLUMN IF NOT EXISTS risk_factors JSONB;
+ALTER TABLE individuals ADD COLUMN IF NOT EXISTS risk_scored_at TIMESTAMP WITH TIME ZONE;
+
+ALTER TABLE threats ADD COLUMN IF NOT EXISTS sighting_count INTEGER DEFAULT 1;
+ALTER TABLE threats ADD COLUMN IF NOT EXISTS sources TEXT[];
+UPDATE threats SET sources = ARRAY[source] WHERE sources IS NULL AND source IS NOT NULL;
+
+ALTER TABLE data_ingestions ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE data_ingestions ADD COLUMN IF NOT EXISTS last_committed_chunk INTEGER DEFAULT -1;
+ALTER TABLE data_ingestions ADD COLUMN IF NOT EXISTS checkpoint JSONB;
+ALTER TABLE data_ingestions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+ALTER TABLE log_events ADD COLUMN IF NOT EXISTS chunk_index INTEGER DEFAULT 0;
+
+ALTER TABLE analytics ADD COLUMN IF NOT EXISTS cumulative_value NUMERIC(15,2);
+
+-- Fold threats that repeat an IOC into one row before idx_threats_ioc is built: the oldest row is kept
+-- with the other copies' sightings, sources, ATT&CK data and highest severity merged in, and incidents
+-- are pointed at it. Does nothing once the index exists.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_threats_ioc') THEN
+        RETURN;
+    END IF;
+
+    CREATE TEMP TABLE threat_copies ON COMMIT DROP AS
+    SELECT id, keep_id FROM (
+        SELECT id,
+               FIRST_VALUE(id) OVER (PARTITION BY ioc_type, ioc_value ORDER BY created_at NULLS LAST, id) AS keep_id,
+               COUNT(*) OVER (PARTITION BY ioc_type, ioc_value) AS copies
+        FROM threats
+        WHERE ioc_value IS NOT NULL
+    ) grouped
+    WHERE copies > 1;
+
+    CREATE TEMP TABLE threat_merged ON COMMIT DROP AS
+    SELECT c.keep_id AS id,
+           SUM(COALESCE(t.sighting_count, 1)) AS sighting_count,
+           MIN(t.first_seen) AS first_seen,
+           MAX(t.last_seen) AS last_seen,
+           (ARRAY_AGG(t.severity ORDER BY COALESCE(array_position(
+               ARRAY['info', 'low', 'medium', 'high', 'critical'], t.severity), 0) DESC))[1] AS severity,
+           ARRAY(SELECT DISTINCT v FROM threat_copies cc JOIN threats x ON x.id = cc.id,
+                 unnest(COALESCE(x.sources, '{}') || x.source) AS v
+                 WHERE cc.keep_id = c.keep_id AND v IS NOT NULL ORDER BY v) AS sources,
+           ARRAY(SELECT DISTINCT v FROM threat_copies cc JOIN threats x ON x.id = cc.id,
+                 unnest(x.mitre_attack_tactics) AS v
+                 WHERE cc.keep_id = c.keep_id AND v IS NOT NULL ORDER BY v) AS mitre_attack_tactics,
+           ARRAY(SELECT DISTINCT v FROM threat_copies cc JOIN threats x ON x.id = cc.id,
+                 unnest(x.mitre_attack_techniques) AS v
+                 WHERE cc.keep_id = c.keep_id AND v IS NOT NULL ORDER BY v) AS mitre_attack_techniques,
+           ARRAY(SELECT DISTINCT v FROM threat_copies cc JOIN threats x ON x.id = cc.id,
+                 unnest(x.related_threat_actors) AS v
+                 WHERE cc.keep_id = c.keep_id AND v IS NOT NULL ORDER BY v) AS related_threat_actors
+    FROM threat_copies c
+    JOIN threats t ON t.id = c.id
+    GROUP BY c.keep_id;
+
+    UPDATE incidents i SET threat_id = c.keep_id
+    FROM threat_copies c
+    WHERE i.threat_id = c.id AND c.id <> c.keep_id;
+
+    DELETE FROM threats t
+    USING threat_copies c
+    WHERE t.id = c.id AND c.id <> c.keep_id;
+
+    -- The copies' ATT&CK pairs were counted in the rollups when they were inserted
+    IF EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'threats_mitre_rollup') THEN
+        ALTER TABLE threats DISABLE TRIGGER threats_mitre_rollup;
+    END IF;
+    UPDATE threats t SET
+        sighting_count = m.sighting_count,
+        first_seen = m.first_seen,
+        last_seen = m.last_seen,
+        severity = COALESCE(m.severity, t.severity),
+        sources = m.sources,
+        mitre_attack_tactics = m.mitre_attack_tactics,
+        mitre_attack_techniques = m.mitre_attack_techniques,
+        related_threat_actors = m.related_threat_actors
+    FROM threat_merged m
+    WHERE t.id = m.id;
+    IF EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'threats_mitre_rollup') THEN
+        ALTER TABLE threats ENABLE TRIGGER threats_mitre_rollup;
+    END IF;
+END $$;
+
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_individuals_user_id ON individuals(user_id);
 CREATE INDEX IF NOT EXISTS idx_individuals_organization_id ON individuals(organization_id);
 CREATE INDEX IF NOT EXISTS idx_transactions_individual_id ON transactions(individual_id);
 CREATE INDEX IF NOT EXISTS idx_transactions_organization_id ON transactions(organization_id);
 CREATE INDEX IF NOT EXISTS idx_threats_severity ON threats(severity);
+CREATE INDEX IF NOT EXISTS idx_threats_created_at ON threats(created_at);
 CREATE INDEX IF NOT EXISTS idx_threats_ioc_value ON threats(ioc_value);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_threats_ioc ON threats(ioc_type, ioc_value);
 CREATE INDEX IF NOT EXISTS idx_incidents_status ON incidents(status);
 CREATE INDEX IF NOT EXISTS idx_incidents_severity ON incidents(severity);
 CREATE INDEX IF NOT EXISTS idx_sanctions_entity_name ON sanctions_entries(entity_name);
@@ -239,6 +410,24 @@ CREATE INDEX IF NOT EXISTS idx_agents_type ON agents(agent_type);
 CREATE INDEX IF NOT EXISTS idx_agents_status ON agents(status);
 CREATE INDEX IF NOT EXISTS idx_chat_user_id ON chat_conversations(user_id);
 CREATE INDEX IF NOT EXISTS idx_chat_session_id ON chat_conversations(session_id);
+CREATE INDEX IF NOT EXISTS idx_log_events_ingestion_id ON log_events(ingestion_id);
+CREATE INDEX IF NOT EXISTS idx_log_events_ingestion_chunk ON log_events(ingestion_id, chunk_index);
+CREATE INDEX IF NOT EXISTS idx_data_ingestions_content_hash ON data_ingestions(content_hash, source_type);
+CREATE INDEX IF NOT EXISTS idx_log_events_source_ip ON log_events(source_ip);
+CREATE INDEX IF NOT EXISTS idx_log_events_user_name ON log_events(user_name);
+CREATE INDEX IF NOT EXISTS idx_extracted_indicators_value ON extracted_indicators(indicator_type, value);
+CREATE INDEX IF NOT EXISTS idx_incidents_individual_id ON incidents(individual_id);
+CREATE INDEX IF NOT EXISTS idx_incidents_organization_id ON incidents(organization_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_source_ip ON transactions(source_ip);
+CREATE INDEX IF NOT EXISTS idx_sanctions_entity_name_lower ON sanctions_entries(lower(entity_name));
+CREATE INDEX IF NOT EXISTS idx_ioc_enrichments_expires_at ON ioc_enrichments(expires_at);
+CREATE INDEX IF NOT EXISTS idx_risk_dirty_marked_at ON risk_dirty_entities(marked_at);
+CREATE INDEX IF NOT EXISTS idx_individuals_email ON individuals(email);
+CREATE INDEX IF NOT EXISTS idx_individuals_full_name_trgm ON individuals USING GIN (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_individuals_email_trgm ON individuals USING GIN (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_organizations_domain ON organizations(domain);
+CREATE INDEX IF NOT EXISTS idx_organizations_name_trgm ON organizations USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_sanctions_entity_name_trgm ON sanctions_entries USING GIN (entity_name gin_trgm_ops);
 
 -- Row Level Security (RLS) - Enable on all tables
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
@@ -255,3 +444,497 @@ CREATE POLICY "Users can view organizations" ON organizations FOR SELECT USING (
 CREATE POLICY "Users can view incidents" ON incidents FOR SELECT USING (true);
 CREATE POLICY "Users can view threats" ON threats FOR SELECT USING (true);
 CREATE POLICY "Users can view their own conversations" ON chat_conversations FOR SELECT USING (auth.uid() = user_id);
+
+-- Risk Scoring
+-- Writes that can change a score mark the affected entities dirty; recompute_risk_scores()
+-- then rescores only the dirty set with one aggregate UPDATE per entity type.
+CREATE OR REPLACE FUNCTION mark_risk_dirty(p_type TEXT, p_id UUID) RETURNS VOID AS $$
+BEGIN
+    IF p_id IS NOT NULL THEN
+        INSERT INTO risk_dirty_entities (entity_type, entity_id, marked_at)
+        VALUES (p_type, p_id, NOW())
+        ON CONFLICT (entity_type, entity_id) DO UPDATE SET marked_at = EXCLUDED.marked_at;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_incidents_risk_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM mark_risk_dirty('individual', NEW.individual_id);
+    PERFORM mark_risk_dirty('organization', NEW.organization_id);
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM mark_risk_dirty('individual', OLD.individual_id);
+        PERFORM mark_risk_dirty('organization', OLD.organization_id);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS incidents_risk_dirty ON incidents;
+CREATE TRIGGER incidents_risk_dirty
+    AFTER INSERT OR UPDATE OF severity, status, individual_id, organization_id ON incidents
+    FOR EACH ROW EXECUTE FUNCTION trg_incidents_risk_dirty();
+
+CREATE OR REPLACE FUNCTION trg_transactions_risk_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM mark_risk_dirty('transaction', NEW.id);
+    PERFORM mark_risk_dirty('individual', NEW.individual_id);
+    PERFORM mark_risk_dirty('organization', NEW.organization_id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS transactions_risk_dirty ON transactions;
+CREATE TRIGGER transactions_risk_dirty
+    AFTER INSERT OR UPDATE OF status, fraud_indicator, amount, source_ip, individual_id, organization_id ON transactions
+    FOR EACH ROW EXECUTE FUNCTION trg_transactions_risk_dirty();
+
+CREATE OR REPLACE FUNCTION trg_individuals_risk_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM mark_risk_dirty('individual', NEW.id);
+    PERFORM mark_risk_dirty('organization', NEW.organization_id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS individuals_risk_dirty ON individuals;
+CREATE TRIGGER individuals_risk_dirty
+    AFTER INSERT OR UPDATE OF anomaly_flags, full_name, organization_id ON individuals
+    FOR EACH ROW EXECUTE FUNCTION trg_individuals_risk_dirty();
+
+CREATE OR REPLACE FUNCTION trg_organizations_risk_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM mark_risk_dirty('organization', NEW.id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS organizations_risk_dirty ON organizations;
+CREATE TRIGGER organizations_risk_dirty
+    AFTER INSERT OR UPDATE OF name ON organizations
+    FOR EACH ROW EXECUTE FUNCTION trg_organizations_risk_dirty();
+
+CREATE OR REPLACE FUNCTION trg_sanctions_risk_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO risk_dirty_entities (entity_type, entity_id, marked_at)
+    SELECT 'individual', id, NOW() FROM individuals WHERE lower(full_name) = lower(NEW.entity_name)
+    UNION ALL
+    SELECT 'organization', id, NOW() FROM organizations WHERE lower(name) = lower(NEW.entity_name)
+    ON CONFLICT (entity_type, entity_id) DO UPDATE SET marked_at = EXCLUDED.marked_at;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sanctions_risk_dirty ON sanctions_entries;
+CREATE TRIGGER sanctions_risk_dirty
+    AFTER INSERT OR UPDATE OF entity_name ON sanctions_entries
+    FOR EACH ROW EXECUTE FUNCTION trg_sanctions_risk_dirty();
+
+CREATE OR REPLACE FUNCTION trg_threats_risk_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.ioc_type = 'ip' THEN
+        INSERT INTO risk_dirty_entities (entity_type, entity_id, marked_at)
+        SELECT 'transaction', id, NOW() FROM transactions WHERE source_ip = NEW.ioc_value
+        ON CONFLICT (entity_type, entity_id) DO UPDATE SET marked_at = EXCLUDED.marked_at;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS threats_risk_dirty ON threats;
+CREATE TRIGGER threats_risk_dirty
+    AFTER INSERT OR UPDATE OF ioc_type, ioc_value ON threats
+    FOR EACH ROW EXECUTE FUNCTION trg_threats_risk_dirty();
+
+CREATE OR REPLACE FUNCTION recompute_risk_scores(p_full BOOLEAN DEFAULT FALSE) RETURNS JSONB AS $$
+DECLARE
+    v_cutoff TIMESTAMP WITH TIME ZONE := NOW();
+    v_transactions INTEGER := 0;
+    v_individuals INTEGER := 0;
+    v_organizations INTEGER := 0;
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS _risk_batch (
+        entity_type TEXT NOT NULL,
+        entity_id UUID NOT NULL,
+        PRIMARY KEY (entity_type, entity_id)
+    ) ON COMMIT DROP;
+    TRUNCATE _risk_batch;
+
+    -- Claim the dirty set; marks written after the cutoff are left for the next run
+    WITH claimed AS (
+        DELETE FROM risk_dirty_entities WHERE marked_at <= v_cutoff
+        RETURNING entity_type, entity_id
+    )
+    INSERT INTO _risk_batch SELECT entity_type, entity_id FROM claimed
+    ON CONFLICT DO NOTHING;
+
+    IF p_full THEN
+        INSERT INTO _risk_batch
+        SELECT 'transaction', id FROM transactions
+        UNION ALL SELECT 'individual', id FROM individuals
+        UNION ALL SELECT 'organization', id FROM organizations
+        ON CONFLICT DO NOTHING;
+    END IF;
+
+    -- Transactions
+    UPDATE transactions t
+    SET risk_score = LEAST(100,
+          CASE WHEN t.fraud_indicator THEN 50 ELSE 0 END
+        + CASE t.status WHEN 'blocked' THEN 40 WHEN 'flagged' THEN 30 ELSE 0 END
+        + CASE WHEN EXISTS (
+              SELECT 1 FROM threats th WHERE th.ioc_type = 'ip' AND th.ioc_value = t.source_ip
+          ) THEN 30 ELSE 0 END
+        + CASE WHEN t.amount >= 10000 THEN 10 WHEN t.amount >= 1000 THEN 5 ELSE 0 END)
+    FROM _risk_batch b
+    WHERE b.entity_type = 'transaction' AND b.entity_id = t.id;
+    GET DIAGNOSTICS v_transactions = ROW_COUNT;
+
+    -- Individuals
+    WITH targets AS (
+        SELECT entity_id AS id FROM _risk_batch WHERE entity_type = 'individual'
+    ),
+    incident_agg AS (
+        SELECT i.individual_id AS id,
+               COUNT(*) AS incident_count,
+               SUM(CASE i.severity WHEN 'critical' THEN 40 WHEN 'high' THEN 25 WHEN 'medium' THEN 10 ELSE 5 END
+                   * CASE WHEN i.status IN ('resolved', 'closed') THEN 0.25 ELSE 1 END) AS incident_score
+        FROM incidents i JOIN targets tg ON tg.id = i.individual_id
+        GROUP BY i.individual_id
+    ),
+    transaction_agg AS (
+        SELECT tx.individual_id AS id, COUNT(*) AS flagged_transactions
+        FROM transactions tx JOIN targets tg ON tg.id = tx.individual_id
+        WHERE tx.fraud_indicator OR tx.status IN ('flagged', 'blocked')
+        GROUP BY tx.individual_id
+    ),
+    sanctions_agg AS (
+        SELECT ind.id, COUNT(*) AS sanctions_hits
+        FROM individuals ind
+        JOIN targets tg ON tg.id = ind.id
+        JOIN sanctions_entries s ON lower(s.entity_name) = lower(ind.full_name)
+        GROUP BY ind.id
+    ),
+    scored AS (
+        SELECT ind.id,
+               COALESCE(ia.incident_count, 0) AS incident_count,
+               COALESCE(ia.incident_score, 0) AS incident_score,
+               CASE jsonb_typeof(ind.anomaly_flags)
+                   WHEN 'array' THEN jsonb_array_length(ind.anomaly_flags)
+                   WHEN 'object' THEN (SELECT COUNT(*) FROM jsonb_object_keys(ind.anomaly_flags))
+                   ELSE 0
+               END AS anomaly_count,
+               COALESCE(ta.flagged_transactions, 0) AS flagged_transactions,
+               COALESCE(sa.sanctions_hits, 0) AS sanctions_hits
+        FROM individuals ind
+        JOIN targets tg ON tg.id = ind.id
+        LEFT JOIN incident_agg ia ON ia.id = ind.id
+        LEFT JOIN transaction_agg ta ON ta.id = ind.id
+        LEFT JOIN sanctions_agg sa ON sa.id = ind.id
+    )
+    UPDATE individuals ind
+    SET risk_score = LEAST(100,
+            LEAST(s.incident_score, 50)
+          + LEAST(s.anomaly_count * 5, 25)
+          + LEAST(s.flagged_transactions * 10, 30)
+          + CASE WHEN s.sanctions_hits > 0 THEN 50 ELSE 0 END),
+        risk_factors = jsonb_build_object(
+            'incidents', s.incident_count,
+            'anomaly_flags', s.anomaly_count,
+            'flagged_transactions', s.flagged_transactions,
+            'sanctions_hits', s.sanctions_hits),
+        risk_scored_at = NOW()
+    FROM scored s
+    WHERE ind.id = s.id;
+    GET DIAGNOSTICS v_individuals = ROW_COUNT;
+
+    -- An individual's score feeds its organization's score
+    INSERT INTO _risk_batch
+    SELECT DISTINCT 'organization', ind.organization_id
+    FROM individuals ind
+    JOIN _risk_batch b ON b.entity_type = 'individual' AND b.entity_id = ind.id
+    WHERE ind.organization_id IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    -- Organizations
+    WITH targets AS (
+        SELECT entity_id AS id FROM _risk_batch WHERE entity_type = 'organization'
+    ),
+    incident_agg AS (
+        SELECT i.organization_id AS id,
+               COUNT(*) AS incident_count,
+               SUM(CASE i.severity WHEN 'critical' THEN 40 WHEN 'high' THEN 25 WHEN 'medium' THEN 10 ELSE 5 END
+                   * CASE WHEN i.status IN ('resolved', 'closed') THEN 0.25 ELSE 1 END) AS incident_score
+        FROM incidents i JOIN targets tg ON tg.id = i.organization_id
+        GROUP BY i.organization_id
+    ),
+    transaction_agg AS (
+        SELECT tx.organization_id AS id, COUNT(*) AS flagged_transactions
+        FROM transactions tx JOIN targets tg ON tg.id = tx.organization_id
+        WHERE tx.fraud_indicator OR tx.status IN ('flagged', 'blocked')
+        GROUP BY tx.organization_id
+    ),
+    member_agg AS (
+        SELECT ind.organization_id AS id,
+               AVG(ind.risk_score) AS avg_member_risk,
+               COUNT(*) FILTER (WHERE ind.risk_score >= 75) AS high_risk_members
+        FROM individuals ind JOIN targets tg ON tg.id = ind.organization_id
+        GROUP BY ind.organization_id
+    ),
+    sanctions_agg AS (
+        SELECT o.id, COUNT(*) AS sanctions_hits
+        FROM organizations o
+        JOIN targets tg ON tg.id = o.id
+        JOIN sanctions_entries s ON lower(s.entity_name) = lower(o.name)
+        GROUP BY o.id
+    ),
+    scored AS (
+        SELECT o.id,
+               COALESCE(ia.incident_count, 0) AS incident_count,
+               COALESCE(ia.incident_score, 0) AS incident_score,
+               COALESCE(ta.flagged_transactions, 0) AS flagged_transactions,
+               COALESCE(ma.avg_member_risk, 0) AS avg_member_risk,
+               COALESCE(ma.high_risk_members, 0) AS high_risk_members,
+               COALESCE(sa.sanctions_hits, 0) AS sanctions_hits
+        FROM organizations o
+        JOIN targets tg ON tg.id = o.id
+        LEFT JOIN incident_agg ia ON ia.id = o.id
+        LEFT JOIN transaction_agg ta ON ta.id = o.id
+        LEFT JOIN member_agg ma ON ma.id = o.id
+        LEFT JOIN sanctions_agg sa ON sa.id = o.id
+    )
+    UPDATE organizations o
+    SET risk_score = LEAST(100,
+            LEAST(s.incident_score, 50)
+          + LEAST(s.flagged_transactions * 5, 30)
+          + s.avg_member_risk * 0.3
+          + CASE WHEN s.sanctions_hits > 0 THEN 50 ELSE 0 END),
+        risk_factors = jsonb_build_object(
+            'incidents', s.incident_count,
+            'flagged_transactions', s.flagged_transactions,
+            'avg_member_risk', ROUND(s.avg_member_risk, 2),
+            'high_risk_members', s.high_risk_members,
+            'sanctions_hits', s.sanctions_hits),
+        risk_scored_at = NOW()
+    FROM scored s
+    WHERE o.id = s.id;
+    GET DIAGNOSTICS v_organizations = ROW_COUNT;
+
+    RETURN jsonb_build_object(
+        'transactions', v_transactions,
+        'individuals', v_individuals,
+        'organizations', v_organizations
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Threat Sightings
+-- Merge a batch of sightings (already grouped by ioc_type/ioc_value) into one row per IOC
+CREATE OR REPLACE FUNCTION _severity_rank(p_severity TEXT) RETURNS INTEGER AS $$
+    SELECT COALESCE(array_position(ARRAY['info', 'low', 'medium', 'high', 'critical'], p_severity), 0);
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION _array_union(a TEXT[], b TEXT[]) RETURNS TEXT[] AS $$
+    SELECT ARRAY(SELECT DISTINCT v FROM unnest(COALESCE(a, '{}') || COALESCE(b, '{}')) AS v WHERE v IS NOT NULL ORDER BY v);
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION merge_threat_sightings(p_sightings JSONB)
+RETURNS TABLE (id UUID, threat_id TEXT, ioc_type TEXT, ioc_value TEXT, inserted BOOLEAN) AS $$
+    INSERT INTO threats AS t (
+        threat_id, title, description, severity, threat_type, source, ioc_type, ioc_value,
+        mitre_attack_tactics, mitre_attack_techniques, related_threat_actors, metadata,
+        sighting_count, sources, first_seen, last_seen
+    )
+    SELECT s.threat_id, s.title, s.description, COALESCE(s.severity, 'medium'), s.threat_type, s.source,
+           s.ioc_type, s.ioc_value, s.mitre_attack_tactics, s.mitre_attack_techniques, s.related_threat_actors,
+           s.metadata, COALESCE(s.sighting_count, 1), s.sources,
+           COALESCE(s.first_seen, NOW()), COALESCE(s.last_seen, s.first_seen, NOW())
+    FROM jsonb_to_recordset(p_sightings) AS s(
+        threat_id TEXT, title TEXT, description TEXT, severity TEXT, threat_type TEXT, source TEXT,
+        ioc_type TEXT, ioc_value TEXT, mitre_attack_tactics TEXT[], mitre_attack_techniques TEXT[],
+        related_threat_actors TEXT[], metadata JSONB, sighting_count INTEGER, sources TEXT[],
+        first_seen TIMESTAMP WITH TIME ZONE, last_seen TIMESTAMP WITH TIME ZONE
+    )
+    ON CONFLICT (ioc_type, ioc_value) DO UPDATE SET
+        first_seen = LEAST(t.first_seen, EXCLUDED.first_seen),
+        last_seen = GREATEST(t.last_seen, EXCLUDED.last_seen),
+        sighting_count = COALESCE(t.sighting_count, 0) + EXCLUDED.sighting_count,
+        sources = _array_union(t.sources, EXCLUDED.sources),
+        mitre_attack_tactics = _array_union(t.mitre_attack_tactics, EXCLUDED.mitre_attack_tactics),
+        mitre_attack_techniques = _array_union(t.mitre_attack_techniques, EXCLUDED.mitre_attack_techniques),
+        related_threat_actors = _array_union(t.related_threat_actors, EXCLUDED.related_threat_actors),
+        severity = CASE WHEN _severity_rank(EXCLUDED.severity) > _severity_rank(t.severity)
+                        THEN EXCLUDED.severity ELSE t.severity END,
+        description = COALESCE(t.description, EXCLUDED.description),
+        metadata = COALESCE(t.metadata, '{}'::jsonb) || COALESCE(EXCLUDED.metadata, '{}'::jsonb)
+    RETURNING t.id, t.threat_id, t.ioc_type, t.ioc_value, (t.xmax = 0) AS inserted;
+$$ LANGUAGE sql;
+
+-- MITRE ATT&CK Heatmap Rollups
+-- analytics rows with metric_type 'mitre_attack' hold one counter per (tactic|technique, day);
+-- cumulative_value is the running total up to that day, so any window is end minus start.
+-- One 'mitre_attack_total' row per cell (timestamp = epoch) lists the cells.
+CREATE OR REPLACE FUNCTION _mitre_pairs(p_tactics TEXT[], p_techniques TEXT[])
+RETURNS TABLE (tactic TEXT, technique TEXT) AS $$
+    SELECT ta, te
+    FROM unnest(CASE WHEN cardinality(p_tactics) > 0 THEN p_tactics ELSE ARRAY[''] END) AS ta,
+         unnest(CASE WHEN cardinality(p_techniques) > 0 THEN p_techniques ELSE ARRAY[''] END) AS te
+    WHERE ta <> '' OR te <> '';
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION increment_mitre_rollup(p_tactic TEXT, p_technique TEXT, p_day TIMESTAMP WITH TIME ZONE, p_count INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    v_name TEXT := p_tactic || '|' || p_technique;
+    v_previous NUMERIC;
+BEGIN
+    SELECT a.cumulative_value INTO v_previous
+    FROM analytics a
+    WHERE a.metric_type = 'mitre_attack' AND a.metric_name = v_name AND a."timestamp" < p_day
+    ORDER BY a."timestamp" DESC
+    LIMIT 1;
+
+    INSERT INTO analytics (metric_type, metric_name, value, cumulative_value, metadata, "timestamp")
+    VALUES ('mitre_attack', v_name, p_count, COALESCE(v_previous, 0) + p_count,
+            jsonb_build_object('tactic', p_tactic, 'technique', p_technique), p_day)
+    ON CONFLICT (metric_type, metric_name, "timestamp") DO UPDATE SET
+        value = analytics.value + EXCLUDED.value,
+        cumulative_value = analytics.cumulative_value + EXCLUDED.value;
+
+    -- Late writes shift the running totals of later days (normally there are none)
+    UPDATE analytics a
+    SET cumulative_value = a.cumulative_value + p_count
+    WHERE a.metric_type = 'mitre_attack' AND a.metric_name = v_name AND a."timestamp" > p_day;
+
+    INSERT INTO analytics (metric_type, metric_name, value, cumulative_value, metadata, "timestamp")
+    VALUES ('mitre_attack_total', v_name, p_count, p_count,
+            jsonb_build_object('tactic', p_tactic, 'technique', p_technique), 'epoch')
+    ON CONFLICT (metric_type, metric_name, "timestamp") DO UPDATE SET
+        value = analytics.value + EXCLUDED.value,
+        cumulative_value = analytics.cumulative_value + EXCLUDED.value;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_threats_mitre_rollup() RETURNS TRIGGER AS $$
+DECLARE
+    v_day TIMESTAMP WITH TIME ZONE := date_trunc('day', COALESCE(NEW.created_at, NOW()) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    r RECORD;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        FOR r IN SELECT * FROM _mitre_pairs(NEW.mitre_attack_tactics, NEW.mitre_attack_techniques) LOOP
+            PERFORM increment_mitre_rollup(r.tactic, r.technique, v_day, 1);
+        END LOOP;
+    ELSE
+        -- Pairs added by a later sighting count on the day they were added
+        v_day := date_trunc('day', NOW() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+        FOR r IN
+            SELECT * FROM _mitre_pairs(NEW.mitre_attack_tactics, NEW.mitre_attack_techniques)
+            EXCEPT
+            SELECT * FROM _mitre_pairs(OLD.mitre_attack_tactics, OLD.mitre_attack_techniques)
+        LOOP
+            PERFORM increment_mitre_rollup(r.tactic, r.technique, v_day, 1);
+        END LOOP;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS threats_mitre_rollup ON threats;
+CREATE TRIGGER threats_mitre_rollup
+    AFTER INSERT OR UPDATE OF mitre_attack_tactics, mitre_attack_techniques ON threats
+    FOR EACH ROW EXECUTE FUNCTION trg_threats_mitre_rollup();
+
+-- Rebuild every rollup from the threats table (initial backfill or repair)
+CREATE OR REPLACE FUNCTION rebuild_mitre_rollups() RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    DELETE FROM analytics WHERE metric_type IN ('mitre_attack', 'mitre_attack_total');
+
+    INSERT INTO analytics (metric_type, metric_name, value, cumulative_value, metadata, "timestamp")
+    SELECT 'mitre_attack', d.tactic || '|' || d.technique, d.n,
+           SUM(d.n) OVER (PARTITION BY d.tactic, d.technique ORDER BY d.day),
+           jsonb_build_object('tactic', d.tactic, 'technique', d.technique), d.day
+    FROM (
+        SELECT p.tactic, p.technique,
+               date_trunc('day', t.created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS day,
+               COUNT(*) AS n
+        FROM threats t
+        CROSS JOIN LATERAL _mitre_pairs(t.mitre_attack_tactics, t.mitre_attack_techniques) p
+        GROUP BY 1, 2, 3
+    ) d;
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+
+    INSERT INTO analytics (metric_type, metric_name, value, cumulative_value, metadata, "timestamp")
+    SELECT 'mitre_attack_total', metric_name, SUM(value), SUM(value), MIN(metadata::text)::jsonb, 'epoch'
+    FROM analytics
+    WHERE metric_type = 'mitre_attack'
+    GROUP BY metric_name;
+
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill threats that predate the rollup trigger; once rollups exist the trigger keeps them current
+SELECT rebuild_mitre_rollups()
+WHERE NOT EXISTS (SELECT 1 FROM analytics WHERE metric_type = 'mitre_attack_total');
+
+-- Counts per cell for days in [p_start, p_end]: two index probes per cell regardless of window length
+CREATE OR REPLACE FUNCTION mitre_heatmap(p_start TIMESTAMP WITH TIME ZONE, p_end TIMESTAMP WITH TIME ZONE)
+RETURNS TABLE (tactic TEXT, technique TEXT, count NUMERIC) AS $$
+    SELECT cell.metadata->>'tactic',
+           cell.metadata->>'technique',
+           COALESCE(upto_end.cumulative_value, 0) - COALESCE(before_start.cumulative_value, 0)
+    FROM analytics cell
+    LEFT JOIN LATERAL (
+        SELECT a.cumulative_value FROM analytics a
+        WHERE a.metric_type = 'mitre_attack' AND a.metric_name = cell.metric_name AND a."timestamp" <= p_end
+        ORDER BY a."timestamp" DESC LIMIT 1
+    ) upto_end ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT a.cumulative_value FROM analytics a
+        WHERE a.metric_type = 'mitre_attack' AND a.metric_name = cell.metric_name AND a."timestamp" < p_start
+        ORDER BY a."timestamp" DESC LIMIT 1
+    ) before_start ON TRUE
+    WHERE cell.metric_type = 'mitre_attack_total';
+$$ LANGUAGE sql STABLE;
+
+-- Keep soar_playbooks.updated_at current so the playbook trigger cache can detect edits
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS soar_playbooks_touch_updated_at ON soar_playbooks;
+CREATE TRIGGER soar_playbooks_touch_updated_at
+    BEFORE UPDATE ON soar_playbooks
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_soar_playbooks_updated_at ON soar_playbooks(updated_at);
+
+-- The event stream follows transactions by flagged_at, so a transaction is pushed when it becomes
+-- flagged (at insert or later) and not again on later writes; clearing the flag clears flagged_at
+CREATE OR REPLACE FUNCTION trg_transactions_flagged_at() RETURNS TRIGGER AS $$
+BEGIN
+    IF NOT (COALESCE(NEW.fraud_indicator, FALSE) OR NEW.status IS NOT DISTINCT FROM 'flagged') THEN
+        NEW.flagged_at := NULL;
+    ELSIF TG_OP = 'INSERT' OR NOT (COALESCE(OLD.fraud_indicator, FALSE) OR OLD.status IS NOT DISTINCT FROM 'flagged') THEN
+        NEW.flagged_at := NOW();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS transactions_flagged_at ON transactions;
+CREATE TRIGGER transactions_flagged_at
+    BEFORE INSERT OR UPDATE OF fraud_indicator, status ON transactions
+    FOR EACH ROW EXECUTE FUNCTION trg_transactions_flagged_at();
+
+CREATE INDEX IF NOT EXISTS idx_transactions_flagged_at_id ON transactions(flagged_at, id);
+
+-- Keyset pagination for list endpoints: (sort column, id)
+CREATE INDEX IF NOT EXISTS idx_threats_created_at_id ON threats(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_threats_last_seen_id ON threats(last_seen, id);
+CREATE INDEX IF NOT EXISTS idx_incidents_created_at_id ON incidents(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_incidents_updated_at_id ON incidents(updated_at, id);